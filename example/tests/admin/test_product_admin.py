@@ -4,13 +4,14 @@ from __future__ import absolute_import, unicode_literals
 import json
 
 from django.contrib.admin.sites import AdminSite
+from django.core.paginator import Paginator
 from django.core.urlresolvers import reverse
 from django.template.loader import render_to_string
 from django.utils.formats import date_format
 from django.utils.http import urlencode
 from shop.money import Money
 
-from shopit.admin.product import AttributeAdmin, ProductAdmin
+from shopit.admin.product import AttributeAdmin, CombinationList, ProductAdmin
 from shopit.models.product import Attribute, AttributeChoice, Product
 
 from ..utils import ShopitTestCase
@@ -122,9 +123,22 @@ class ProductAdminTest(ShopitTestCase):
         rendered = render_to_string('admin/shopit/product_variants_field.html', {
             'product': self.iphone7,
             'variant': self.iphone7_black,
+            'combinations': Paginator(CombinationList(self.iphone7), self.admin.variants_per_page).page(1),
+            'page_var': 'variants_page',
         })
         self.assertEquals(self.admin.get_variants_field(self.iphone7_black), rendered)
 
+    def test_get_variants_field_paginated(self):
+        self.create_products_with_variants()
+        self.admin.variants_per_page = 2
+        self.iphone7._variants_page = '2'
+        rendered = self.admin.get_variants_field(self.iphone7)
+        self.assertIn(reverse('admin:shopit_product_create_variant', args=[self.iphone7.pk, 2]), rendered)
+        self.assertNotIn('iPhone 7 Black', rendered)
+        self.assertIn('?variants_page=1#variants', rendered)
+        self.iphone7._variants_page = 'invalid'
+        self.assertIn('iPhone 7 Black', self.admin.get_variants_field(self.iphone7))
+
     def test_add_variant(self):
         self.create_products_with_variants()
         self.admin_login()
@@ -4,6 +4,7 @@ from __future__ import absolute_import, unicode_literals
 from filer.models.imagemodels import Image
 
 from shopit.models.categorization import Category
+from shopit.models.product import Product
 
 from ..utils import ShopitTestCase
 
@@ -24,9 +25,10 @@ class CategorizationModelTest(ShopitTestCase):
         self.tax = self.create_tax('PDV', percent=25)
 
         # Categories
-        self.dummy_image = Image(original_filename='dummy.jpg')
+        self.dummy_image = Image.objects.create(original_filename='dummy.jpg')
         self.phones = self.create_categorization('category', 'Phones', tax=self.tax)
         self.phones.featured_image = self.dummy_image
+        self.phones.save()
         self.phones.modifiers.add(self.phones_discount)
         self.phones.flags.add(self.f1)
         self.phones_mobile = self.create_categorization('category', 'Mobile', parent=self.phones)
@@ -55,14 +57,63 @@ class CategorizationModelTest(ShopitTestCase):
         self.assertEquals(self.phones.get_path(), self.phones.slug)
         self.assertEquals(self.phones_mobile.get_path(), '/'.join([self.phones.slug, self.phones_mobile.slug]))
 
+    def test_update_paths(self):
+        self.phones.slug = 'telephones'
+        self.phones.save()
+        self.assertEquals(self.phones.get_path(), 'telephones')
+        self.assertEquals(Category.objects.get(pk=self.phones_mobile.pk).get_path(), 'telephones/mobile')
+        self.phones_mobile.move_to(None)
+        self.assertEquals(Category.objects.get(pk=self.phones_mobile.pk).get_path(), 'mobile')
+        self.assertEquals(Category.objects.translated(path='mobile').get(), self.phones_mobile)
+
+    def test_update_paths_on_translation_delete(self):
+        for obj, slug in [(self.phones, 'telefoni'), (self.phones_mobile, 'mobilni')]:
+            obj.set_current_language('hr')
+            obj.name, obj.slug = slug.capitalize(), slug
+            obj.save()
+        mobile = Category.objects.language('hr').get(pk=self.phones_mobile.pk)
+        self.assertEquals(mobile.get_path(), 'telefoni/mobilni')
+        Category.objects.get(pk=self.phones.pk).delete_translation('hr')
+        mobile = Category.objects.language('hr').get(pk=self.phones_mobile.pk)
+        self.assertEquals(mobile.get_path(), 'phones/mobilni')
+
     def test_featured_image(self):
         self.assertEquals(self.phones.featured_image, self.dummy_image)
         self.assertEquals(self.phones_mobile.featured_image, self.dummy_image)
 
+    def test_featured_image_deleted(self):
+        image = Image.objects.create(original_filename='mobile.jpg')
+        self.phones_mobile.featured_image = image
+        self.phones_mobile.save()
+        child = self.create_categorization('category', 'Child', parent=self.phones_mobile)
+        self.assertEquals(Category.objects.get(pk=child.pk).featured_image, image)
+        image.delete()
+        self.assertEquals(Category.objects.get(pk=child.pk).featured_image, self.dummy_image)
+        self.assertEquals(Category.objects.get(pk=self.phones_mobile.pk).featured_image, self.dummy_image)
+
+    def test_update_effective_fields(self):
+        self.assertEquals(Category.objects.get(pk=self.phones_mobile.pk).tax, self.tax)
+        tax = self.create_tax('Other', percent=10)
+        self.phones.tax = tax
+        self.phones.save()
+        phones_mobile = Category.objects.get(pk=self.phones_mobile.pk)
+        self.assertEquals(phones_mobile.effective_tax, tax)
+        phones_mobile.move_to(None)
+        phones_mobile = Category.objects.get(pk=self.phones_mobile.pk)
+        self.assertEquals(phones_mobile.tax, None)
+        self.assertEquals(phones_mobile.featured_image, None)
+        tax.delete()
+        self.assertEquals(Category.objects.get(pk=self.phones.pk).tax, None)
+
     def test_get_products(self):
         self.assertEquals(self.phones.get_products().count(), 2)
         self.assertEquals(self.phones_mobile.get_products().count(), 1)
         self.assertEquals(self.phones_mobile.get_products()[0], self.p2)
+        self.assertEquals(self.apple.get_products().count(), 0)
+
+    def test_in_subtree(self):
+        self.assertEquals(set(Product.objects.in_subtree(self.phones)), set([self.p1, self.p2]))
+        self.assertEquals(list(Product.objects.in_subtree(self.phones_mobile)), [self.p2])
 
     def test_get_modifiers(self):
         self.assertEquals(self.phones.get_modifiers().count(), 1)
@@ -78,3 +129,15 @@ class CategorizationModelTest(ShopitTestCase):
         self.assertEquals(self.phones.tax, self.tax)
         self.assertEquals(self.phones_mobile.tax, self.tax)
         self.assertIsNone(self.inactive_category.tax)
+
+    def test_tax_changed(self):
+        self.create_product('P3', unit_price=100, category=self.phones_mobile)
+        product = Product.objects.get(code='p3')
+        self.assertEquals(product.effective_price, 125)
+        phones = Category.objects.get(pk=self.phones.pk)
+        phones.save()
+        self.assertFalse(phones._prices_changed)
+        phones.tax = self.create_tax('Reduced', percent=10)
+        phones.save()
+        self.assertTrue(phones._prices_changed)
+        self.assertEquals(Product.objects.get(pk=product.pk).effective_price, 110)
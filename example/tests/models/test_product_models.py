@@ -2,15 +2,22 @@
 from __future__ import absolute_import, unicode_literals
 
 from datetime import datetime
+from decimal import Decimal
 
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.test import override_settings
+from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 from django.utils.timezone import make_aware
 
-from shopit.models.cart import CartItem
+from shopit.models.cart import Cart, CartItem
 from shopit.models.categorization import Brand, Category, Manufacturer
-from shopit.models.product import Attachment, AttributeChoice, AttributeValue, Product, Review
+from shopit.models.product import (Attachment, AttributeChoice, AttributeSignature, AttributeValue, EffectiveFlag,
+                                   EffectiveModifier, Product, ProductOrderLock, Review, StockReservation,
+                                   get_timestamp)
 from shopit.models.tax import Tax
+from shopit.variants import VARIANT_INDEX_KEY
 
 from ..utils import ShopitTestCase
 
@@ -83,6 +90,21 @@ class ProductModelTest(ShopitTestCase):
         test.save()
         self.assertEquals(test.get_variants()[0].order, test.order)
 
+    def test_allocate_order(self):
+        published = make_aware(parse_datetime('2016-01-01 00:00:00'))
+        first = self.create_product('First', published=published)
+        second = self.create_product('Second', published=published)
+        self.assertEquals(second.order, first.order + 1)
+        self.assertEquals(Product.objects.allocate_order(published), first.order + 2)
+        self.assertEquals(first.order, get_timestamp(published) * 1000)
+        self.assertEquals(get_timestamp(published.astimezone(timezone.get_fixed_timezone(120))),
+                          get_timestamp(published))
+        self.assertTrue(ProductOrderLock.objects.filter(pk=ProductOrderLock.PK).exists())
+        # Order is kept when published hasn't changed.
+        first = Product.objects.get(pk=first.pk)
+        first.save()
+        self.assertEquals(Product.objects.get(pk=first.pk).order, second.order - 1)
+
     def test_product_name(self):
         self.assertEquals(self.iphone7.product_name, 'iPhone 7')
 
@@ -158,6 +180,15 @@ class ProductModelTest(ShopitTestCase):
     def test_get_price(self):
         self.assertEquals(self.iphone7_black.get_price(), 840)
 
+    def test_effective_price(self):
+        self.assertEquals(Product.objects.get(pk=self.iphone7.pk).effective_price, 840)
+        self.assertEquals(Product.objects.get(pk=self.iphone7_white.pk).effective_price, 798)
+        self.tax.percent = 10
+        self.tax.save()
+        self.assertEquals(Product.objects.get(pk=self.iphone7_black.pk).effective_price, 770)
+        case = self.create_product('Case', unit_price='10', discount='12.5')
+        self.assertEquals(Product.objects.get(pk=case.pk).effective_price, Decimal('8.75'))
+
     def test_get_availability(self):
         self.assertEquals(self.iphone7.get_availability(), [(0, datetime.max)])
         self.assertEquals(self.iphone7_black.get_availability(), [(3, datetime.max)])
@@ -169,15 +200,64 @@ class ProductModelTest(ShopitTestCase):
         # 1 iPhone 7 Black is in cart.
         self.assertEquals(self.iphone7_black.is_available(2, self.request), (True, 0))
 
+    def test_reserve(self):
+        other_cart = Cart.objects.create(customer=self.create_customer('other'))
+        StockReservation.objects.hold(self.iphone7_black, other_cart, 2)
+        self.assertEquals(self.iphone7_black.is_available(2), (False, -1))
+        self.assertEquals(self.iphone7_black.reserve(2, self.request), (False, -1))
+        self.assertEquals(self.iphone7_black.reserve(1, self.request), (True, 0))
+        self.assertEquals(StockReservation.objects.get_reserved([self.iphone7_black.pk]), {self.iphone7_black.pk: 3})
+        StockReservation.objects.filter(cart=other_cart).update(expires_at=timezone.now())
+        self.assertEquals(self.iphone7_black.reserve(3, self.request), (True, 0))
+        self.assertEquals(StockReservation.objects.expired().count(), 1)
+        CartItem.objects.filter(cart=self.cart).delete()
+        self.assertFalse(StockReservation.objects.filter(cart=self.cart).exists())
+
+    def test_decrement_quantity(self):
+        self.assertTrue(self.iphone7_black.decrement_quantity(3))
+        self.assertFalse(self.iphone7_black.decrement_quantity(1))
+        self.assertEquals(Product.objects.get(pk=self.iphone7_black.pk).quantity, 0)
+        self.assertTrue(self.book.decrement_quantity(100))
+
     def test_get_modifiers(self):
         self.assertEquals(len(self.iphone7.get_modifiers()), 0)
         self.assertEquals(len(self.iphone7_black.get_modifiers()), 1)
 
+    def test_effective_modifiers(self):
+        category_discount = self.create_modifier('Category Discount', percent=-10)
+        child = self.create_categorization('category', 'Smartphones', parent=self.iphone7.category)
+        child.modifiers.add(category_discount)
+        self.iphone7.category = child
+        self.iphone7.save()
+        self.assertEquals(set(EffectiveModifier.objects.get_modifiers([self.iphone7_black.pk])[self.iphone7_black.pk]),
+                          set([self.black_discount, category_discount]))
+        parent_discount = self.create_modifier('Parent Discount', percent=-5)
+        Category.objects.get(pk=child.parent_id).modifiers.add(parent_discount)
+        self.assertEquals(set(Product.objects.get(pk=self.iphone7.pk).get_modifiers()),
+                          set([category_discount, parent_discount]))
+        parent_discount.active = False
+        parent_discount.save()
+        self.assertEquals(list(Product.objects.get(pk=self.iphone7.pk).get_modifiers()), [category_discount])
+
     def test_get_flags(self):
         iphone7_flags = self.iphone7.get_flags()
         self.assertEquals(len(iphone7_flags), 1)
         self.assertEquals(list(self.iphone7_black.get_flags()), list(iphone7_flags))
 
+    def test_effective_flags(self):
+        sale = self.create_flag('Sale')
+        summer = self.create_flag('Summer', parent=sale)
+        self.iphone7.category.flags.add(summer)
+        iphone7_black = Product.objects.get(pk=self.iphone7_black.pk)
+        self.assertEquals(list(iphone7_black.get_flags()), [self.featured_flag, summer])
+        variants = [self.iphone7_black, self.iphone7_white, self.iphone7_invalid]
+        self.assertEquals(set(Product.objects.filter_flags(['sale'])), set([self.iphone7] + variants))
+        self.assertEquals(list(Product.objects.filter_flags(['sale', 'featured']).top_level()), [self.iphone7])
+        flags = EffectiveFlag.objects.get_flags([self.iphone7.pk])[self.iphone7.pk]
+        self.assertEquals([x._path for x in flags], ['featured', 'sale/summer'])
+        summer.move_to(None)
+        self.assertEquals(Product.objects.filter_flags(['sale']).count(), 0)
+
     def test_get_available_attributes(self):
         self.assertEquals(len(self.iphone7.get_available_attributes()), 1)
 
@@ -200,6 +280,30 @@ class ProductModelTest(ShopitTestCase):
     def test_get_combinations(self):
         self.assertEquals([x['name'] for x in self.iphone7.get_combinations()], ['iPhone 7 Black', 'iPhone 7 White'])
 
+    def test_iter_combinations(self):
+        self.assertEquals(self.iphone7.get_combinations_count(), 2)
+        combinations = list(self.iphone7.iter_combinations(1, 5))
+        self.assertEquals([(x['index'], x['pk']) for x in combinations], [(1, self.iphone7_white.pk)])
+        self.assertEquals(self.iphone7.get_combination(0)['pk'], self.iphone7_black.pk)
+        with self.assertRaises(IndexError):
+            self.iphone7.get_combination(2)
+
+    def test_create_all_variants(self):
+        size = self.create_attribute('Size', ['S', 'M', 'L'])
+        shirt = self.create_product('Shirt', Product.GROUP, 100, tax=self.tax)
+        shirt.available_attributes.add(size, self.color)
+        slug = shirt.get_combination(0)['slug']
+        self.create_product('Shirt Copy', slug=slug)
+        variants = shirt.create_all_variants(language='en')
+        self.assertEquals(len(variants), 6)
+        self.assertEquals(shirt.get_variants().count(), 6)
+        self.assertEquals(shirt.get_combination(0)['slug'], '%s-1' % slug)
+        self.assertEquals(set(Decimal(x.effective_price) for x in variants), set([Decimal(120)]))
+        self.assertEquals(AttributeSignature.objects.filter(group=shirt).count(), 12)
+        self.assertEquals(len(shirt.create_all_variants(language='en')), 0)
+        self.assertEquals(len(shirt.create_all_variants(language='de')), 6)
+        self.assertEquals(shirt.get_variants().count(), 6)
+
     def test_get_attachments(self):
         iphone7_attachments = self.iphone7.get_attachments()
         self.assertEquals(len(iphone7_attachments['images']), 2)
@@ -225,6 +329,26 @@ class ProductModelTest(ShopitTestCase):
     def test_filter_variants(self):
         self.assertEquals(self.iphone7.filter_variants({'color': 'black'}), [self.iphone7_black])
 
+    def test_get_variant_index(self):
+        self.run_commit_hooks()
+        index = self.iphone7.get_variant_index()
+        self.assertEquals(index.get({'color': 'white'}), self.iphone7_white.pk)
+        self.assertEquals(index.invalid, [self.iphone7_invalid.pk])
+        self.assertEquals(index.valid, set([self.iphone7_black.pk, self.iphone7_white.pk]))
+        iphone7 = Product.objects.get(pk=self.iphone7.pk)
+        with self.assertNumQueries(1):
+            # Only available attributes are loaded, index is cached.
+            self.assertEquals(iphone7.get_variant_index().valid, index.valid)
+        AttributeValue.objects.filter(product=self.iphone7_white).delete()
+        # Changed index is built without the cache until the transaction is committed.
+        index = Product.objects.get(pk=self.iphone7.pk).get_variant_index()
+        self.assertEquals(index.filter({'color': 'black'}), set([self.iphone7_black.pk]))
+        self.assertIsNone(index.get({'color': 'white'}))
+        self.assertEquals(set(index.invalid), set([self.iphone7_invalid.pk, self.iphone7_white.pk]))
+        self.assertIsNotNone(cache.get(VARIANT_INDEX_KEY % self.iphone7.pk))
+        self.run_commit_hooks()
+        self.assertIsNone(cache.get(VARIANT_INDEX_KEY % self.iphone7.pk))
+
     def test_get_attr(self):
         self.assertEquals(self.iphone7_black.get_attr('_unit_price', 0), self.iphone7._unit_price)
 
@@ -293,14 +417,47 @@ class AttachmentModelTest(ShopitTestCase):
         self.assertEquals(self.image0.value, 'image0')
 
     def test_as_dict(self):
-        # TODO: test thumbnails are created for aliases.
-        pass
+        self.assertNotIn('url_small', self.image0.as_dict)
+        self.image0.thumbnails = {'small': '/small.jpg'}
+        del self.image0.as_dict
+        self.assertEquals(self.image0.as_dict['url_small'], '/small.jpg')
+
+    def test_generate_thumbnails(self):
+        self.assertFalse(self.image0.needs_thumbnails)
+        self.assertEquals(self.image0.generate_thumbnails(), {})
+        self.assertEquals(Attachment.objects.get(pk=self.image0.pk).thumbnails, {})
 
     def test_clean(self):
         # TODO: test extension.
         self.assertRaises(ValidationError, Attachment(url=None).clean)
 
 
+class AttributeSignatureModelTest(ShopitTestCase):
+    def setUp(self):
+        self.color = self.create_attribute('Color', ['Black', 'White'])
+        self.size = self.create_attribute('Size', ['S', 'M'], nullable=True)
+        self.shirt = self.create_product('Shirt', Product.GROUP)
+        self.shirt_black = self.create_product('Shirt Black', Product.VARIANT, group=self.shirt)
+        self.create_attribute_value(self.color, self.shirt_black, self.color.get_choices()[0])
+        self.create_attribute_value(self.size, self.shirt_black, None)
+
+    def test_update_variants(self):
+        signatures = AttributeSignature.objects.filter(variant=self.shirt_black).order_by('code')
+        self.assertEquals(list(signatures.values_list('group_id', 'code', 'value')), [
+            (self.shirt.pk, 'color', 'black'), (self.shirt.pk, 'size', '')])
+        self.shirt_black.attribute_values.filter(attribute=self.size).delete()
+        self.assertEquals(signatures.count(), 1)
+
+    def test_filter_attributes(self):
+        self.assertEquals(AttributeSignature.objects.filter_attributes([('Color', 'black'), ('size', '')]).count(), 1)
+        self.assertEquals(AttributeSignature.objects.filter_attributes([('color', 'white'), ('size', '')]).count(), 0)
+
+    @override_settings(SHOPIT_FILTER_ATTRIBUTES_INCLUDES_VARIANTS=False)
+    def test_product_filter_attributes(self):
+        self.assertEquals(list(Product.objects.filter_attributes([('color', 'Black')])), [self.shirt])
+        self.assertEquals(list(Product.objects.filter_attributes([('color', 'Black'), ('size', 'm')])), [])
+
+
 class RelationModelTest(ShopitTestCase):
     def setUp(self):
         self.book = self.create_product('Book')
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from shopit.availability import get_products_availability
+from shopit.models.cart import Cart, CartItem
+from shopit.models.product import Product, StockReservation
+
+from .utils import ShopitTestCase
+
+
+class AvailabilityTest(ShopitTestCase):
+    def setUp(self):
+        cache.clear()
+        self.create_request()
+        self.color = self.create_attribute('Color', ['black', 'white'])
+        self.book = self.create_product('Book')
+        self.shirt = self.create_product('Shirt', Product.GROUP, 20)
+        self.shirt.available_attributes.add(self.color)
+        self.shirt_black = self.create_product('Shirt Black', Product.VARIANT, group=self.shirt, quantity=5)
+        self.create_attribute_value(self.color, self.shirt_black, self.color.get_choices()[0])
+        self.shirt_white = self.create_product('Shirt White', Product.VARIANT, group=self.shirt, quantity=1)
+        self.create_attribute_value(self.color, self.shirt_white, self.color.get_choices()[1])
+        self.shirt_invalid = self.create_product('Shirt Invalid', Product.VARIANT, group=self.shirt)
+        CartItem.objects.create(cart=self.cart, product=self.shirt_black, quantity=2)
+        StockReservation.objects.hold(self.shirt_black, Cart.objects.create(customer=self.create_customer('other')), 1)
+
+    def test_get_products_availability(self):
+        products = list(Product.objects.order_by('pk'))
+        availability = get_products_availability(products, self.request)
+        for product in products:
+            self.assertEquals(availability[product.pk], product.is_available(request=self.request))
+        self.assertEquals(availability[self.shirt_black.pk], (True, 1))
+        self.assertEquals(availability[self.shirt_invalid.pk], (False, -1))
+        self.assertEquals(get_products_availability(products, self.request, 3)[self.shirt_black.pk], (False, -1))
+        self.assertEquals(get_products_availability([]), {})
+
+    def test_get_products_availability_queries(self):
+        products = list(Product.objects.order_by('pk'))
+        get_products_availability(products, self.request)
+        with CaptureQueriesContext(connection) as single:
+            get_products_availability([self.shirt_black], self.request)
+        with CaptureQueriesContext(connection) as many:
+            get_products_availability(products, self.request)
+        self.assertEquals(len(many), len(single))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.utils import translation
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from shopit.cache import LRUCache, get_catalog_version, get_response_cache_key, merge_deferred_values
+
+from .utils import ShopitTestCase
+
+
+class ResponseCacheTest(ShopitTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def get_key(self, url, list_params=None):
+        request = Request(APIRequestFactory().get(url))
+        request.accepted_renderer = type(str('Renderer'), (object,), {'format': 'json'})
+        return get_response_cache_key(request, list_params)
+
+    def test_catalog_version(self):
+        version = get_catalog_version()
+        self.assertEquals(get_catalog_version(), version)
+        product = self.create_product('Product')
+        self.assertEquals(get_catalog_version(), version)
+        self.run_commit_hooks()
+        self.assertGreater(get_catalog_version(), version)
+        version = get_catalog_version()
+        product.flags.add(self.create_flag('Featured'))
+        self.run_commit_hooks()
+        self.assertGreater(get_catalog_version(), version)
+        version = get_catalog_version()
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                product.delete()
+                raise DatabaseError
+        self.run_commit_hooks()
+        self.assertEquals(get_catalog_version(), version)
+
+    def test_get_response_cache_key(self):
+        key = self.get_key('/?c=phones,tablets&s=name', ['c'])
+        self.assertEquals(self.get_key('/?s=name&c=tablets,phones', ['c']), key)
+        self.assertNotEquals(self.get_key('/?c=phones&s=name', ['c']), key)
+        with translation.override('hr'):
+            self.assertNotEquals(self.get_key('/?c=phones,tablets&s=name', ['c']), key)
+        self.create_product('Product')
+        self.run_commit_hooks()
+        self.assertNotEquals(self.get_key('/?c=phones,tablets&s=name', ['c']), key)
+
+    def test_merge_deferred_values(self):
+        data = {'results': [{'id': 1, 'is_available': None, 'variants': [{'id': 2, 'is_available': None}]}]}
+        merge_deferred_values(data, [True, False])
+        self.assertTrue(data['results'][0]['is_available'])
+        self.assertFalse(data['results'][0]['variants'][0]['is_available'])
+
+
+class LRUCacheTest(ShopitTestCase):
+    def test_lru_cache(self):
+        lru = LRUCache(2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEquals(lru.get('b'), None)
+        self.assertEquals(lru.get('a'), 1)
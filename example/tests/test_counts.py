@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from django.core.management import call_command
+from django.utils.six import StringIO
+
+from shopit.counts import get_product_counts
+from shopit.models.categorization import Category
+from shopit.models.flag import Flag
+from shopit.models.product import Product
+
+from .utils import ShopitTestCase
+
+
+class ProductCountsTest(ShopitTestCase):
+    def setUp(self):
+        self.electronics = self.create_categorization('category', 'Electronics')
+        self.phones = self.create_categorization('category', 'Phones', parent=self.electronics)
+        self.books = self.create_categorization('category', 'Books')
+        self.featured = self.create_flag('Featured')
+        self.new = self.create_flag('New', parent=self.featured)
+        self.phone = self.create_product('Phone', Product.GROUP, category=self.phones)
+        self.create_product('Phone Black', Product.VARIANT, group=self.phone)
+        self.create_product('Tablet', category=self.electronics)
+        self.create_product('Inactive', category=self.phones, active=False)
+
+    def get_counts(self, obj):
+        return obj.__class__.objects.values_list('product_count', 'total_product_count').get(pk=obj.pk)
+
+    def test_get_product_counts(self):
+        counts = get_product_counts(Category)
+        self.assertEquals(counts[self.phones.pk], (1, 1))
+        self.assertEquals(counts[self.electronics.pk], (1, 2))
+        self.assertEquals(counts[self.books.pk], (0, 0))
+
+    def test_update_on_product_change(self):
+        self.assertEquals(self.get_counts(self.electronics), (1, 2))
+        self.phone.category = self.books
+        self.phone.save()
+        self.assertEquals(self.get_counts(self.electronics), (1, 1))
+        self.assertEquals(self.get_counts(self.books), (1, 1))
+        self.phone.active = False
+        self.phone.save()
+        self.assertEquals(self.get_counts(self.books), (0, 0))
+        self.phones.move_to(self.books)
+        self.create_product('Phone 2', category=self.phones)
+        self.assertEquals(self.get_counts(self.books), (0, 1))
+        self.assertEquals(self.get_counts(self.electronics), (1, 1))
+
+    def test_update_incrementally(self):
+        # Saving a product with unchanged state doesn't recount.
+        Category.objects.filter(pk=self.electronics.pk).update(total_product_count=10)
+        self.phone.name = 'Smartphone'
+        self.phone.save()
+        self.assertEquals(self.get_counts(self.electronics), (1, 10))
+        # Only nodes the product is counted in are updated.
+        self.phone.flags.add(self.new)
+        self.phone.category = self.books
+        self.phone.save()
+        self.assertEquals(self.get_counts(self.electronics), (1, 9))
+        self.assertEquals(self.get_counts(self.phones), (0, 0))
+        self.assertEquals(self.get_counts(self.books), (1, 1))
+        self.assertEquals(self.get_counts(self.new), (1, 1))
+        Product.objects.get(pk=self.phone.pk).delete()
+        self.assertEquals(self.get_counts(self.books), (0, 0))
+        self.assertEquals(self.get_counts(self.new), (0, 0))
+        self.assertEquals(self.get_counts(self.featured), (0, 0))
+
+    def test_update_on_move(self):
+        self.phones.move_to(self.books)
+        self.assertEquals(self.get_counts(self.electronics), (1, 1))
+        self.assertEquals(self.get_counts(self.books), (0, 1))
+        phones = Category.objects.get(pk=self.phones.pk)
+        phones.parent = Category.objects.get(pk=self.electronics.pk)
+        phones.save()
+        self.assertEquals(self.get_counts(self.electronics), (1, 2))
+        self.assertEquals(self.get_counts(self.books), (0, 0))
+        # Saving a node without moving it doesn't recount.
+        Category.objects.filter(pk=self.electronics.pk).update(total_product_count=10)
+        Category.objects.get(pk=self.phones.pk).save()
+        self.assertEquals(self.get_counts(self.electronics), (1, 10))
+
+    def test_update_on_flags_change(self):
+        self.phone.flags.add(self.new)
+        self.assertEquals(self.get_counts(self.new), (1, 1))
+        self.assertEquals(self.get_counts(self.featured), (0, 1))
+        self.phone.flags.remove(self.new)
+        self.assertEquals(self.get_counts(self.featured), (0, 0))
+        self.electronics.flags.add(self.featured)
+        self.assertEquals(self.get_counts(self.featured), (2, 2))
+
+    def test_rebuild_product_counts(self):
+        Category.objects.update(product_count=0, total_product_count=0)
+        Flag.objects.update(product_count=5)
+        out = StringIO()
+        call_command('rebuild_product_counts', stdout=out)
+        self.assertIn('Updated product counts of 4 nodes', out.getvalue())
+        self.assertEquals(self.get_counts(self.electronics), (1, 2))
+        self.assertEquals(self.get_counts(self.featured), (0, 0))
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import pickle
+
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.test import override_settings
+
+from shopit.facets import (FACET_INDEX_LOCK_KEY, FacetIndex, count_bitmap, facet_index_lock, from_bitmap,
+                           get_facet_index, to_bitmap)
+from shopit.models.product import Product
+
+from .utils import ShopitTestCase
+
+
+class BitmapTest(ShopitTestCase):
+    def test_to_bitmap(self):
+        self.assertEquals(to_bitmap([]), 0)
+        self.assertEquals(to_bitmap([0, 3]), 9)
+
+    def test_from_bitmap(self):
+        self.assertEquals(from_bitmap(0), [])
+        self.assertEquals(from_bitmap(to_bitmap([1, 8, 1000])), [1, 8, 1000])
+
+    def test_count_bitmap(self):
+        self.assertEquals(count_bitmap(to_bitmap([2, 5, 700])), 3)
+
+
+@override_settings(SHOPIT_FACET_INDEX=True, SHOPIT_FILTER_ATTRIBUTES_INCLUDES_VARIANTS=False)
+class FacetIndexTest(ShopitTestCase):
+    def setUp(self):
+        cache.clear()
+        self.phones = self.create_categorization('category', 'Phones')
+        self.apple = self.create_categorization('brand', 'Apple')
+        self.featured = self.create_flag('Featured')
+        self.color = self.create_attribute('Color', ['black', 'white'])
+
+        self.iphone = self.create_product('iPhone', Product.GROUP, 700, category=self.phones, brand=self.apple)
+        self.iphone.flags.add(self.featured)
+        self.iphone.available_attributes.add(self.color)
+        self.iphone_black = self.create_product('iPhone Black', Product.VARIANT, group=self.iphone)
+        self.create_attribute_value(self.color, self.iphone_black, self.color.get_choices()[0])
+
+        self.book = self.create_product('Book', unit_price=15)
+        self.inactive = self.create_product('Inactive', category=self.phones, active=False)
+
+    def test_build(self):
+        index = get_facet_index()
+        self.assertEquals(from_bitmap(index.products), sorted([self.iphone.pk, self.book.pk]))
+        self.assertEquals(from_bitmap(index.get('category', self.phones.pk)), [self.iphone.pk])
+        self.assertEquals(from_bitmap(index.get('flag', 'featured')), [self.iphone.pk])
+        sale = self.create_modifier('Sale', percent=-10)
+        self.iphone_black.modifiers.add(sale)
+        self.inactive.modifiers.add(sale)
+        self.assertEquals(FacetIndex.build().get('modifier', 'sale'), 0)
+
+    def test_filter_facets(self):
+        queryset = Product.objects.active().top_level()
+        self.assertEquals(list(queryset.filter_facets(categories=['phones'])), [self.iphone])
+        self.assertEquals(list(queryset.filter_facets(brands=['apple'], flags=['featured'])), [self.iphone])
+        self.assertEquals(list(queryset.filter_facets(attributes=[('color', 'black')])), [self.iphone])
+        self.assertEquals(list(queryset.filter_facets(attributes=[('color', 'white')])), [])
+        self.assertEquals(list(queryset.filter_facets(price_from=10, price_to=20)), [self.book])
+        self.assertEquals(list(queryset.filter_facets(modifiers=['invalid'])), [])
+
+    def test_update(self):
+        get_facet_index()
+        self.book.flags.add(self.featured)
+        self.run_commit_hooks()
+        flagged = from_bitmap(get_facet_index().get('flag', 'featured'))
+        self.assertEquals(flagged, sorted([self.iphone.pk, self.book.pk]))
+        self.book.delete()
+        self.run_commit_hooks()
+        self.assertEquals(from_bitmap(get_facet_index().products), [self.iphone.pk])
+
+    def test_update_rolled_back(self):
+        get_facet_index()
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                self.book.flags.add(self.featured)
+                raise DatabaseError
+        self.run_commit_hooks()
+        self.assertEquals(from_bitmap(get_facet_index().get('flag', 'featured')), [self.iphone.pk])
+
+    def test_modifier_code_changed(self):
+        modifier = self.create_modifier('Sale', percent=-10)
+        self.book.modifiers.add(modifier)
+        self.run_commit_hooks()
+        self.assertEquals(from_bitmap(get_facet_index().get('modifier', 'sale')), [self.book.pk])
+        modifier.code = 'discount'
+        modifier.save()
+        self.run_commit_hooks()
+        self.assertEquals(get_facet_index().get('modifier', 'sale'), 0)
+        self.assertEquals(from_bitmap(get_facet_index().get('modifier', 'discount')), [self.book.pk])
+
+    def test_facet_index_lock(self):
+        with facet_index_lock():
+            self.assertIsNotNone(cache.get(FACET_INDEX_LOCK_KEY))
+        self.assertIsNone(cache.get(FACET_INDEX_LOCK_KEY))
+
+    def test_pickle(self):
+        index = pickle.loads(pickle.dumps(get_facet_index()))
+        self.assertIsInstance(index, FacetIndex)
+        self.assertEquals(index.products, get_facet_index().products)
+
+    def test_get_facet_counts(self):
+        counts = Product.objects.active().top_level().get_facet_counts()
+        self.assertEquals(counts['count'], 2)
+        self.assertEquals(counts['categories'], {self.phones.pk: 1})
+        self.assertEquals(counts['flags'], {'featured': 1})
+        self.assertEquals(counts['attributes'], {'color': {'black': 1}})
+        self.assertEquals([x['count'] for x in counts['prices']], [1, 1])
+        self.assertEquals(counts['prices'][0]['from'], 10)
+        with override_settings(SHOPIT_FACET_INDEX=False):
+            self.assertEquals(Product.objects.active().top_level().get_facet_counts(), counts)
+
+    def test_get_price_counts(self):
+        self.create_product('Expensive', unit_price=20005)
+        products = Product.objects.active().top_level()
+        with self.assertNumQueries(1):
+            counts = products._get_price_counts(products)
+        self.assertEquals(counts, {('price', 1): 1, ('price', 70): 1, ('price', 2000): 1})
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from shopit.models.product import Product
+from shopit.rest.pagination import ProductCursorPagination
+
+from .utils import ShopitTestCase
+
+
+class SortView(object):
+    def __init__(self, sort=None):
+        self.sort = sort
+
+    def get_sort(self):
+        return self.sort
+
+
+class ProductCursorPaginationTest(ShopitTestCase):
+    def setUp(self):
+        self.products = [self.create_product('Product %d' % i, unit_price=i % 3) for i in range(5)]
+
+    def paginate(self, url='/', sort=None, page_size=2):
+        paginator = ProductCursorPagination()
+        paginator.page_size = page_size
+        request = Request(APIRequestFactory().get(url))
+        page = paginator.paginate_queryset(Product.objects.all(), request, SortView(sort))
+        return page, paginator
+
+    def walk(self, sort=None):
+        products, url = [], '/'
+        while url:
+            page, paginator = self.paginate(url, sort)
+            products.extend(page)
+            url = paginator.get_next_link()
+        return products
+
+    def test_paginate(self):
+        self.assertEquals(self.walk(), list(Product.objects.order_by('-order', '-pk')))
+        self.assertEquals(self.walk('price'), list(Product.objects.order_by('effective_price', 'pk')))
+        self.assertEquals(self.walk('-name'), sorted(self.products, key=lambda x: x.name, reverse=True))
+
+    def test_previous(self):
+        page, paginator = self.paginate()
+        self.assertIsNone(paginator.get_previous_link())
+        page2, paginator = self.paginate(paginator.get_next_link())
+        page1, paginator = self.paginate(paginator.get_previous_link())
+        self.assertEquals(page1, page)
+
+    def test_invalid_cursor(self):
+        page, paginator = self.paginate(sort='price')
+        with self.assertRaises(NotFound):
+            self.paginate(paginator.get_next_link(), sort='name')
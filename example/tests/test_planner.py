@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from shopit.models.product import Product
+from shopit.planner import load_attachments, plan_products, seed_products
+
+from .utils import ShopitTestCase
+
+
+class PlannerTest(ShopitTestCase):
+    def setUp(self):
+        self.create_request()
+        self.featured = self.create_flag('Featured')
+        self.sale = self.create_flag('Sale')
+        self.discount = self.create_modifier('Discount', percent=-10)
+        self.shipping = self.create_modifier('Shipping', amount=5)
+        self.electronics = self.create_categorization('category', 'Electronics')
+        self.electronics.flags.add(self.sale)
+        self.electronics.modifiers.add(self.discount)
+        self.phones = self.create_categorization('category', 'Phones', parent=self.electronics)
+
+        self.iphone = self.create_product('iPhone', Product.GROUP, 700, category=self.phones)
+        self.iphone.flags.add(self.featured)
+        self.iphone.modifiers.add(self.shipping)
+        self.iphone_black = self.create_product('iPhone Black', Product.VARIANT, group=self.iphone)
+        self.book = self.create_product('Book', unit_price=15)
+        self.create_review(self.book, self.customer, language='en')
+        self.create_review(self.book, self.customer, language='de')
+        self.create_relation(self.book, self.iphone)
+
+    def test_plan_products(self):
+        queryset = plan_products(Product.objects.all(), ['category', 'price'])
+        self.assertIn('_category', queryset.query.select_related)
+        self.assertIn('_tax', queryset.query.select_related)
+
+    def test_seed_products(self):
+        fields = ['modifiers', 'flags', 'attachments', 'relations', 'reviews']
+        modifiers = list(Product.objects.get(pk=self.iphone_black.pk).get_modifiers())
+        products = seed_products(Product.objects.order_by('pk'), fields)
+        iphone, iphone_black, book = products
+        with self.assertNumQueries(0):
+            self.assertEquals(list(iphone.get_flags()), [self.featured, self.sale])
+            self.assertEquals(list(iphone_black.get_flags()), [self.featured, self.sale])
+            self.assertEquals(list(iphone_black.get_modifiers()), modifiers)
+            self.assertEquals(iphone.get_attachments()['images'], None)
+            self.assertEquals([x.product for x in book.get_relations()], [self.iphone])
+            self.assertEquals(book.get_related_products(), [self.iphone])
+            self.assertEquals([x.language for x in book.get_reviews(language='de')], ['de'])
+        self.assertEquals(book.get_reviews().count(), 2)
+
+    def test_load_attachments(self):
+        image = self.create_attachment(self.iphone, 'image', url='image')
+        video = self.create_attachment(self.iphone_black, 'video', url='video')
+        iphone, iphone_black = Product.objects.filter(pk__in=[self.iphone.pk, self.iphone_black.pk]).order_by('pk')
+        with self.assertNumQueries(1):
+            load_attachments([iphone, iphone_black])
+        with self.assertNumQueries(0):
+            self.assertEquals(iphone_black.primary_image, image)
+            self.assertEquals(iphone_black.videos, [video])
+            self.assertEquals(iphone.videos, [])
+            self.assertEquals(iphone_black.get_attachments()['images'][0]['url'], 'image')
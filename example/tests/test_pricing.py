@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from decimal import Decimal
+
+from shopit.models.product import Product
+from shopit.pricing import get_prices
+
+from .utils import ShopitTestCase
+
+
+class PricingTest(ShopitTestCase):
+    def setUp(self):
+        self.tax = self.create_tax('Tax', Decimal('25.50'))
+        self.electronics = self.create_categorization('category', 'Electronics', tax=self.tax)
+        self.phones = self.create_categorization('category', 'Phones', parent=self.electronics)
+        self.phone = self.create_product(
+            'Phone', Product.GROUP, '99.99', discount=Decimal('12.5'), category=self.phones)
+        self.phone_black = self.create_product('Phone Black', Product.VARIANT, group=self.phone)
+        self.phone_white = self.create_product('Phone White', Product.VARIANT, '89.95', group=self.phone, discount=0)
+        self.book = self.create_product('Book', unit_price=Decimal('15.333'))
+
+    def test_get_prices(self):
+        prices = get_prices(Product.objects.all())
+        for product in [self.phone, self.phone_black, self.phone_white, self.book]:
+            product = Product.objects.get(pk=product.pk)
+            self.assertEquals(prices[product.pk].unit_price, product.unit_price)
+            self.assertEquals(prices[product.pk].discount_amount, product.discount_amount)
+            self.assertEquals(prices[product.pk].tax_percent, product.tax_percent)
+            self.assertEquals(prices[product.pk].tax_amount, product.tax_amount)
+            self.assertEquals(prices[product.pk].price, product.get_price())
+        self.assertEquals(list(get_prices([self.book.pk]).keys()), [self.book.pk])
+        self.assertEquals(prices[self.phone.pk].price, Decimal('109.80151875'))
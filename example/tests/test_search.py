@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from django.core.management import call_command
+from django.utils.six import StringIO
+
+from shopit.models.product import Product, SearchTerm
+from shopit.search import tokenize
+
+from .utils import ShopitTestCase
+
+
+class SearchTest(ShopitTestCase):
+    def setUp(self):
+        self.phones = self.create_categorization('category', 'Phones')
+        self.color = self.create_attribute('Color', ['black', 'white'])
+        self.iphone = self.create_product('iPhone 7', Product.GROUP, category=self.phones)
+        self.iphone.available_attributes.add(self.color)
+        self.iphone_black = self.create_product('iPhone 7 Black', Product.VARIANT, group=self.iphone)
+        self.create_attribute_value(self.color, self.iphone_black, self.color.get_choices()[0])
+        self.book = self.create_product('Book', _caption='A book about <b>phones</b>')
+
+    def test_tokenize(self):
+        self.assertEquals(sorted(tokenize('A book, about <b>books</b>!')), ['a', 'about', 'book', 'books'])
+        self.assertEquals(tokenize(None), [])
+
+    def test_search(self):
+        self.assertEquals(list(Product.objects.search('iph')), [self.iphone])
+        self.assertEquals(list(Product.objects.search('black')), [self.iphone])
+        self.assertEquals(list(Product.objects.search('iphone black')), [self.iphone])
+        self.assertEquals(list(Product.objects.search('iphone book')), [])
+        self.assertEquals(list(Product.objects.search('')), [])
+        self.assertEquals(list(Product.objects.search('!!!').order_by('-search_rank', '-order')), [])
+        ranked = Product.objects.search('phones').order_by('-search_rank')
+        self.assertEquals(list(ranked), [self.book, self.iphone])
+
+    def test_search_composes_with_filters(self):
+        self.assertEquals(list(Product.objects.filter_categorization(['phones']).search('phones')), [self.iphone])
+
+    def test_rebuild_search_index(self):
+        SearchTerm.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 2 products', out.getvalue())
+        self.assertEquals(list(Product.objects.search('book')), [self.book])
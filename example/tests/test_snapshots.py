@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import pickle
+
+from django.core.cache import cache
+
+from shopit.models.product import Product
+from shopit.snapshots import attach_snapshots, get_snapshots, local_cache
+
+from .utils import ShopitTestCase
+
+
+class SnapshotTest(ShopitTestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.tax = self.create_tax('Tax', 20)
+        self.shirt = self.create_product('Shirt', Product.GROUP, 100, tax=self.tax, discount=10, _caption='Caption')
+        self.shirt_black = self.create_product('Shirt Black', Product.VARIANT, group=self.shirt)
+
+    def test_get_snapshots(self):
+        shirt, shirt_black = get_snapshots([self.shirt, self.shirt_black], 'en')
+        self.assertEquals(shirt_black.caption, 'Caption')
+        self.assertEquals(shirt_black.unit_price, self.shirt.unit_price)
+        self.assertEquals(shirt_black.tax_id, self.tax.pk)
+        self.assertEquals(shirt_black.price, self.shirt_black.get_price())
+        self.assertRaises(AttributeError, setattr, shirt, 'caption', 'Changed')
+        self.assertEquals(pickle.loads(pickle.dumps(shirt, pickle.HIGHEST_PROTOCOL)).__getstate__(),
+                          shirt.__getstate__())
+        self.assertIs(get_snapshots([self.shirt], 'en')[0], shirt)
+        local_cache.clear()
+        self.assertEquals(get_snapshots([self.shirt], 'en')[0].version, shirt.version)
+        self.shirt.save()
+        self.assertNotEquals(get_snapshots([self.shirt], 'en')[0].version, shirt.version)
+
+    def test_attach_snapshots(self):
+        shirt_black = Product.objects.get(pk=self.shirt_black.pk)
+        shirt_black.set_current_language('en')
+        attach_snapshots([shirt_black], 'en')
+        with self.assertNumQueries(0):
+            self.assertEquals(shirt_black.caption, 'Caption')
+            self.assertEquals(shirt_black.price, self.shirt_black.get_price())
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.test import TransactionTestCase, override_settings
+from easy_thumbnails.alias import aliases
+from filer.models import File, Image
+from PIL import Image as PILImage
+
+from shopit import thumbnails
+from shopit.models.product import Attachment, Product
+
+
+@override_settings(ROOT_URLCONF='tests.urls')
+class ThumbnailsTest(TransactionTestCase):
+    """
+    Thumbnails are generated once the transaction commits, which only
+    happens outside of a `TestCase`.
+    """
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        aliases.set('small', {'size': (20, 20)}, target='shopit.Attachment')
+        self.product = Product.objects.language().create(name='Phone', slug='phone', code='phone')
+        self.image = Image.objects.create(original_filename='phone.png', file=self.create_image('phone.png'))
+
+    def tearDown(self):
+        aliases._aliases.get('shopit.Attachment', {}).pop('small', None)
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def create_image(self, name):
+        data = BytesIO()
+        PILImage.new('RGB', (100, 100), 'red').save(data, 'PNG')
+        return ContentFile(data.getvalue(), name=name)
+
+    def create_attachment(self):
+        return Attachment.objects.create(product=self.product, kind=Attachment.IMAGE, file=self.image)
+
+    def get_thumbnails(self, attachment):
+        return Attachment.objects.get(pk=attachment.pk).thumbnails
+
+    @override_settings(SHOPIT_ASYNC_THUMBNAILS=False)
+    def test_generate_on_commit(self):
+        attachment = self.create_attachment()
+        self.assertIn('small', self.get_thumbnails(attachment))
+
+    @override_settings(SHOPIT_ASYNC_THUMBNAILS=True)
+    def test_generate_async(self):
+        attachment = self.create_attachment()
+        thumbnails._queue.join()
+        self.assertIn('small', self.get_thumbnails(attachment))
+
+    @override_settings(SHOPIT_ASYNC_THUMBNAILS=False)
+    def test_regenerate_on_file_change(self):
+        attachment = self.create_attachment()
+        Attachment.objects.filter(pk=attachment.pk).update(thumbnails={})
+        self.image.subject_location = '50,50'
+        self.image.save()
+        self.assertIn('small', self.get_thumbnails(attachment))
+
+    @override_settings(SHOPIT_ASYNC_THUMBNAILS=False)
+    def test_invalid_image(self):
+        document = File.objects.create(original_filename='broken.png', file=ContentFile(b'text', name='broken.png'))
+        attachment = Attachment.objects.create(product=self.product, kind=Attachment.IMAGE, file=document)
+        self.assertEquals(self.get_thumbnails(attachment), {})
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from django.core.cache import cache
+
+from shopit.models.categorization import Brand, Category
+from shopit.trees import get_tree, local_cache
+
+from .utils import ShopitTestCase
+
+
+class CategorizationTreeTest(ShopitTestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.tax = self.create_tax('Tax', 20)
+        self.electronics = self.create_categorization('category', 'Electronics', tax=self.tax)
+        self.phones = self.create_categorization('category', 'Phones', parent=self.electronics)
+        self.hidden = self.create_categorization('category', 'Hidden', active=False)
+        self.hidden_child = self.create_categorization('category', 'Hidden Child', parent=self.hidden)
+        self.hidden_grandchild = self.create_categorization('category', 'Hidden Grandchild', parent=self.hidden_child)
+        self.create_product('Phone', category=self.phones)
+        self.create_product('Tablet', category=self.electronics)
+        self.create_product('Inactive', category=self.phones, active=False)
+
+    def test_get_tree(self):
+        tree = get_tree(Category)
+        phones = tree.get(self.phones.pk)
+        self.assertEquals(phones.name, 'Phones')
+        self.assertEquals(phones.get_absolute_url(), self.phones.get_absolute_url())
+        self.assertEquals(phones.tax_id, self.tax.pk)
+        self.assertEquals(phones.product_count, 1)
+        self.assertEquals(tree.get(self.electronics.pk).product_count, 1)
+        self.assertEquals(tree.get(self.electronics.pk).total_product_count, 2)
+        self.assertFalse(tree.get(self.hidden_grandchild.pk).active)
+        self.assertEquals([x.pk for x in tree.filter(level=0)], [self.electronics.pk])
+        self.assertEquals([x.pk for x in tree.get_children(self.electronics.pk)], [self.phones.pk])
+        with self.assertNumQueries(0):
+            self.assertIs(get_tree(Category), tree)
+        local_cache.clear()
+        with self.assertNumQueries(0):
+            get_tree(Category)
+        self.phones.move_to(None)
+        self.run_commit_hooks()
+        self.assertIsNone(get_tree(Category).get(self.phones.pk).parent_id)
+        self.assertEquals(get_tree(Brand).nodes, {})
+
+    def test_active(self):
+        self.assertEquals(set(Category.objects.active()), set([self.electronics, self.phones]))
+
+    def test_product_change(self):
+        tree = get_tree(Category)
+        phone = self.create_product('Phone 2', category=self.phones)
+        self.run_commit_hooks()
+        tree = get_tree(Category)
+        self.assertEquals(tree.get(self.phones.pk).product_count, 2)
+        phone.name = 'Phone 3'
+        phone.save()
+        self.run_commit_hooks()
+        with self.assertNumQueries(0):
+            self.assertIs(get_tree(Category), tree)
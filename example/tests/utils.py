@@ -5,6 +5,7 @@ from decimal import Decimal as D
 
 from django.contrib.auth import get_user_model
 from django.contrib.sessions.backends.db import SessionStore
+from django.db import connection
 from django.test import TestCase, override_settings
 from django.test.client import RequestFactory
 from django.utils.text import slugify
@@ -22,6 +23,14 @@ from shopit.models.tax import Tax
 
 @override_settings(ROOT_URLCONF='tests.urls')
 class ShopitTestCase(TestCase):
+    def run_commit_hooks(self):
+        """
+        Runs pending `on_commit` callbacks, a test case never commits.
+        """
+        while connection.run_on_commit:
+            sids, func = connection.run_on_commit.pop(0)
+            func()
+
     def create_request(self):
         """Create request with user, customer and cart."""
         self.factory = RequestFactory()
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+
+from shopit.forms.shop import PaymentMethodForm
+from shopit.models.cart import CartItem
+from shopit.models.order import Order
+from shopit.models.product import Product
+from shopit.payment import ForwardFundPayment
+from shopit.views.shop import CheckoutView
+
+from ..utils import ShopitTestCase
+
+
+class CheckoutViewTest(ShopitTestCase):
+    def setUp(self):
+        self.create_request()
+        self.book = self.create_product('Book', quantity=5)
+        self.phone = self.create_product('Phone', quantity=1)
+        CartItem.objects.create(cart=self.cart, product=self.book, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.phone, quantity=2)
+
+    def test_payment_out_of_stock(self):
+        view = CheckoutView()
+        view.request, view.cart = self.request, self.cart
+        form = PaymentMethodForm(prefix='payment', request=self.request, cart=self.cart)
+        response = view.get_payment_response(ForwardFundPayment(), form)
+        self.assertEquals(response.status_code, 400)
+        self.assertIn('payment-__all__', json.loads(response.content.decode('utf-8')))
+        self.assertFalse(Order.objects.exists())
+        self.assertEquals(Product.objects.get(pk=self.book.pk).quantity, 5)
+        self.assertEquals(self.cart.items.count(), 2)
@@ -19,7 +19,7 @@ class CategorizationAdminBase(FrontendEditableAdminMixin, PlaceholderAdminMixin,
     """
     Base admin for categorization models.
     """
-    list_display = ['tree_actions', 'get_name', 'slug', 'active', 'language_column']
+    list_display = ['tree_actions', 'get_name', 'slug', 'total_product_count', 'active', 'language_column']
     list_display_links = ['get_name']
     filter_horizontal = ['modifiers', 'flags']
     readonly_fields = ['created_at', 'updated_at']
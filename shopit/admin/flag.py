@@ -14,7 +14,7 @@ from shopit.models.flag import Flag
 @admin.register(Flag)
 class FlagAdmin(TranslatableAdmin, DraggableMPTTAdmin):
     form = FlagModelForm
-    list_display = ['tree_actions', 'get_name', 'code', 'active', 'language_column']
+    list_display = ['tree_actions', 'get_name', 'code', 'total_product_count', 'active', 'language_column']
     list_display_links = ['get_name']
     readonly_fields = ['created_at', 'updated_at']
 
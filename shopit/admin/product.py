@@ -8,6 +8,7 @@ from django.conf.urls import url
 from django.contrib import admin, messages
 from django.contrib.admin.views.main import ChangeList
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.paginator import InvalidPage, Paginator
 from django.core.urlresolvers import reverse
 from django.db import transaction
 from django.db.utils import IntegrityError
@@ -27,6 +28,8 @@ from shopit.forms.product import (AttributeChoiceInlineFormSet, AttributeValueIn
                                   ProductModelForm)
 from shopit.models.product import Attachment, Attribute, AttributeChoice, AttributeValue, Product, Relation, Review
 
+VARIANTS_PAGE_VAR = 'variants_page'
+
 
 class AttributeChoiceInline(SortableInlineAdminMixin, TranslatableTabularInline, admin.TabularInline):
     model = AttributeChoice
@@ -95,6 +98,23 @@ class ReviewInline(SortableInlineAdminMixin, admin.TabularInline):
         return False  # pragma: no cover
 
 
+class CombinationList(object):
+    """
+    Sequence of group combinations that only loads the sliced ones, used
+    to paginate combinations in admin.
+    """
+    def __init__(self, product):
+        self.product = product
+
+    def __len__(self):
+        return self.product.get_combinations_count() or 0
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return list(self.product.iter_combinations(key.start or 0, key.stop - (key.start or 0)))
+        return self.product.get_combination(key)
+
+
 class ProductChangeList(ChangeList):
     """
     Override ChangeList to filter out Variant products from admin list
@@ -150,6 +170,9 @@ class ProductAdmin(FrontendEditableAdminMixin, PlaceholderAdminMixin, Translatab
     inlines = [AttributeValueInline, AttachmentInline, RelationInline, ReviewInline]
     actions = ['make_active', 'make_inactive']
 
+    # Number of variant combinations shown per page in `get_variants_field`.
+    variants_per_page = 50
+
     class Media:
         css = {'all': ['shopit/css/djangocms-admin-style.css']}
         js = ['shopit/js/product_admin.js']
@@ -160,6 +183,12 @@ class ProductAdmin(FrontendEditableAdminMixin, PlaceholderAdminMixin, Translatab
     def get_changelist(self, request, **kwargs):
         return ProductChangeList
 
+    def get_object(self, request, object_id, from_field=None):
+        obj = super(ProductAdmin, self).get_object(request, object_id, from_field)
+        if obj is not None:
+            obj._variants_page = request.GET.get(VARIANTS_PAGE_VAR)
+        return obj
+
     def get_changeform_initial_data(self, request):
         initial = super(ProductAdmin, self).get_changeform_initial_data(request)
         try:
@@ -240,9 +269,17 @@ class ProductAdmin(FrontendEditableAdminMixin, PlaceholderAdminMixin, Translatab
     def get_variants_field(self, obj):
         if not obj.pk:
             return None
+        product = obj.group or obj
+        paginator = Paginator(CombinationList(product), self.variants_per_page)
+        try:
+            page = paginator.page(getattr(obj, '_variants_page', None) or 1)
+        except InvalidPage:
+            page = paginator.page(1)
         return render_to_string('admin/shopit/product_variants_field.html', {
-            'product': obj.group or obj,
+            'product': product,
             'variant': obj if obj.group else None,
+            'combinations': page,
+            'page_var': VARIANTS_PAGE_VAR,
         })
     get_variants_field.allow_tags = True
     get_variants_field.short_description = _('Variants')
@@ -266,7 +303,7 @@ class ProductAdmin(FrontendEditableAdminMixin, PlaceholderAdminMixin, Translatab
         if not language:
             language = get_current_language()  # pragma: no cover
         try:
-            combo = product.get_combinations()[int(combo)]
+            combo = product.get_combination(int(combo))
             variant = product.create_variant(combo, language=language)
         except (IndexError, ObjectDoesNotExist, IntegrityError):
             return HttpResponseBadRequest()
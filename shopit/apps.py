@@ -8,3 +8,6 @@ from django.utils.translation import ugettext_lazy as _
 class ShopitConfig(AppConfig):
     name = 'shopit'
     verbose_name = _('Shopit')
+
+    def ready(self):
+        from shopit import signals  # noqa
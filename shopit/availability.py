@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+
+def get_products_availability(products, request=None, quantity=1):
+    """
+    Returns a dictionary of product ids with `(available, diff)` tuples,
+    same as `Product.is_available` would return for every one of the given
+    products. Cart is resolved once, quantities in cart and reserved for
+    other carts are loaded in one query each and validity of variants is
+    checked against cached variant indexes.
+    """
+    from shopit.models.cart import Cart, CartItem
+    from shopit.models.product import Product, StockReservation
+    from shopit.variants import get_variant_indexes
+
+    products = list(products)
+    if not products:
+        return {}
+
+    ids = [x.pk for x in products]
+    cart = Cart.objects.get_or_create_from_request(request) if request else None
+    in_cart = {}
+    if cart is not None and cart.pk:
+        items = CartItem.objects.filter(cart=cart, product_id__in=ids).values_list('product_id', 'quantity')
+        for pk, number in items:
+            in_cart[pk] = in_cart.get(pk, 0) + number
+
+    reserved = StockReservation.objects.get_reserved([x.pk for x in products if x.quantity is not None], cart)
+    valid = set()
+    for index in get_variant_indexes(x.group_id for x in products if x.kind == Product.VARIANT).values():
+        valid.update(index.valid)
+
+    availability = {}
+    for product in products:
+        number = product.quantity if product.quantity is not None else True
+        if product.is_group:
+            number = 0
+        elif product.is_variant and product.pk not in valid:
+            number = 0
+        elif product.quantity is not None:
+            number -= reserved.get(product.pk, 0)
+        number = 100000 if number is True else number
+        total = quantity + in_cart.get(product.pk, 0)
+        availability[product.pk] = number >= total, int(number - total)
+    return availability
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import get_language
+
+from shopit.conf import app_settings
+
+CATALOG_VERSION_KEY = 'shopit_catalog_version'
+CATEGORIZATION_VERSION_KEY = 'shopit_categorization_version'
+RESPONSE_CACHE_KEY = 'shopit_response_%s'
+
+
+class LRUCache(object):
+    """
+    A thread safe, process local cache that holds up to `size` items,
+    least recently used items are removed first.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.data.pop(key, None)
+            if value is not None:
+                self.data[key] = value
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = value
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key):
+    """
+    Bumps a version once the current transaction is committed, so that
+    data of a rolled back change, or data read before the commit, is never
+    cached under the new version.
+    """
+    transaction.on_commit(lambda: _incr_version(key))
+
+
+def _incr_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        _get_version(key)
+
+
+def get_catalog_version():
+    """
+    Returns a catalog version, a counter that is bumped on every change to
+    the catalog. Counter starts from current time so that a version is
+    never reused if the counter is evicted from cache.
+    """
+    return _get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    _bump_version(CATALOG_VERSION_KEY)
+
+
+def get_categorization_version():
+    """
+    Returns a categorization version, bumped only on changes to data held
+    in categorization trees. Unlike the catalog version product saves don't
+    bump it, unless they change stored product counts.
+    """
+    return _get_version(CATEGORIZATION_VERSION_KEY)
+
+
+def bump_categorization_version():
+    _bump_version(CATEGORIZATION_VERSION_KEY)
+
+
+def get_response_cache_key(request, list_params=None):
+    """
+    Returns a cache key for the given request, built from the absolute path,
+    language, normalized GET parameters and catalog version. Values of
+    `list_params` are comma separated lists and are sorted.
+    """
+    params = []
+    for key in sorted(request.GET.keys()):
+        for value in sorted(request.GET.getlist(key)):
+            if key in (list_params or []):
+                value = ','.join(sorted(filter(None, value.split(','))))
+            params.append([key, value])
+    data = [
+        request.build_absolute_uri(request.path),
+        get_language(),
+        request.accepted_renderer.format,
+        params,
+        get_catalog_version(),
+    ]
+    return RESPONSE_CACHE_KEY % hashlib.md5(json.dumps(data).encode('utf-8')).hexdigest()
+
+
+def get_cached_response(key):
+    return cache.get(key)
+
+
+def set_cached_response(key, data, ids):
+    cache.set(key, (data, ids), app_settings.RESPONSE_CACHE_TIMEOUT)
+
+
+def merge_deferred_values(data, values, field='is_available'):
+    """
+    Sets values of the given field in serialized data, in the same order
+    that they were deferred when data was serialized.
+    """
+    values = iter(values)
+
+    def walk(item):
+        if isinstance(item, dict):
+            if field in item:
+                item[field] = next(values)
+            for key, value in item.items():
+                if key != field:
+                    walk(value)
+        elif isinstance(item, (list, tuple)):
+            for value in item:
+                walk(value)
+
+    walk(data)
+    return data
@@ -37,6 +37,7 @@ class DefaultSettings(object):  # pragma: no cover
             'wrong_extension': _("File extension not allowed for this attachment kind."),
             'discount_not_negative': _('A discount should be subtracting the price, amount or percent needs to be negative.'),  # noqa
             'variant_has_relations': _('Only Single and Group products can have relations.'),
+            'product_out_of_stock': _('Product is out of stock for the given quantity.'),
             'relation_base_is_product': _("You can't set relation to self."),
             'modifier_no_condition_path': _("You have to select a condition."),
             'cart_discount_code_exists': _("Code is already applied to your cart."),
@@ -198,6 +199,60 @@ class DefaultSettings(object):  # pragma: no cover
         """
         return self._setting('SHOPIT_FILTER_ATTRIBUTES_INCLUDES_VARIANTS', False)
 
+    @property
+    def SHOPIT_FACET_INDEX(self):
+        """
+        Use an in-memory bitmap index to filter products in ``ProductListView``
+        instead of querying the database for every facet. The index is stored
+        in the default cache backend and updated as products change.
+        """
+        return self._setting('SHOPIT_FACET_INDEX', False)
+
+    @property
+    def SHOPIT_FACET_INDEX_PRICE_STEP(self):
+        """
+        Width of a price bucket used by the facet index.
+        """
+        return self._setting('SHOPIT_FACET_INDEX_PRICE_STEP', 10)
+
+    @property
+    def SHOPIT_RESPONSE_CACHE(self):
+        """
+        Cache responses of ``ProductListView`` and ``ProductDetailView`` in
+        the default cache backend. Cache is invalidated when catalog changes.
+        """
+        return self._setting('SHOPIT_RESPONSE_CACHE', False)
+
+    @property
+    def SHOPIT_RESPONSE_CACHE_TIMEOUT(self):
+        """
+        Timeout in seconds for the cached responses.
+        """
+        return self._setting('SHOPIT_RESPONSE_CACHE_TIMEOUT', 60 * 60)
+
+    @property
+    def SHOPIT_STOCK_RESERVATION_TIMEOUT(self):
+        """
+        Number of seconds the quantity added to cart is held for that cart
+        and unavailable to others. Set to ``0`` to disable reservations.
+        """
+        return self._setting('SHOPIT_STOCK_RESERVATION_TIMEOUT', 15 * 60)
+
+    @property
+    def SHOPIT_SNAPSHOT_CACHE_SIZE(self):
+        """
+        Number of product snapshots held in a process local cache.
+        """
+        return self._setting('SHOPIT_SNAPSHOT_CACHE_SIZE', 1000)
+
+    @property
+    def SHOPIT_ASYNC_THUMBNAILS(self):
+        """
+        Generate thumbnails of attachment images in a background thread.
+        When disabled they're generated once the saving transaction commits.
+        """
+        return self._setting('SHOPIT_ASYNC_THUMBNAILS', True)
+
     def __getattr__(self, key):
         if not key.startswith('SHOPIT_'):
             key = 'SHOPIT_{0}'.format(key)
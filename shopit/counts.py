@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from collections import OrderedDict, defaultdict
+
+from django.db.models import Count, F
+from django.db.models.signals import post_save
+
+from shopit.cache import bump_categorization_version
+
+# Product fields that decide which nodes a product is counted in.
+COUNTED_PRODUCT_FIELDS = ['active', 'kind', '_category_id', '_brand_id', '_manufacturer_id']
+
+
+def get_counted_models():
+    from shopit.models.categorization import Brand, Category, Manufacturer
+    from shopit.models.flag import Flag
+
+    return [Category, Brand, Manufacturer, Flag]
+
+
+def _count(queryset, field):
+    rows = queryset.values(field).annotate(count=Count('id')).order_by()
+    return dict((x[field], x['count']) for x in rows)
+
+
+def get_product_counts(model, tree_ids=None):
+    """
+    Returns a dictionary of node ids with a tuple of active top-level
+    product counts, in the node alone and including descendants. Only
+    nodes in trees with the given ids are counted, or all when `None`.
+    """
+    from shopit.models.flag import Flag
+    from shopit.models.product import EffectiveFlag, Product
+
+    nodes = model.objects.order_by('tree_id', 'lft')
+    if tree_ids is not None:
+        nodes = nodes.filter(tree_id__in=tree_ids)
+    nodes = list(nodes.values_list('id', 'parent_id'))
+    products = Product.objects.active().top_level()
+
+    if model is Flag:
+        # Effective flags hold ancestors of the flags as well, so the total
+        # is the number of distinct products in a subtree.
+        rows = EffectiveFlag.objects.filter(product__in=products)
+        if tree_ids is not None:
+            rows = rows.filter(flag__tree_id__in=tree_ids)
+        own, total = _count(rows.filter(is_ancestor=False), 'flag_id'), _count(rows, 'flag_id')
+        return dict((pk, (own.get(pk, 0), total.get(pk, 0))) for pk, parent_id in nodes)
+
+    field = '_%s' % model._meta.model_name
+    if tree_ids is not None:
+        products = products.filter(**{'%s__tree_id__in' % field: tree_ids})
+    own = _count(products.exclude(**{field: None}), '%s_id' % field)
+    counts = OrderedDict((pk, [own.get(pk, 0), own.get(pk, 0)]) for pk, parent_id in nodes)
+    for pk, parent_id in reversed(nodes):
+        if parent_id in counts:
+            counts[parent_id][1] += counts[pk][1]
+    return dict((pk, tuple(x)) for pk, x in counts.items())
+
+
+def update_product_counts(model, ids=None):
+    """
+    Updates stored product counts of the given model in trees of nodes with
+    the given ids, or in all trees when `None`. Nodes are updated in a
+    query per distinct pair of counts, returns number of updated nodes.
+    """
+    nodes = model.objects.all()
+    if ids is not None:
+        tree_ids = set(model.objects.filter(id__in=ids).values_list('tree_id', flat=True))
+        if not tree_ids:
+            return 0
+        nodes = nodes.filter(tree_id__in=tree_ids)
+    counts = get_product_counts(model, None if ids is None else tree_ids)
+
+    updates = defaultdict(list)
+    for pk, product_count, total_product_count in nodes.values_list('id', 'product_count', 'total_product_count'):
+        if counts.get(pk, (0, 0)) != (product_count, total_product_count):
+            updates[counts.get(pk, (0, 0))].append(pk)
+    for (product_count, total_product_count), pks in updates.items():
+        model.objects.filter(id__in=pks).update(product_count=product_count, total_product_count=total_product_count)
+    if updates:
+        bump_categorization_version()
+    return sum(len(x) for x in updates.values())
+
+
+def get_counted_flag_ids(ids):
+    """
+    Returns a set of flag ids that the given products are counted in,
+    `ids` can be a list or a queryset of product ids.
+    """
+    from shopit.models.product import EffectiveFlag
+
+    return set(EffectiveFlag.objects.filter(product_id__in=ids).values_list('flag_id', flat=True))
+
+
+def get_moved_node_ids(instance, **kwargs):
+    """
+    Returns ids of the given node and it's previous parent from a `post_save`
+    signal when the node was moved, an empty list otherwise. Counts in trees
+    of those nodes need to be updated. Every move ends with a save, while
+    `node_moved` is sent before a changed parent is stored, so only
+    `post_save` is considered.
+    """
+    if kwargs.get('signal') is not post_save:
+        return []
+    known, original = hasattr(instance, '_original_parent_id'), getattr(instance, '_original_parent_id', None)
+    instance._original_parent_id = instance.parent_id
+    if kwargs.get('created', False) or (known and original == instance.parent_id):
+        return []
+    return [x for x in [instance.pk, original] if x is not None]
+
+
+def get_counted_state(instance):
+    """
+    Returns a tuple of product field values that decide which nodes the
+    product is counted in.
+    """
+    return tuple(getattr(instance, x) for x in COUNTED_PRODUCT_FIELDS)
+
+
+def get_original_counted_state(instance):
+    """
+    Returns the counted state of the given product as stored in database,
+    or `None` for unsaved products.
+    """
+    from shopit.models.product import Product
+
+    if hasattr(instance, '_original_counted_state'):
+        return instance._original_counted_state
+    if instance.pk is None:
+        return None
+    return Product.objects.filter(pk=instance.pk).values_list(*COUNTED_PRODUCT_FIELDS).first()
+
+
+def get_product_contributions(pk, state):
+    """
+    Returns a dictionary of `(model, node id)` pairs with a tuple of counts
+    that a product with the given pk and counted state adds to the node,
+    alone and including descendants. Flags are read from the product's
+    effective flags as currently stored.
+    """
+    from shopit.models.flag import Flag
+    from shopit.models.product import EffectiveFlag, Product
+
+    if state is None:
+        return {}
+    values = dict(zip(COUNTED_PRODUCT_FIELDS, state))
+    if not values['active'] or values['kind'] not in [Product.SINGLE, Product.GROUP]:
+        return {}
+
+    contributions = {}
+    for model in [x for x in get_counted_models() if x is not Flag]:
+        node_id = values['_%s_id' % model._meta.model_name]
+        if node_id is not None:
+            contributions[model, node_id] = (1, 1)
+            ancestors = model.objects.get_queryset_ancestors(model.objects.filter(pk=node_id))
+            contributions.update(((model, x), (0, 1)) for x in ancestors.values_list('id', flat=True))
+    for flag_id, is_ancestor in EffectiveFlag.objects.filter(product_id=pk).values_list('flag_id', 'is_ancestor'):
+        contributions[Flag, flag_id] = (0 if is_ancestor else 1, 1)
+    return contributions
+
+
+def update_product_contributions(before, after):
+    """
+    Updates stored product counts by the difference between contributions
+    from before and after a product change, as returned from
+    `get_product_contributions`. Nodes are updated in a query per model and
+    distinct difference, returns number of updated nodes.
+    """
+    deltas = defaultdict(lambda: (0, 0))
+    for sign, contributions in [(-1, before), (1, after)]:
+        for key, (own, total) in contributions.items():
+            deltas[key] = (deltas[key][0] + sign * own, deltas[key][1] + sign * total)
+
+    updates = defaultdict(list)
+    for (model, pk), delta in deltas.items():
+        if delta != (0, 0):
+            updates[model, delta].append(pk)
+    for (model, (own, total)), pks in updates.items():
+        model.objects.filter(id__in=pks).update(
+            product_count=F('product_count') + own, total_product_count=F('total_product_count') + total)
+    if updates:
+        bump_categorization_version()
+    return sum(len(x) for x in updates.values())
+
+
+def rebuild_product_counts():
+    """
+    Rebuilds product counts of all counted models, returns number of
+    updated nodes.
+    """
+    return sum(update_product_counts(x) for x in get_counted_models())
@@ -0,0 +1,437 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import binascii
+import time
+import uuid
+import zlib
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import models, transaction
+from parler.utils.i18n import get_active_language_choices
+
+from shopit.conf import app_settings
+
+FACET_INDEX_KEY = 'shopit_facet_index'
+FACET_INDEX_VERSION_KEY = 'shopit_facet_index_version'
+FACET_INDEX_LOCK_KEY = 'shopit_facet_index_lock'
+FACET_INDEX_LOCK_TIMEOUT = 30
+FACET_INDEX_LOCK_MAX_DELAY = 1
+
+CATEGORY = 'category'
+BRAND = 'brand'
+MANUFACTURER = 'manufacturer'
+FLAG = 'flag'
+MODIFIER = 'modifier'
+ATTRIBUTE = 'attribute'
+PRICE = 'price'
+
+# Process local copy of the index, validated against the cached version.
+_local = {'index': None}
+
+
+def to_bitmap(ids):
+    """
+    Returns a bitmap (an int) with bits set on the given ids.
+    """
+    ids = [int(x) for x in ids]
+    if not ids:
+        return 0
+    data = bytearray(max(ids) // 8 + 1)
+    for x in ids:
+        data[x // 8] |= 1 << (x % 8)
+    data.reverse()
+    return int(binascii.hexlify(bytes(data)), 16)
+
+
+def from_bitmap(bitmap):
+    """
+    Returns a sorted list of ids that are set in the given bitmap.
+    """
+    ids = []
+    for i, byte in enumerate(_to_bytes(bitmap)):
+        if byte:
+            ids.extend(i * 8 + x for x in range(8) if byte & (1 << x))
+    return ids
+
+
+def count_bitmap(bitmap):
+    """
+    Returns number of bits set in the given bitmap.
+    """
+    return bin(bitmap).count('1')
+
+
+def get_price_bucket(price):
+    """
+    Returns a price bucket number for the given price, buckets are
+    `FACET_INDEX_PRICE_STEP` wide.
+    """
+    return int(Decimal(price) // Decimal(app_settings.FACET_INDEX_PRICE_STEP))
+
+
+def get_price_bucket_range(bucket):
+    """
+    Returns a `(price_from, price_to)` tuple for the given price bucket.
+    """
+    step = Decimal(app_settings.FACET_INDEX_PRICE_STEP)
+    return bucket * step, (bucket + 1) * step
+
+
+class Floor(models.Func):
+    """
+    Rounds a numeric expression down, emulated with casts on SQLite which
+    has no `FLOOR` function.
+    """
+    function = 'FLOOR'
+
+    def as_sqlite(self, compiler, connection):
+        sql, params = compiler.compile(self.source_expressions[0])
+        cast = 'CAST(%s AS INTEGER)' % sql
+        return 'CASE WHEN %s < %s THEN %s - 1 ELSE %s END' % (sql, cast, cast, cast), params * 4
+
+
+def get_price_bucket_expression(field='effective_price'):
+    """
+    Returns a database expression computing a price bucket number from the
+    given field, the same as `get_price_bucket`.
+    """
+    step = models.Value(Decimal(app_settings.FACET_INDEX_PRICE_STEP), output_field=models.DecimalField())
+    return Floor(models.F(field) / step, output_field=models.IntegerField())
+
+
+def format_facet_counts(counts, count):
+    """
+    Returns facet counts in a format returned from the product list view.
+    Counts should be a dictionary of facet keys used in the index.
+    """
+    data = OrderedDict([('count', count)])
+    for name, facet in [('categories', CATEGORY), ('brands', BRAND), ('manufacturers', MANUFACTURER),
+                        ('flags', FLAG), ('modifiers', MODIFIER)]:
+        data[name] = dict((k[1], v) for k, v in counts.items() if k[0] == facet)
+    data['attributes'] = {}
+    for key, value in counts.items():
+        if key[0] == ATTRIBUTE:
+            data['attributes'].setdefault(key[1], {})[key[2]] = value
+    data['prices'] = []
+    for key, value in sorted((k, v) for k, v in counts.items() if k[0] == PRICE):
+        price_from, price_to = get_price_bucket_range(key[1])
+        data['prices'].append({'from': price_from, 'to': price_to, 'count': value})
+    return data
+
+
+def _to_bytes(bitmap):
+    """
+    Returns a little endian bytearray of the bitmap.
+    """
+    if not bitmap:
+        return bytearray()
+    hexed = '%x' % bitmap
+    data = bytearray(binascii.unhexlify(('0' + hexed) if len(hexed) % 2 else hexed))
+    data.reverse()
+    return data
+
+
+def _pack(bitmap):
+    data = _to_bytes(bitmap)
+    data.reverse()
+    return zlib.compress(bytes(data))
+
+
+def _unpack(data):
+    data = zlib.decompress(data)
+    return int(binascii.hexlify(data), 16) if data else 0
+
+
+class FacetIndex(object):
+    """
+    Holds compressed bitmaps of active top-level product ids for every
+    facet value (categorization, flag, modifier and price bucket). Attribute
+    bitmaps hold variant ids that are mapped back to their groups.
+    """
+    def __init__(self):
+        self.version = None
+        self.products = 0
+        self.bitmaps = {}
+        self.groups = {}
+        self.slugs = {}
+        self.group_bitmaps = {}
+
+    def __getstate__(self):
+        return {
+            'version': self.version,
+            'products': _pack(self.products),
+            'bitmaps': dict((k, _pack(v)) for k, v in self.bitmaps.items()),
+            'groups': self.groups,
+            'slugs': self.slugs,
+        }
+
+    def __setstate__(self, state):
+        self.version = state['version']
+        self.products = _unpack(state['products'])
+        self.bitmaps = dict((k, _unpack(v)) for k, v in state['bitmaps'].items())
+        self.groups = state['groups']
+        self.slugs = state['slugs']
+        self.group_bitmaps = {}
+
+    @classmethod
+    def build(cls):
+        """
+        Builds the entire index from the database.
+        """
+        index = cls()
+        index.load()
+        index.load_slugs()
+        return index
+
+    def get(self, *key):
+        return self.bitmaps.get(key, 0)
+
+    def add(self, key, ids):
+        """
+        Adds the given product ids to a key, the bitmap is built once for
+        all of them.
+        """
+        self.bitmaps[key] = self.bitmaps.get(key, 0) | to_bitmap(ids)
+
+    def load(self, ids=None):
+        """
+        Loads products from the database into the index, optionally limited
+        to the given product ids.
+        """
+        from shopit.models.product import AttributeSignature, EffectiveFlag, Product
+
+        products = Product.objects.active().top_level()
+        # Relations are stored for variants and inactive products too, index holds only active top-level ones.
+        top_level = {'product__active': True, 'product__kind__in': [Product.SINGLE, Product.GROUP]}
+        flags = EffectiveFlag.objects.filter(**top_level)
+        modifiers = Product.modifiers.through.objects.filter(**top_level)
+        signatures = AttributeSignature.objects.all()
+        if ids is not None:
+            products = products.filter(id__in=ids)
+            flags = flags.filter(product_id__in=ids)
+            modifiers = modifiers.filter(product_id__in=ids)
+            signatures = signatures.filter(variant_id__in=ids)
+
+        keys = defaultdict(list)
+        rows = list(products.values_list('id', '_category_id', '_brand_id', '_manufacturer_id', 'effective_price'))
+        self.products |= to_bitmap([x[0] for x in rows])
+        for pk, category_id, brand_id, manufacturer_id, price in rows:
+            for facet, value in [(CATEGORY, category_id), (BRAND, brand_id), (MANUFACTURER, manufacturer_id)]:
+                if value is not None:
+                    keys[(facet, value)].append(pk)
+            keys[(PRICE, self.get_price_bucket(price or 0))].append(pk)
+
+        for pk, code in flags.values_list('product_id', 'flag__code'):
+            keys[(FLAG, code)].append(pk)
+
+        for pk, code in modifiers.values_list('product_id', 'modifier__code'):
+            keys[(MODIFIER, code)].append(pk)
+
+        for pk, group_id, code, value in signatures.values_list('variant_id', 'group_id', 'code', 'value'):
+            self.groups[pk] = group_id
+            keys[(ATTRIBUTE, code, value)].append(pk)
+
+        for key, ids in keys.items():
+            self.add(key, ids)
+
+    def load_slugs(self):
+        """
+        Loads translated categorization slugs, so that slugs passed in
+        to `filter` can be resolved without a query.
+        """
+        from shopit.models.categorization import Brand, Category, Manufacturer
+
+        self.slugs = {}
+        for facet, model in [(CATEGORY, Category), (BRAND, Brand), (MANUFACTURER, Manufacturer)]:
+            translations = model._parler_meta.root_model.objects.values_list('master_id', 'language_code', 'slug')
+            for pk, language, slug in translations:
+                self.slugs.setdefault((facet, language, slug), set()).add(pk)
+
+    def remove(self, ids):
+        """
+        Removes the given product ids from the index.
+        """
+        mask = to_bitmap(ids)
+        self.products &= ~mask
+        for key in list(self.bitmaps.keys()):
+            self.bitmaps[key] &= ~mask
+            if not self.bitmaps[key]:
+                del self.bitmaps[key]
+        for pk in ids:
+            self.groups.pop(pk, None)
+        self.group_bitmaps = {}
+
+    def update(self, ids):
+        """
+        Re-indexes the given product ids.
+        """
+        ids = list(set(ids))
+        if ids:
+            self.remove(ids)
+            self.load(ids)
+
+    def get_price_bucket(self, price):
+        return get_price_bucket(price)
+
+    def get_groups(self, *key):
+        """
+        Returns a bitmap of groups for variants in the given attribute key.
+        """
+        if key not in self.group_bitmaps:
+            variants = from_bitmap(self.get(*key))
+            self.group_bitmaps[key] = to_bitmap(set(self.groups[x] for x in variants if x in self.groups))
+        return self.group_bitmaps[key]
+
+    def get_slug_ids(self, facet, slugs):
+        ids = set()
+        for language in get_active_language_choices():
+            for slug in slugs:
+                ids.update(self.slugs.get((facet, language, slug), []))
+        return ids
+
+    def get_attribute_groups(self, attributes):
+        """
+        Returns a bitmap of groups that have a variant matching all of the
+        given `(code, value)` attributes.
+        """
+        variants = None
+        for code, value in attributes:
+            bitmap = self.get(ATTRIBUTE, code.lower(), (value or '').lower())
+            variants = bitmap if variants is None else variants & bitmap
+        return to_bitmap(set(self.groups[x] for x in from_bitmap(variants or 0) if x in self.groups))
+
+    def get_price_range(self, price_from=None, price_to=None):
+        """
+        Returns a bitmap of products in the price buckets that overlap the
+        given range. Prices on the bucket edges still need to be checked.
+        """
+        low = self.get_price_bucket(price_from) if price_from else None
+        high = self.get_price_bucket(price_to) if price_to else None
+        bitmap = 0
+        for key, value in self.bitmaps.items():
+            if key[0] == PRICE and (low is None or key[1] >= low) and (high is None or key[1] <= high):
+                bitmap |= value
+        return bitmap
+
+    def filter(self, categories=None, brands=None, manufacturers=None, flags=None, modifiers=None, attributes=None,
+               price_from=None, price_to=None):
+        """
+        Returns a bitmap of products matching all of the given filters.
+        Arguments match the ones from `ProductQuerySet.filter_*` methods.
+        """
+        bitmap = self.products
+        for facet, slugs in [(CATEGORY, categories), (BRAND, brands), (MANUFACTURER, manufacturers)]:
+            if slugs:
+                matched = 0
+                for pk in self.get_slug_ids(facet, slugs):
+                    matched |= self.get(facet, pk)
+                bitmap &= matched
+        for code in flags or []:
+            bitmap &= self.get(FLAG, code)
+        for code in modifiers or []:
+            bitmap &= self.get(MODIFIER, code)
+        if attributes:
+            bitmap &= self.get_attribute_groups(attributes)
+        if price_from or price_to:
+            bitmap &= self.get_price_range(price_from, price_to)
+        return bitmap
+
+    def count(self, bitmap, modifiers=None):
+        """
+        Returns a dictionary of facet keys with the number of products from
+        the given bitmap in each one. Attribute keys count groups. Only the
+        given modifier codes are counted when `modifiers` is passed in.
+        """
+        counts = {}
+        for key, value in self.bitmaps.items():
+            if key[0] == MODIFIER and modifiers is not None and key[1] not in modifiers:
+                continue
+            num = count_bitmap(bitmap & (self.get_groups(*key) if key[0] == ATTRIBUTE else value))
+            if num:
+                counts[key] = num
+        return counts
+
+
+def get_facet_index():
+    """
+    Returns the facet index. Process local copy is used as long as it
+    matches the cached version, otherwise it's loaded from cache or built.
+    """
+    version = cache.get(FACET_INDEX_VERSION_KEY)
+    index = _local['index']
+    if version is None or index is None or index.version != version:
+        index = cache.get(FACET_INDEX_KEY) if version is not None else None
+        if index is None or index.version != version:
+            index = FacetIndex.build()
+            save_facet_index(index)
+        _local['index'] = index
+    return index
+
+
+def save_facet_index(index):
+    index.version = uuid.uuid4().hex
+    cache.set_many({FACET_INDEX_KEY: index, FACET_INDEX_VERSION_KEY: index.version}, None)
+    _local['index'] = index
+
+
+@contextmanager
+def facet_index_lock():
+    """
+    Holds a lock in cache while the index is read, changed and saved, so
+    that concurrent updates don't overwrite each other. A lock left by a
+    failed process expires after `FACET_INDEX_LOCK_TIMEOUT` seconds. Delay
+    between attempts is doubled up to `FACET_INDEX_LOCK_MAX_DELAY` seconds.
+    """
+    token, delay = uuid.uuid4().hex, 0.01
+    while not cache.add(FACET_INDEX_LOCK_KEY, token, FACET_INDEX_LOCK_TIMEOUT):
+        time.sleep(delay)
+        delay = min(delay * 2, FACET_INDEX_LOCK_MAX_DELAY)
+    try:
+        yield
+    finally:
+        if cache.get(FACET_INDEX_LOCK_KEY) == token:
+            cache.delete(FACET_INDEX_LOCK_KEY)
+
+
+def update_facet_index(ids):
+    """
+    Re-indexes the given products if facet index is enabled. Index is
+    updated once the current transaction is committed, so that a rolled
+    back change is never indexed.
+    """
+    ids = list(ids) if app_settings.FACET_INDEX else []
+    if ids:
+        transaction.on_commit(lambda: _update_facet_index(ids))
+
+
+def update_facet_index_slugs():
+    if app_settings.FACET_INDEX:
+        transaction.on_commit(_update_facet_index_slugs)
+
+
+def rebuild_facet_index():
+    if app_settings.FACET_INDEX:
+        transaction.on_commit(_rebuild_facet_index)
+
+
+def _update_facet_index(ids):
+    with facet_index_lock():
+        index = get_facet_index()
+        index.update(ids)
+        save_facet_index(index)
+
+
+def _update_facet_index_slugs():
+    with facet_index_lock():
+        index = get_facet_index()
+        index.load_slugs()
+        save_facet_index(index)
+
+
+def _rebuild_facet_index():
+    with facet_index_lock():
+        save_facet_index(FacetIndex.build())
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from shopit.models.product import Attachment
+from shopit.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Generates thumbnails for image attachments that are missing them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', dest='all', help='Regenerate thumbnails for all images.')
+        parser.add_argument('--batch-size', type=int, dest='batch_size', default=100)
+
+    def handle(self, *args, **options):
+        attachments = Attachment.objects.filter(kind=Attachment.IMAGE, file__isnull=False)
+        if not options['all']:
+            attachments = attachments.filter(thumbnails__isnull=True)
+        ids = list(attachments.order_by('pk').values_list('id', flat=True))
+        for i in range(0, len(ids), options['batch_size']):
+            generate_thumbnails(ids[i:i + options['batch_size']])
+        self.stdout.write('Generated thumbnails for %d attachments.' % len(ids))
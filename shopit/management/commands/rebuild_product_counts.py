@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from shopit.counts import rebuild_product_counts
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds product counts of categorizations and flags.'
+
+    def handle(self, *args, **options):
+        count = rebuild_product_counts()
+        self.stdout.write('Updated product counts of %d nodes.' % count)
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from shopit.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the product search index.'
+
+    def handle(self, *args, **options):
+        count = rebuild_search_index()
+        self.stdout.write('Indexed %d products.' % count)
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from shopit.models.product import StockReservation
+
+
+class Command(BaseCommand):
+    help = 'Removes expired stock reservations.'
+
+    def handle(self, *args, **options):
+        count, deleted = StockReservation.objects.expired().delete()
+        self.stdout.write('Released %d reservations.' % count)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_attribute_signatures(apps, schema_editor):
+    AttributeValue = apps.get_model('shopit', 'AttributeValue')
+    AttributeSignature = apps.get_model('shopit', 'AttributeSignature')
+    values = AttributeValue.objects.filter(product__kind=2, product__group__isnull=False).\
+        values_list('product_id', 'product__group_id', 'attribute__code', 'choice__value')
+    AttributeSignature.objects.bulk_create([
+        AttributeSignature(variant_id=pk, group_id=group_id, code=code.lower(), value=(value or '').lower())
+        for pk, group_id, code, value in values])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopit', '0012_add_template_to_flag'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttributeSignature',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(editable=False, max_length=128)),
+                ('value', models.CharField(blank=True, editable=False, max_length=255)),
+                ('group', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shopit.Product')),
+                ('variant', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='attribute_signatures', to='shopit.Product')),
+            ],
+            options={
+                'db_table': 'shopit_attribute_signatures',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='attributesignature',
+            unique_together=set([('variant', 'code')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='attributesignature',
+            index_together=set([('code', 'value', 'variant')]),
+        ),
+        migrations.RunPython(populate_attribute_signatures, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from decimal import Decimal
+
+from django.db import migrations
+import shop.money.fields
+
+
+def populate_effective_price(apps, schema_editor):
+    Product = apps.get_model('shopit', 'Product')
+    Category = apps.get_model('shopit', 'Category')
+    places = Decimal(10) ** -Product._meta.get_field('effective_price').decimal_places
+
+    categories = dict((x.pk, x) for x in Category.objects.select_related('_tax'))
+
+    def get_category_tax(pk):
+        category = categories.get(pk)
+        while category is not None and category._tax is None:
+            category = categories.get(category.parent_id)
+        return category._tax if category else None
+
+    for product in Product.objects.select_related('_tax', 'group', 'group___tax').iterator():
+        group = product.group if product.kind == 2 else None
+        unit_price = product._unit_price or (group._unit_price if group else 0)
+        discount = product._discount if product._discount is not None or not group else group._discount
+        tax = product._tax or (group._tax if group else None)
+        if tax is None:
+            tax = get_category_tax(product._category_id or (group._category_id if group else None))
+        unit_price = Decimal(unit_price)
+        discounted = unit_price - unit_price * (discount or Decimal('0.00')) / 100
+        price = discounted + discounted * (tax.percent if tax else Decimal('0.00')) / 100
+        Product.objects.filter(pk=product.pk).update(effective_price=price.quantize(places))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopit', '0013_add_attribute_signature'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=shop.money.fields.MoneyField(db_index=True, default=0, editable=False, help_text='Price with discount and tax calculated, used when filtering and sorting products.', verbose_name='Effective price'),
+        ),
+        migrations.RunPython(populate_effective_price, migrations.RunPython.noop),
+    ]
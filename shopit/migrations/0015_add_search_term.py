@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopit', '0014_add_effective_price_to_product'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('language', models.CharField(editable=False, max_length=15)),
+                ('term', models.CharField(editable=False, max_length=64)),
+                ('weight', models.PositiveIntegerField(default=1, editable=False)),
+                ('product', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='shopit.Product')),
+            ],
+            options={
+                'db_table': 'shopit_search_terms',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchterm',
+            unique_together=set([('product', 'language', 'term')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='searchterm',
+            index_together=set([('language', 'term', 'product')]),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_effective_modifiers(apps, schema_editor):
+    Product = apps.get_model('shopit', 'Product')
+    EffectiveModifier = apps.get_model('shopit', 'EffectiveModifier')
+
+    def get_modifiers(model):
+        through = model._meta.get_field('modifiers').remote_field.through
+        modifiers = {}
+        for pk, modifier_id in through.objects.values_list('%s_id' % model._meta.model_name, 'modifier_id'):
+            modifiers.setdefault(pk, set()).add(modifier_id)
+        return modifiers
+
+    trees = []
+    for index, name in [(3, 'Category'), (4, 'Brand'), (5, 'Manufacturer')]:
+        model = apps.get_model('shopit', name)
+        trees.append((index, dict(model.objects.values_list('id', 'parent_id')), get_modifiers(model)))
+
+    modifiers = get_modifiers(Product)
+    products = dict((x[0], x) for x in Product.objects.values_list(
+        'id', 'kind', 'group_id', '_category_id', '_brand_id', '_manufacturer_id'))
+    effective = []
+    for pk, row in products.items():
+        owner = products.get(row[2], row) if row[1] == 2 else row
+        mods = modifiers.get(pk, set()) | modifiers.get(owner[0], set())
+        for index, parents, tree_modifiers in trees:
+            node = owner[index]
+            while node is not None:
+                mods |= tree_modifiers.get(node, set())
+                node = parents.get(node)
+        effective.extend(EffectiveModifier(product_id=pk, modifier_id=x) for x in mods)
+    EffectiveModifier.objects.bulk_create(effective)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopit', '0015_add_search_term'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EffectiveModifier',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modifier', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shopit.Modifier')),
+                ('product', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='effective_modifiers', to='shopit.Product')),
+            ],
+            options={
+                'db_table': 'shopit_effective_modifiers',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='effectivemodifier',
+            unique_together=set([('product', 'modifier')]),
+        ),
+        migrations.RunPython(populate_effective_modifiers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_effective_flags(apps, schema_editor):
+    Product = apps.get_model('shopit', 'Product')
+    Flag = apps.get_model('shopit', 'Flag')
+    EffectiveFlag = apps.get_model('shopit', 'EffectiveFlag')
+
+    def get_flags(model):
+        through = model._meta.get_field('flags').remote_field.through
+        flags = {}
+        for pk, flag_id in through.objects.values_list('%s_id' % model._meta.model_name, 'flag_id'):
+            flags.setdefault(pk, set()).add(flag_id)
+        return flags
+
+    trees = []
+    for index, name in [(3, 'Category'), (4, 'Brand'), (5, 'Manufacturer')]:
+        model = apps.get_model('shopit', name)
+        trees.append((index, dict(model.objects.values_list('id', 'parent_id')), get_flags(model)))
+
+    flag_parents = dict(Flag.objects.values_list('id', 'parent_id'))
+    flags = get_flags(Product)
+    products = dict((x[0], x) for x in Product.objects.values_list(
+        'id', 'kind', 'group_id', '_category_id', '_brand_id', '_manufacturer_id'))
+    effective = []
+    for pk, row in products.items():
+        owner = products.get(row[2], row) if row[1] == 2 else row
+        direct = flags.get(pk, set()) | flags.get(owner[0], set())
+        for index, parents, tree_flags in trees:
+            node = owner[index]
+            while node is not None:
+                direct |= tree_flags.get(node, set())
+                node = parents.get(node)
+        ancestors = set()
+        for flag in direct:
+            parent = flag_parents.get(flag)
+            while parent is not None:
+                ancestors.add(parent)
+                parent = flag_parents.get(parent)
+        effective.extend(EffectiveFlag(product_id=pk, flag_id=x) for x in direct)
+        effective.extend(EffectiveFlag(product_id=pk, flag_id=x, is_ancestor=True) for x in ancestors - direct)
+    EffectiveFlag.objects.bulk_create(effective)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopit', '0016_add_effective_modifier'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EffectiveFlag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_ancestor', models.BooleanField(default=False, editable=False)),
+                ('flag', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shopit.Flag')),
+                ('product', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='effective_flags', to='shopit.Product')),
+            ],
+            options={
+                'db_table': 'shopit_effective_flags',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='effectiveflag',
+            unique_together=set([('product', 'flag')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='effectiveflag',
+            index_together=set([('flag', 'product')]),
+        ),
+        migrations.RunPython(populate_effective_flags, migrations.RunPython.noop),
+    ]
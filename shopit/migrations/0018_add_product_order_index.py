@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopit', '0017_add_effective_flag'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='order',
+            field=models.BigIntegerField(db_index=True, default=0, verbose_name='Sort'),
+        ),
+    ]
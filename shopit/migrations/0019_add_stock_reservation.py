@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopit', '0018_add_product_order_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=0, editable=False)),
+                ('expires_at', models.DateTimeField(editable=False)),
+                ('cart', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservations', to='shopit.Cart')),
+                ('product', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservations', to='shopit.Product')),
+            ],
+            options={
+                'db_table': 'shopit_stock_reservations',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='stockreservation',
+            unique_together=set([('cart', 'product')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='stockreservation',
+            index_together=set([('product', 'expires_at')]),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import shop.models.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopit', '0019_add_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='thumbnails',
+            field=shop.models.fields.JSONField(blank=True, editable=False, help_text='Urls of generated thumbnails by alias, empty until generated.', null=True, verbose_name='Thumbnails'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from parler import appsettings
+
+CATEGORIZATIONS = ['Category', 'Brand', 'Manufacturer']
+
+
+def populate_paths(apps, schema_editor):
+    for name in CATEGORIZATIONS:
+        model = apps.get_model('shopit', name)
+        translation_model = apps.get_model('shopit', '%sTranslation' % name)
+        rows = {}
+        for pk, master_id, language, slug in translation_model.objects.values_list(
+                'id', 'master_id', 'language_code', 'slug'):
+            rows.setdefault(master_id, []).append((pk, language, slug))
+
+        paths = {}
+        for node_id, parent_id in model.objects.order_by('tree_id', 'lft').values_list('id', 'parent_id'):
+            paths[node_id] = {}
+            for pk, language, slug in rows.get(node_id, []):
+                path = slug
+                if parent_id is not None:
+                    for code in [language] + list(appsettings.PARLER_LANGUAGES.get_fallback_languages(language)):
+                        if code in paths.get(parent_id, {}):
+                            path = '%s/%s' % (paths[parent_id][code], slug)
+                            break
+                paths[node_id][language] = path
+                translation_model.objects.filter(pk=pk).update(path=path)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopit', '0020_add_attachment_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='brandtranslation',
+            name='path',
+            field=models.CharField(blank=True, editable=False, help_text='Full url path including slugs of ancestors, updated automatically.', max_length=255, verbose_name='Path'),
+        ),
+        migrations.AddField(
+            model_name='categorytranslation',
+            name='path',
+            field=models.CharField(blank=True, editable=False, help_text='Full url path including slugs of ancestors, updated automatically.', max_length=255, verbose_name='Path'),
+        ),
+        migrations.AddField(
+            model_name='manufacturertranslation',
+            name='path',
+            field=models.CharField(blank=True, editable=False, help_text='Full url path including slugs of ancestors, updated automatically.', max_length=255, verbose_name='Path'),
+        ),
+        migrations.AlterIndexTogether(
+            name='brandtranslation',
+            index_together=set([('language_code', 'path')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='categorytranslation',
+            index_together=set([('language_code', 'path')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='manufacturertranslation',
+            index_together=set([('language_code', 'path')]),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import filer.fields.image
+
+EFFECTIVE_FIELDS = {
+    'Category': [('_featured_image_id', 'effective_featured_image_id'), ('_tax_id', 'effective_tax_id')],
+    'Brand': [('_featured_image_id', 'effective_featured_image_id')],
+    'Manufacturer': [('_featured_image_id', 'effective_featured_image_id')],
+}
+
+
+def populate_effective_fields(apps, schema_editor):
+    for name, fields in EFFECTIVE_FIELDS.items():
+        model = apps.get_model('shopit', name)
+        effective = {}
+        for node in model.objects.order_by('tree_id', 'lft'):
+            values = []
+            for i, (field, effective_field) in enumerate(fields):
+                value = getattr(node, field)
+                if value is None and node.parent_id in effective:
+                    value = effective[node.parent_id][i]
+                setattr(node, effective_field, value)
+                values.append(value)
+            effective[node.pk] = values
+            model.objects.filter(pk=node.pk).update(**dict((x[1][:-3], getattr(node, x[1])) for x in fields))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopit', '0021_add_categorization_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='brand',
+            name='effective_featured_image',
+            field=filer.fields.image.FilerImageField(blank=True, editable=False, help_text='Featured image of this node or the one inherited from ancestors, updated automatically.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='filer.Image', verbose_name='Effective featured image'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='effective_featured_image',
+            field=filer.fields.image.FilerImageField(blank=True, editable=False, help_text='Featured image of this node or the one inherited from ancestors, updated automatically.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='filer.Image', verbose_name='Effective featured image'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='effective_tax',
+            field=models.ForeignKey(blank=True, editable=False, help_text='Tax of this category or the one inherited from ancestors, updated automatically.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='shopit.Tax', verbose_name='Effective tax'),
+        ),
+        migrations.AddField(
+            model_name='manufacturer',
+            name='effective_featured_image',
+            field=filer.fields.image.FilerImageField(blank=True, editable=False, help_text='Featured image of this node or the one inherited from ancestors, updated automatically.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='filer.Image', verbose_name='Effective featured image'),
+        ),
+        migrations.RunPython(populate_effective_fields, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count
+
+CATEGORIZATIONS = {'Category': '_category', 'Brand': '_brand', 'Manufacturer': '_manufacturer'}
+TOP_LEVEL_KINDS = [0, 1]
+
+
+def count(queryset, field):
+    return dict((x[field], x['count']) for x in queryset.values(field).annotate(count=Count('id')).order_by())
+
+
+def populate_product_counts(apps, schema_editor):
+    product_model = apps.get_model('shopit', 'Product')
+    products = product_model.objects.filter(active=True, kind__in=TOP_LEVEL_KINDS)
+
+    for name, field in CATEGORIZATIONS.items():
+        model = apps.get_model('shopit', name)
+        own = count(products.exclude(**{field: None}), '%s_id' % field)
+        nodes = list(model.objects.order_by('tree_id', 'lft').values_list('id', 'parent_id'))
+        totals = dict((pk, own.get(pk, 0)) for pk, parent_id in nodes)
+        for pk, parent_id in reversed(nodes):
+            if parent_id in totals:
+                totals[parent_id] += totals[pk]
+        for pk, parent_id in nodes:
+            model.objects.filter(pk=pk).update(product_count=own.get(pk, 0), total_product_count=totals[pk])
+
+    flag_model = apps.get_model('shopit', 'Flag')
+    rows = apps.get_model('shopit', 'EffectiveFlag').objects.filter(product__in=products)
+    own, totals = count(rows.filter(is_ancestor=False), 'flag_id'), count(rows, 'flag_id')
+    for pk in flag_model.objects.values_list('id', flat=True):
+        flag_model.objects.filter(pk=pk).update(product_count=own.get(pk, 0), total_product_count=totals.get(pk, 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopit', '0022_add_categorization_effective_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='brand',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of active products in this categorization, updated automatically.', verbose_name='Product count'),
+        ),
+        migrations.AddField(
+            model_name='brand',
+            name='total_product_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text="Number of active products in this categorization and it's descendants, updated automatically.", verbose_name='Total product count'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of active products in this categorization, updated automatically.', verbose_name='Product count'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='total_product_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text="Number of active products in this categorization and it's descendants, updated automatically.", verbose_name='Total product count'),
+        ),
+        migrations.AddField(
+            model_name='flag',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of active products in this flag, updated automatically.', verbose_name='Product count'),
+        ),
+        migrations.AddField(
+            model_name='flag',
+            name='total_product_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text="Number of active products in this flag and it's descendants, updated automatically.", verbose_name='Total product count'),
+        ),
+        migrations.AddField(
+            model_name='manufacturer',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of active products in this categorization, updated automatically.', verbose_name='Product count'),
+        ),
+        migrations.AddField(
+            model_name='manufacturer',
+            name='total_product_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text="Number of active products in this categorization and it's descendants, updated automatically.", verbose_name='Total product count'),
+        ),
+        migrations.RunPython(populate_product_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def create_lock(apps, schema_editor):
+    apps.get_model('shopit', 'ProductOrderLock').objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopit', '0023_add_product_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductOrderLock',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+            options={
+                'db_table': 'shopit_product_order_lock',
+            },
+        ),
+        migrations.RunPython(create_lock, migrations.RunPython.noop),
+    ]
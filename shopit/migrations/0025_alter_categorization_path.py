@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopit', '0024_add_product_order_lock'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='brandtranslation',
+            name='path',
+            field=models.TextField(blank=True, editable=False, help_text='Full url path including slugs of ancestors, updated automatically.', verbose_name='Path'),
+        ),
+        migrations.AlterField(
+            model_name='categorytranslation',
+            name='path',
+            field=models.TextField(blank=True, editable=False, help_text='Full url path including slugs of ancestors, updated automatically.', verbose_name='Path'),
+        ),
+        migrations.AlterField(
+            model_name='manufacturertranslation',
+            name='path',
+            field=models.TextField(blank=True, editable=False, help_text='Full url path including slugs of ancestors, updated automatically.', verbose_name='Path'),
+        ),
+    ]
@@ -10,10 +10,13 @@ from shopit.models.tax import Tax
 from shopit.models.modifier import Modifier, ModifierCondition, DiscountCode
 from shopit.models.flag import Flag
 from shopit.models.categorization import Category, Brand, Manufacturer
-from shopit.models.product import Product, Attribute, AttributeChoice, AttributeValue, Attachment, Relation, Review
+from shopit.models.product import (Product, Attribute, AttributeChoice, AttributeValue, AttributeSignature, Attachment,
+                                   Relation, Review, SearchTerm, EffectiveModifier, EffectiveFlag,
+                                   StockReservation, ProductOrderLock)
 
 
 __all__ = ['Cart', 'CartItem', 'CartDiscountCode', 'Customer', 'ShippingAddress', 'BillingAddress', 'Order',
            'OrderItem', 'Delivery', 'DeliveryItem', 'Tax', 'Modifier', 'ModifierCondition', 'DiscountCode', 'Flag',
            'Category', 'Brand', 'Manufacturer', 'Product', 'Attribute', 'AttributeChoice', 'AttributeValue',
-           'Attachment', 'Relation', 'Review']
+           'AttributeSignature', 'Attachment', 'Relation', 'Review', 'SearchTerm',
+           'EffectiveModifier', 'EffectiveFlag', 'StockReservation', 'ProductOrderLock']
@@ -1,17 +1,22 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals
 
+from collections import defaultdict
+
 from cms.models.fields import PlaceholderField
 from cms.utils.i18n import get_current_language
+from django.core.cache import cache
 from django.core.urlresolvers import NoReverseMatch, reverse
 from django.db import models
-from django.db.models import Q
+from django.db.models import Exists, OuterRef
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
 from filer.fields.image import FilerImageField
 from mptt.managers import TreeManager
 from mptt.models import MPTTModel, TreeForeignKey
 from mptt.querysets import TreeQuerySet
+from parler import appsettings
+from parler.cache import get_translation_cache_key
 from parler.managers import TranslatableManager, TranslatableQuerySet
 from parler.models import TranslatableModelMixin, TranslatedFields
 from parler.utils.context import switch_language
@@ -23,7 +28,14 @@ from shopit.models.tax import Tax
 
 class CategorizationQuerySet(TranslatableQuerySet, TreeQuerySet):
     def active(self):
-        return self.filter(Q(active=True) & (Q(parent__isnull=True) | Q(parent__active=True)))
+        """
+        Returns active categorizations, an inactive node deactivates it's
+        whole subtree.
+        """
+        inactive = self.model._default_manager.filter(
+            active=False, tree_id=OuterRef('tree_id'), lft__lte=OuterRef('lft'), rght__gte=OuterRef('rght'))
+        return self.annotate(has_inactive_ancestor=Exists(inactive.order_by().values('pk'))).filter(
+            has_inactive_ancestor=False)
 
 
 class CategorizationManager(TranslatableManager, TreeManager):
@@ -51,12 +63,33 @@ def _categorization_translated_fields():
             blank=True,
             help_text=_("Description of a categorization, usually used as lead text in categorization's detail view."),
         ),
+        path=models.TextField(
+            _('Path'),
+            blank=True,
+            editable=False,
+            help_text=_('Full url path including slugs of ancestors, updated automatically.'),
+        ),
         meta={
             'unique_together': [('language_code', 'slug')],
+            'index_together': [('language_code', 'path')],
         },
     )
 
 
+def join_path(parent_paths, language, slug):
+    """
+    Returns a path in the given language by joining the slug to a path of
+    the parent, parent paths are given as a dictionary by language. Falls
+    back to the parent path in fallback languages.
+    """
+    if parent_paths is None:
+        return slug
+    for code in [language] + list(appsettings.PARLER_LANGUAGES.get_fallback_languages(language)):
+        if code in parent_paths:
+            return '%s/%s' % (parent_paths[code], slug)
+    return slug
+
+
 @python_2_unicode_compatible
 class CategorizationModel(TranslatableModelMixin, MPTTModel):
     """
@@ -73,6 +106,16 @@ class CategorizationModel(TranslatableModelMixin, MPTTModel):
         help_text=_("If left empty for childs, a parent's featured image will be used."),
     )
 
+    effective_featured_image = FilerImageField(
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        editable=False,
+        related_name='+',
+        verbose_name=_('Effective featured image'),
+        help_text=_('Featured image of this node or the one inherited from ancestors, updated automatically.'),
+    )
+
     parent = TreeForeignKey(
         'self',
         models.CASCADE,
@@ -102,6 +145,20 @@ class CategorizationModel(TranslatableModelMixin, MPTTModel):
         help_text=_('Is this categorization publicly visible.'),
     )
 
+    product_count = models.PositiveIntegerField(
+        _('Product count'),
+        default=0,
+        editable=False,
+        help_text=_('Number of active products in this categorization, updated automatically.'),
+    )
+
+    total_product_count = models.PositiveIntegerField(
+        _('Total product count'),
+        default=0,
+        editable=False,
+        help_text=_('Number of active products in this categorization and it\'s descendants, updated automatically.'),
+    )
+
     created_at = models.DateTimeField(
         _('Created at'),
         auto_now_add=True,
@@ -114,12 +171,24 @@ class CategorizationModel(TranslatableModelMixin, MPTTModel):
 
     objects = CategorizationManager()
 
+    # Pairs of fields and their stored effective values inherited down the tree.
+    effective_fields = [('_featured_image', 'effective_featured_image')]
+
     class Meta:
         abstract = True
 
     def __str__(self):
         return self.safe_translation_getter('name', any_language=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(CategorizationModel, cls).from_db(db, field_names, values)
+        if 'parent' in field_names or 'parent_id' in field_names:
+            instance._original_parent_id = instance.parent_id
+        if 'active' in field_names:
+            instance._original_active = instance.active
+        return instance
+
     def get_absolute_url(self, language=None):
         if not language:
             language = get_current_language()  # pragma: no cover
@@ -136,16 +205,81 @@ class CategorizationModel(TranslatableModelMixin, MPTTModel):
         """
         Returns ful url path for categorization object.
         """
-        path = []
-        for obj in self.get_ancestors(include_self=True):
-            path.append(obj.safe_translation_getter('slug', ''))
-        return '/'.join(path)
+        return self.safe_translation_getter('path', '')
+
+    def update_paths(self):
+        """
+        Updates stored paths of this node and it's descendants in all
+        languages, built from the stored paths of the parent. Returns a
+        dictionary of changed paths by translation id.
+        """
+        translations = self._parler_meta.root_model.objects
+        nodes = list(self.get_descendants(include_self=True).values_list('id', 'parent_id'))
+        ids = [x[0] for x in nodes] + ([self.parent_id] if self.parent_id else [])
+        paths, rows = defaultdict(dict), defaultdict(list)
+        for pk, master_id, language, slug, path in translations.filter(master_id__in=ids).values_list(
+                'id', 'master_id', 'language_code', 'slug', 'path'):
+            if master_id == self.parent_id:
+                paths[master_id][language] = path
+            else:
+                rows[master_id].append((pk, language, slug, path))
+
+        changed, keys = {}, []
+        for node_id, parent_id in nodes:
+            for pk, language, slug, path in rows[node_id]:
+                paths[node_id][language] = join_path(paths[parent_id] if parent_id else None, language, slug)
+                if paths[node_id][language] != path:
+                    changed[pk] = paths[node_id][language]
+                    keys.append(get_translation_cache_key(translations.model, node_id, language))
+        for pk, path in changed.items():
+            translations.filter(pk=pk).update(path=path)
+        # Bulk updates skip parler's translation cache.
+        cache.delete_many(keys)
+
+        # Update translations already loaded on this instance.
+        for translation in getattr(self, '_translations_cache', {}).get(translations.model, {}).values():
+            if isinstance(translation, translations.model) and translation.pk in changed:
+                translation.path = changed[translation.pk]
+        return changed
+
+    def update_effective_fields(self):
+        """
+        Updates stored effective values of this node and it's descendants,
+        a value is inherited from the closest ancestor when not set on a
+        node. Nodes are updated in a query per distinct value.
+        """
+        model = self._meta.model
+        names = [x for pair in self.effective_fields for x in pair]
+        inherited = {}
+        if self.parent_id:
+            inherited[self.parent_id] = model.objects.filter(pk=self.parent_id).\
+                values_list(*[x[1] for x in self.effective_fields]).first()
+
+        updates = defaultdict(list)
+        for row in self.get_descendants(include_self=True).values_list('id', 'parent_id', *names):
+            pk, parent_values, effective = row[0], inherited.get(row[1], None), []
+            for i, (field, effective_field) in enumerate(self.effective_fields):
+                value = row[2 + i * 2]
+                if value is None and parent_values is not None:
+                    value = parent_values[i]
+                if value != row[3 + i * 2]:
+                    updates[(effective_field, value)].append(pk)
+                effective.append(value)
+            inherited[pk] = effective
+        for (field, value), ids in updates.items():
+            model.objects.filter(id__in=ids).update(**{field: value})
+
+        # Update values already loaded on this instance.
+        for i, (field, effective_field) in enumerate(self.effective_fields):
+            field = self._meta.get_field(effective_field)
+            if getattr(self, field.attname) != inherited[self.pk][i]:
+                setattr(self, field.attname, inherited[self.pk][i])
+                if hasattr(self, field.get_cache_name()):
+                    delattr(self, field.get_cache_name())
 
     @property
     def featured_image(self):
-        if not self._featured_image and self.is_child_node():
-            return self.parent.featured_image
-        return self._featured_image
+        return self._featured_image or self.effective_featured_image
 
     @featured_image.setter
     def featured_image(self, value):
@@ -153,13 +287,12 @@ class CategorizationModel(TranslatableModelMixin, MPTTModel):
 
     def get_products(self):
         """
-        Returns active products from this categorization
+        Returns active products from this categorization and it's
+        descendants.
         """
         products = getattr(self, '_products', None)
         if products is None:
-            products = self.product_set.active()
-            for child in self.get_descendants():
-                products = products | child.product_set.active()
+            products = self.product_set.model.objects.active().in_subtree(self)
             setattr(self, '_products', products)
         return products
 
@@ -202,17 +335,35 @@ class Category(CategorizationModel):
         help_text=_("Tax to be applied to products in this category. If empty, parent's tax will be used."),
     )
 
+    effective_tax = models.ForeignKey(
+        Tax,
+        models.SET_NULL,
+        blank=True,
+        null=True,
+        editable=False,
+        related_name='+',
+        verbose_name=_('Effective tax'),
+        help_text=_('Tax of this category or the one inherited from ancestors, updated automatically.'),
+    )
+
+    effective_fields = CategorizationModel.effective_fields + [('_tax', 'effective_tax')]
+
     class Meta:
         db_table = 'shopit_categories'
         verbose_name = _('Category')
         verbose_name_plural = _('Categories')
         ordering = ['tree_id', 'lft']
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Category, cls).from_db(db, field_names, values)
+        if '_tax' in field_names or '_tax_id' in field_names:
+            instance._original_tax_id = instance._tax_id
+        return instance
+
     @property
     def tax(self):
-        if not self._tax and self.parent:
-            return self.parent.tax
-        return self._tax
+        return self._tax or self.effective_tax
 
     @tax.setter
     def tax(self, value):
@@ -76,6 +76,20 @@ class Flag(TranslatableModelMixin, MPTTModel):
         help_text=_('Is this flag publicly visible.'),
     )
 
+    product_count = models.PositiveIntegerField(
+        _('Product count'),
+        default=0,
+        editable=False,
+        help_text=_('Number of active products in this flag, updated automatically.'),
+    )
+
+    total_product_count = models.PositiveIntegerField(
+        _('Total product count'),
+        default=0,
+        editable=False,
+        help_text=_('Number of active products in this flag and it\'s descendants, updated automatically.'),
+    )
+
     created_at = models.DateTimeField(
         _('Created at'),
         auto_now_add=True,
@@ -98,6 +112,13 @@ class Flag(TranslatableModelMixin, MPTTModel):
         name = self.safe_translation_getter('name', any_language=True)
         return '%s | %s' % (smart_text(self.parent), name) if self.parent else name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Flag, cls).from_db(db, field_names, values)
+        if 'parent' in field_names or 'parent_id' in field_names:
+            instance._original_parent_id = instance.parent_id
+        return instance
+
     def get_products(self):
         """
         Returs all flagged products with this flag.
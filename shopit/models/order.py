@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals
 
+from django.core.exceptions import ValidationError
 from django.core.urlresolvers import NoReverseMatch, reverse
 from django.db import models
 from django.utils import timezone
@@ -10,6 +11,8 @@ from django_fsm import transition
 from shop.models.order import BaseOrder, BaseOrderItem
 from shop.models.order import OrderManager as OrderManagerBase
 
+from shopit.utils import get_error_message as em
+
 
 class OrderManager(OrderManagerBase):
     def get_summary_url(self):
@@ -136,5 +139,11 @@ class OrderItem(BaseOrderItem):
         return self.product_name
 
     def populate_from_cart_item(self, cart_item, request):
+        """
+        Takes the quantity from stock, raises `ValidationError` when it's
+        no longer available so that the order is not created.
+        """
         self.product_code = cart_item.product.product_code
         super(OrderItem, self).populate_from_cart_item(cart_item, request)
+        if not cart_item.product.decrement_quantity(cart_item.quantity):
+            raise ValidationError(em('product_out_of_stock'))
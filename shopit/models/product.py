@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals
 
-import itertools
-from collections import OrderedDict
-from datetime import datetime
+import calendar
+import operator
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
 from decimal import Decimal
+from functools import reduce
 from os.path import basename
 
 from cms.models.fields import PlaceholderField
@@ -14,7 +16,7 @@ from django.core.exceptions import ValidationError
 from django.core.urlresolvers import NoReverseMatch, reverse
 from django.core.validators import MinValueValidator
 from django.db import models, transaction
-from django.db.models import Count
+from django.db.models import Case, Count, F, Max, OuterRef, Q, Subquery, Sum, Value, When
 from django.db.models.query import QuerySet
 from django.template.defaultfilters import truncatewords
 from django.utils import timezone
@@ -31,18 +33,31 @@ from mptt.fields import TreeForeignKey
 from parler.managers import TranslatableManager, TranslatableQuerySet
 from parler.models import TranslatableModel, TranslatedFields
 from parler.utils.context import switch_language
+from parler.utils.i18n import get_active_language_choices
 from polymorphic.query import PolymorphicQuerySet
+from shop.models.fields import JSONField
 from shop.models.product import BaseProduct, BaseProductManager
+from shop.money import Money
 from shop.money.fields import MoneyField
 
+from shopit.cache import bump_catalog_version
 from shopit.conf import app_settings
+from shopit.counts import COUNTED_PRODUCT_FIELDS, get_counted_state
+from shopit.facets import (ATTRIBUTE, BRAND, CATEGORY, FLAG, MANUFACTURER, MODIFIER, PRICE, count_bitmap,
+                           format_facet_counts, from_bitmap, get_facet_index, get_price_bucket_expression,
+                           to_bitmap, update_facet_index)
 from shopit.models.cart import Cart
 from shopit.models.categorization import Brand, Category, Manufacturer
 from shopit.models.customer import Customer
 from shopit.models.flag import Flag
 from shopit.models.modifier import Modifier
 from shopit.models.tax import Tax
+from shopit.planner import cached_queryset, load_attachments
+from shopit.pricing import get_prices
+from shopit.search import index_products, tokenize
+from shopit.snapshots import get_snapshots
 from shopit.utils import get_error_message as em
+from shopit.variants import get_variant_index, invalidate_variant_index
 
 try:
     from easy_thumbnails.files import get_thumbnailer
@@ -52,6 +67,17 @@ except ImportError:  # pragma: no cover
     EASY_THUMBNAILS = False
 
 
+# Product attributes read from an attached snapshot.
+SNAPSHOT_ATTRS = ['caption', 'description', 'unit_price', 'discount', 'width', 'height', 'depth', 'weight']
+
+
+def get_timestamp(value):
+    """
+    Returns a unix timestamp in seconds for the given aware datetime.
+    """
+    return calendar.timegm(value.utctimetuple())
+
+
 class ProductQuerySet(PolymorphicQuerySet, TranslatableQuerySet):
     def active(self):
         return self.filter(active=True)
@@ -59,6 +85,18 @@ class ProductQuerySet(PolymorphicQuerySet, TranslatableQuerySet):
     def top_level(self):
         return self.filter(kind__in=[Product.SINGLE, Product.GROUP])
 
+    def in_subtree(self, node):
+        """
+        Filters products by the given categorization and it's descendants
+        in a single join on the `tree_id`, `lft` and `rght` range.
+        """
+        prefix, opts = '_%s__' % node._meta.model_name, node._mptt_meta
+        return self.filter(**{
+            prefix + opts.tree_id_attr: getattr(node, opts.tree_id_attr),
+            prefix + opts.left_attr + '__gte': getattr(node, opts.left_attr),
+            prefix + opts.right_attr + '__lte': getattr(node, opts.right_attr),
+        })
+
     def filter_categorization(self, categories=None, brands=None, manufacturers=None):
         """
         Filters a queryset by the given categorization. A list of slugs should
@@ -79,13 +117,13 @@ class ProductQuerySet(PolymorphicQuerySet, TranslatableQuerySet):
     def filter_flags(self, flags=None):
         """
         Filters a queryset by the given flags. A list of codes should be
-        passed in.
+        passed in. Inherited flags and their ancestors are matched.
         """
         filters = {}
         if flags:
-            flagged = self.prefetch_related('flags').filter(flags__code__in=flags)
-            flagged = flagged.annotate(num_flags=Count('flags')).filter(num_flags=len(flags)).distinct()
-            filters['id__in'] = flagged.values_list('id', flat=True)
+            flagged = EffectiveFlag.objects.filter(flag__code__in=set(flags)).values('product_id')
+            flagged = flagged.annotate(num_flags=Count('flag_id')).filter(num_flags=len(set(flags)))
+            filters['id__in'] = flagged.values('product_id')
         return self.filter(**filters) if filters else self
 
     def filter_modifiers(self, modifiers=None):
@@ -95,8 +133,7 @@ class ProductQuerySet(PolymorphicQuerySet, TranslatableQuerySet):
         """
         filters = {}
         if modifiers:
-            enabled = Modifier.objects.filtering_enabled().active().values_list('code', flat=True)
-            if len([x for x in modifiers if x in enabled]) < len(modifiers):
+            if not self._modifiers_filtering_enabled(modifiers):
                 # Return empty queryset if invalid modifiers are passed in.
                 return self.none()
 
@@ -111,37 +148,140 @@ class ProductQuerySet(PolymorphicQuerySet, TranslatableQuerySet):
         code, name should be passed in as `attributes`.
         """
         if attributes:
-            ids = self.values_list('id', flat=True)
-            variants = Product.objects.filter(group_id__in=ids).\
-                prefetch_related('attribute_values', 'attribute_values__attribute', 'attribute_values__choice')
-
-            if variants:
-                for code, value in attributes:
-                    filters = {'attribute_values__attribute__code__iexact': code}
-                    if value:
-                        filters['attribute_values__choice__value__iexact'] = value
-                    else:
-                        filters['attribute_values__choice__isnull'] = True
-                    variants = variants.filter(**filters)
-
-                group_ids = list(set(variants.values_list('group_id', flat=True)))
-                self = self.filter(id__in=group_ids)
-
-                if app_settings.FILTER_ATTRIBUTES_INCLUDES_VARIANTS:
-                    self = (variants | self).order_by('-order', 'kind', 'published')
+            signatures = AttributeSignature.objects.filter_attributes(attributes)
+            groups = self.filter(id__in=signatures.values('group_id'))
+            if app_settings.FILTER_ATTRIBUTES_INCLUDES_VARIANTS:
+                variants = Product.objects.filter(id__in=signatures.values('variant_id'), group__in=self.values('id'))
+                return (variants | groups).order_by('-order', 'kind', 'published')
+            return groups
         return self
 
     def filter_price(self, price_from=None, price_to=None):
         """
-        Filters a queryset by a price range.
+        Filters a queryset by a price range. Stored `effective_price` is used
+        so that the results match the price customers see.
         """
         filters = {}
         if price_from:
-            filters['_unit_price__gte'] = Decimal(price_from)
+            filters['effective_price__gte'] = Decimal(price_from)
         if price_to:
-            filters['_unit_price__lte'] = Decimal(price_to)
+            filters['effective_price__lte'] = Decimal(price_to)
         return self.filter(**filters) if filters else self
 
+    def filter_facets(self, categories=None, brands=None, manufacturers=None, flags=None, modifiers=None,
+                      attributes=None, price_from=None, price_to=None):
+        """
+        Filters a queryset by all of the facets at once. When `FACET_INDEX`
+        is enabled, bitmaps from the facet index are intersected and a single
+        `id__in` filter is applied. Otherwise `filter_*` methods are chained.
+        """
+        if not app_settings.FACET_INDEX or (attributes and app_settings.FILTER_ATTRIBUTES_INCLUDES_VARIANTS):
+            return self.filter_categorization(categories, brands, manufacturers).filter_flags(flags).\
+                filter_modifiers(modifiers).filter_attributes(attributes).filter_price(price_from, price_to)
+
+        if modifiers and not self._modifiers_filtering_enabled(modifiers):
+            return self.none()
+
+        bitmap = get_facet_index().filter(
+            categories, brands, manufacturers, flags, modifiers, attributes, price_from, price_to)
+        return self.filter(id__in=from_bitmap(bitmap)).filter_price(price_from, price_to)
+
+    def search(self, query):
+        """
+        Filters a queryset by the given search query using the search index,
+        products are annotated with `search_rank`. Returns an empty queryset
+        when the query has no terms.
+        """
+        if not tokenize(query):
+            return self.none().annotate(search_rank=Value(0, output_field=models.IntegerField()))
+        # Rank is summed without the match filter, an aggregate filter in a subquery would group the outer query.
+        ranks = SearchTerm.objects.matching(tokenize(query)).filter(product_id=OuterRef('pk'))
+        ranks = ranks.values('product_id').annotate(rank=Sum('weight')).values('rank')
+        rank = Subquery(ranks[:1], output_field=models.IntegerField())
+        return self.filter(id__in=SearchTerm.objects.search(query).values('product_id')).annotate(search_rank=rank)
+
+    def get_facet_counts(self):
+        """
+        Returns number of products in this queryset for every category,
+        brand, manufacturer, flag, filtering enabled modifier, attribute
+        choice and price bucket. Counts are read from the facet index when
+        `FACET_INDEX` is enabled, otherwise grouped aggregates are used.
+        """
+        ids = self.order_by().values('id')
+        modifiers = Modifier.objects.filtering_enabled().active()
+
+        if app_settings.FACET_INDEX:
+            bitmap = to_bitmap(ids.values_list('id', flat=True))
+            counts = get_facet_index().count(bitmap, set(modifiers.values_list('code', flat=True)))
+            return format_facet_counts(counts, count_bitmap(bitmap))
+
+        products = Product.objects.filter(id__in=ids).order_by()
+        counts = {}
+        for facet, field in [(CATEGORY, '_category_id'), (BRAND, '_brand_id'), (MANUFACTURER, '_manufacturer_id')]:
+            for row in products.exclude(**{field: None}).values(field).annotate(num=Count('id')):
+                counts[(facet, row[field])] = row['num']
+
+        flags = EffectiveFlag.objects.filter(product_id__in=ids)
+        for row in flags.values('flag__code').annotate(num=Count('product_id')).order_by():
+            counts[(FLAG, row['flag__code'])] = row['num']
+
+        mods = Product.modifiers.through.objects.filter(product_id__in=ids, modifier_id__in=modifiers.values('id'))
+        for row in mods.values('modifier__code').annotate(num=Count('product_id')).order_by():
+            counts[(MODIFIER, row['modifier__code'])] = row['num']
+
+        signatures = AttributeSignature.objects.filter(group_id__in=ids)
+        for row in signatures.values('code', 'value').annotate(num=Count('group_id', distinct=True)).order_by():
+            counts[(ATTRIBUTE, row['code'], row['value'])] = row['num']
+
+        counts.update(self._get_price_counts(products))
+        return format_facet_counts(counts, products.count())
+
+    def _get_price_counts(self, products):
+        """
+        Returns counts for price buckets of the given products, grouped by
+        the bucket number in a single query.
+        """
+        rows = products.order_by().values(bucket=get_price_bucket_expression()).annotate(num=Count('id'))
+        return dict(((PRICE, int(x['bucket'])), x['num']) for x in rows if x['num'])
+
+    def update_effective_prices(self):
+        """
+        Recomputes and stores `effective_price` for products in this queryset
+        and variants of the groups in it. Rows are updated in batches and
+        only when the price has changed.
+        """
+        products = Product.objects.filter(Q(id__in=self.values('id')) | Q(group_id__in=self.values('id')))
+        current = dict(products.values_list('id', 'effective_price'))
+        places = Decimal(10) ** -Product._meta.get_field('effective_price').decimal_places
+        prices = {}
+        for pk, item in get_prices(products).items():
+            price = Money(item.price.quantize(places))
+            if price != current.get(pk, None):
+                prices[pk] = price
+
+        prices = list(prices.items())
+        for i in range(0, len(prices), 500):
+            whens = [When(pk=pk, then=Value(Decimal(price))) for pk, price in prices[i:i + 500]]
+            Product.objects.filter(pk__in=[x[0] for x in prices[i:i + 500]]).\
+                update(effective_price=Case(*whens, output_field=models.DecimalField()))
+
+    def allocate_order(self, published):
+        """
+        Returns an unused `order` value for the given published datetime, a
+        timestamp in milliseconds incremented while taken. Allocations are
+        serialized by locking the `ProductOrderLock` row, which exists even
+        when the range is empty. Should be called inside a transaction.
+        """
+        ProductOrderLock.objects.select_for_update().get_or_create(pk=ProductOrderLock.PK)
+        timestamp = get_timestamp(published) * 1000
+        latest = self.filter(order__gte=timestamp, order__lt=timestamp + 1000).\
+            order_by('-order').values_list('order', flat=True).first()
+        return latest + 1 if latest is not None else timestamp
+
+    def _modifiers_filtering_enabled(self, modifiers):
+        enabled = Modifier.objects.filtering_enabled().active().values_list('code', flat=True)
+        return len([x for x in modifiers if x in enabled]) == len(modifiers)
+
 
 class ProductManager(BaseProductManager, TranslatableManager):
     queryset_class = ProductQuerySet
@@ -152,6 +292,9 @@ class ProductManager(BaseProductManager, TranslatableManager):
     def top_level(self):
         return self.get_queryset().top_level()
 
+    def in_subtree(self, node):
+        return self.get_queryset().in_subtree(node)
+
     def filter_categorization(self, categories=None, brands=None, manufacturers=None):
         return self.get_queryset().filter_categorization(categories, brands, manufacturers)
 
@@ -167,6 +310,23 @@ class ProductManager(BaseProductManager, TranslatableManager):
     def filter_attributes(self, attributes=None):
         return self.get_queryset().filter_attributes(attributes)
 
+    def filter_facets(self, categories=None, brands=None, manufacturers=None, flags=None, modifiers=None,
+                      attributes=None, price_from=None, price_to=None):
+        return self.get_queryset().filter_facets(
+            categories, brands, manufacturers, flags, modifiers, attributes, price_from, price_to)
+
+    def search(self, query):
+        return self.get_queryset().search(query)
+
+    def get_facet_counts(self):
+        return self.get_queryset().get_facet_counts()
+
+    def update_effective_prices(self):
+        return self.get_queryset().update_effective_prices()
+
+    def allocate_order(self, published):
+        return self.get_queryset().allocate_order(published)
+
 
 @python_2_unicode_compatible
 class Product(BaseProduct, TranslatableModel):
@@ -181,6 +341,12 @@ class Product(BaseProduct, TranslatableModel):
         (VARIANT, _('Variant')),
     )
 
+    # Number of combinations loaded at once in `iter_combinations`.
+    COMBINATIONS_CHUNK_SIZE = 100
+
+    # Number of variants inserted at once in `create_all_variants`.
+    CREATE_VARIANTS_BATCH_SIZE = 500
+
     translations = TranslatedFields(
         name=models.CharField(
             _('Name'),
@@ -268,6 +434,14 @@ class Product(BaseProduct, TranslatableModel):
         ),
     )
 
+    effective_price = MoneyField(
+        _('Effective price'),
+        default=0,
+        db_index=True,
+        editable=False,
+        help_text=_("Price with discount and tax calculated, used when filtering and sorting products."),
+    )
+
     # Settings
     kind = models.PositiveSmallIntegerField(
         _('Kind'),
@@ -374,6 +548,7 @@ class Product(BaseProduct, TranslatableModel):
     order = models.BigIntegerField(
         _('Sort'),
         default=0,
+        db_index=True,
     )
 
     content = PlaceholderField('shopit_product_content')
@@ -393,14 +568,23 @@ class Product(BaseProduct, TranslatableModel):
 
     def save(self, *args, **kwargs):
         """
-        Clean and clear product.
+        Clean and clear product, store the effective price.
         Set unique ordering value for product and it's variants based on
         published timestamp. Force Single groups to a Group kind.
         """
+        # Decimals can be passed in as strings, convert them before computing the price.
+        for field in self._meta.concrete_fields:
+            value = getattr(self, field.attname)
+            if isinstance(field, models.DecimalField) and value is not None:
+                setattr(self, field.attname, field.to_python(value))
         self.clean()
         self.clear()
+        self.effective_price = self.get_effective_price()
+        self.clear()
         if self.is_variant:
-            self.group.clear('_variants', '_invalid_variants', '_variations', '_attribute_choices', '_combinations')
+            self.group.clear(
+                '_variants', '_invalid_variants', '_invalid_variant_ids', '_variations', '_attribute_choices',
+                '_combinations')
             self.order = self.group.order
             if self.group.is_single:
                 self.group.kind = Product.GROUP
@@ -408,21 +592,27 @@ class Product(BaseProduct, TranslatableModel):
             super(Product, self).save(*args, **kwargs)
         else:
             # Don't generate timestamp if published hasn't changed.
-            if self.pk is not None:
-                original = Product.objects.get(pk=self.pk).published.strftime('%s')
-                if original == self.published.strftime('%s'):
-                    super(Product, self).save(*args, **kwargs)
-                    return
-            timestamp = int(self.published.strftime('%s'))
-            same = Product.objects.filter(order__startswith=timestamp).first()
-            timestamp = same.order + 1 if same else timestamp * 1000
-            self.order = timestamp
-            super(Product, self).save(*args, **kwargs)
-            if self.is_group:
-                for variant in self.get_variants():
-                    variant.clear()
-                    variant.order = timestamp
-                    variant.save(update_fields=['order'])
+            original = getattr(self, '_original_published', None)
+            if self.pk is not None and original is None:
+                original = Product.objects.filter(pk=self.pk).values_list('published', flat=True).first()
+            if original is not None and get_timestamp(original) == get_timestamp(self.published):
+                super(Product, self).save(*args, **kwargs)
+                return
+            with transaction.atomic():
+                self.order = Product.objects.allocate_order(self.published)
+                super(Product, self).save(*args, **kwargs)
+                if self.is_group:
+                    self.variants.update(order=self.order)
+            self._original_published = self.published
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Product, cls).from_db(db, field_names, values)
+        if 'published' in field_names:
+            instance._original_published = instance.published
+        if all(x in field_names for x in COUNTED_PRODUCT_FIELDS):
+            instance._original_counted_state = get_counted_state(instance)
+        return instance
 
     def get_absolute_url(self, language=None):
         if not language:
@@ -568,6 +758,9 @@ class Product(BaseProduct, TranslatableModel):
 
     @property
     def tax_percent(self):
+        snapshot = self.get_attached_snapshot()
+        if snapshot is not None:
+            return snapshot.tax_percent
         return getattr(self.tax, 'percent', Decimal('0.00'))
 
     @property
@@ -580,22 +773,20 @@ class Product(BaseProduct, TranslatableModel):
 
     @property
     def primary_image(self):
-        return self.images.first()
+        images = self.images
+        return images[0] if images else None
 
-    @cached_property
+    @property
     def images(self):
-        images = self.attachments.filter(kind=Attachment.IMAGE)
-        return images or (self.group.images if self.is_variant else images)
+        return self.get_attachment_objects()[Attachment.IMAGE]
 
-    @cached_property
+    @property
     def videos(self):
-        videos = self.attachments.filter(kind=Attachment.VIDEO)
-        return videos or (self.group.videos if self.is_variant else videos)
+        return self.get_attachment_objects()[Attachment.VIDEO]
 
-    @cached_property
+    @property
     def files(self):
-        files = self.attachments.filter(kind=Attachment.FILE)
-        return files or (self.group.files if self.is_variant else files)
+        return self.get_attachment_objects()[Attachment.FILE]
 
     def get_price(self, request=None):
         """
@@ -603,18 +794,37 @@ class Product(BaseProduct, TranslatableModel):
         """
         return self.unit_price - self.discount_amount + self.tax_amount
 
+    def get_effective_price(self):
+        """
+        Returns price rounded to currency decimal places, as it's stored
+        in `effective_price` field.
+        """
+        places = self._meta.get_field('effective_price').decimal_places
+        return Money(Decimal(self.get_price()).quantize(Decimal(10) ** -places))
+
     def get_availability(self, request=None):
         """
         Returns product availibility as list of tuples `(quantity, until)`
-        Method is not yet implemented in django-shop.
+        Method is not yet implemented in django-shop. Quantity held for
+        other carts is subtracted.
         """
         availability = self.quantity if self.quantity is not None else True
         if self.is_group:
             availability = 0
-        elif self.is_variant and self not in self.group.get_variants():
+        elif self.is_variant and self.pk not in self.group.get_variant_index().valid:
             availability = 0
+        elif self.quantity is not None:
+            cart = Cart.objects.get_or_create_from_request(request) if request else None
+            availability -= self.get_reserved_quantity(cart)
         return [(availability, datetime.max)]
 
+    def get_reserved_quantity(self, cart=None):
+        """
+        Returns quantity held by active reservations, excluding the ones
+        made for the given cart.
+        """
+        return StockReservation.objects.get_reserved([self.pk], cart).get(self.pk, 0)
+
     def is_available(self, quantity=1, request=None):
         """
         Returns if product is available for the given quantity. If request
@@ -624,51 +834,68 @@ class Product(BaseProduct, TranslatableModel):
             cart = Cart.objects.get_or_create_from_request(request)
             cart_item = self.is_in_cart(cart)
             quantity += cart_item.quantity if cart_item else 0
+        return self._get_available(quantity, request)
 
+    def _get_available(self, quantity, request=None):
         now = timezone.now().replace(tzinfo=None)
         number, until = self.get_availability(request)[0]
         number = 100000 if number is True else number
         available = number >= quantity and now < until
         return available, int(number - quantity)
 
-    def get_modifiers(self, distinct=True):
+    def reserve(self, quantity, request):
+        """
+        Holds the given total quantity of this product for the cart from
+        request, if it's available. Product row is locked while checking
+        so that concurrent reservations can't oversell. Returns a tuple
+        `(available, diff)` same as `is_available`.
+        """
+        cart = Cart.objects.get_or_create_from_request(request)
+        with transaction.atomic():
+            if self.quantity is not None:
+                self.quantity = Product.objects.select_for_update().filter(pk=self.pk).\
+                    values_list('quantity', flat=True).get()
+            available, diff = self._get_available(quantity, request)
+            if available and self.quantity is not None:
+                StockReservation.objects.hold(self, cart, quantity)
+        return available, diff
+
+    def decrement_quantity(self, quantity):
+        """
+        Atomically decrements quantity in stock, used when product is
+        purchased. Returns `False` when there isn't enough in stock.
+        Products without quantity are always decremented.
+        """
+        if self.quantity is None:
+            return True
+        updated = Product.objects.filter(pk=self.pk, quantity__gte=quantity).update(quantity=F('quantity') - quantity)
+        if updated:
+            self.quantity = self.quantity - quantity
+        return bool(updated)
+
+    def get_modifiers(self):
         """
-        Returns all modifiers for this product.
-        Collects categorization and group modifiers.
+        Returns all active modifiers for this product, including the
+        categorization and group modifiers. Read from `EffectiveModifier`.
         """
         mods = getattr(self, '_mods', None)
         if mods is None:
-            mods = self.modifiers.active()
-            if self.is_variant:
-                mods = mods | self.group.get_modifiers(distinct=False)
-            else:
-                if self.category:
-                    mods = mods | self.category.get_modifiers(distinct=False)
-                if self.brand:
-                    mods = mods | self.brand.get_modifiers(distinct=False)
-                if self.manufacturer:
-                    mods = mods | self.manufacturer.get_modifiers(distinct=False)
+            mods = Modifier.objects.active().filter(
+                id__in=EffectiveModifier.objects.filter(product_id=self.pk).values('modifier_id'))
             self.cache('_mods', mods)
-        return mods.distinct() if distinct else mods
+        return mods
 
-    def get_flags(self, distinct=True):
+    def get_flags(self):
         """
-        Returns all flags for this product.
-        Collects categorization and group flags.
+        Returns all active flags for this product, including the
+        categorization and group flags. Read from `EffectiveFlag`.
         """
         flags = getattr(self, '_flags', None)
         if flags is None:
-            flags = self.flags.active()
-            if self.is_variant:
-                flags = flags | self.group.get_flags(distinct=False)
-            if self.category:
-                flags = flags | self.category.get_flags(distinct=False)
-            if self.brand:
-                flags = flags | self.brand.get_flags(distinct=False)
-            if self.manufacturer:
-                flags = flags | self.manufacturer.get_flags(distinct=False)
+            flags = Flag.objects.active().filter(
+                id__in=EffectiveFlag.objects.filter(product_id=self.pk, is_ancestor=False).values('flag_id'))
             self.cache('_flags', flags)
-        return flags.distinct() if distinct else flags
+        return flags
 
     def get_available_attributes(self):
         """
@@ -687,7 +914,10 @@ class Product(BaseProduct, TranslatableModel):
         if self.is_variant:
             attrs = getattr(self, '_attributes', OrderedDict())
             if not attrs:
-                for value in self.attribute_values.select_related('attribute'):
+                values = self.attribute_values.all()
+                if 'attribute_values' not in getattr(self, '_prefetched_objects_cache', {}):
+                    values = values.select_related('attribute')
+                for value in values:
                     attrs[value.attribute.key] = value.as_dict
                 self.cache('_attributes', attrs)
             return attrs
@@ -699,10 +929,10 @@ class Product(BaseProduct, TranslatableModel):
         if self.is_group:
             variants = getattr(self, '_variants', None)
             if variants is None:
-                variants = self.variants.all()
-                invalid = [x.pk for x in self.get_invalid_variants()]
-                variants = self.variants.exclude(pk__in=invalid)
+                index = self.get_variant_index()
+                variants = self.variants.filter(pk__in=index.valid)
                 self.cache('_variants', variants)
+                self.cache('_invalid_variant_ids', index.invalid)
             return variants
 
     def get_invalid_variants(self):
@@ -712,26 +942,30 @@ class Product(BaseProduct, TranslatableModel):
         """
         if self.is_group:
             if not hasattr(self, '_invalid_variants'):
-                invalid = []
-                valid_attrs = []  # Keep track of valid attrs to check for duplicates.
-                codes = sorted(self.get_available_attributes().values_list('code', flat=True))
-                for variant in self.variants.all():
-                    attrs = variant.get_attributes()
-                    if (attrs in valid_attrs or sorted(x['code'] for x in attrs.values()) != codes or
-                            True in [not x['nullable'] and x['value'] == '' for x in attrs.values()]):
-                        invalid.append(variant)
-                    else:
-                        valid_attrs.append(attrs)
-                self.cache('_invalid_variants', invalid)
+                ids = getattr(self, '_invalid_variant_ids', None)
+                if ids is None:
+                    ids = self.get_variant_index().invalid
+                self.cache('_invalid_variants', list(self.variants.filter(pk__in=ids)))
             return getattr(self, '_invalid_variants')
 
+    def get_variant_index(self):
+        """
+        Returns a `VariantIndex` for a Group product, used to look up
+        variants by their attributes. Index is not cached on the instance
+        so that it's never stale.
+        """
+        if self.is_group:
+            return get_variant_index(self)
+
     def get_variations(self):
         """
         Returns a list of tuples containing a variant id and it's attributes.
         """
         if self.is_group:
             if not hasattr(self, '_variations'):
-                variations = [(x.pk, x.get_attributes()) for x in self.get_variants()]
+                variants = self.get_variants().prefetch_related(
+                    'attribute_values__attribute', 'attribute_values__choice')
+                variations = [(x.pk, x.get_attributes()) for x in variants]
                 self.cache('_variations', variations)
             return getattr(self, '_variations')
 
@@ -760,41 +994,105 @@ class Product(BaseProduct, TranslatableModel):
         variants with actual variant data. Variants with attributes
         missing or not specified in `Available attributes` will not be
         included. This is used to show possible combinations in admin,
-        as well as creating them automatically.
+        as well as creating them automatically. For groups with many
+        attributes use `iter_combinations` instead.
         """
         if self.is_group:
             if not hasattr(self, '_combinations'):
+                self.cache('_combinations', list(self.iter_combinations()))
+            return getattr(self, '_combinations')
+
+    def get_combination_values(self):
+        """
+        Returns a list of attribute values lists, one for each available
+        attribute with choices. Combinations are a product of these lists.
+        """
+        if self.is_group:
+            if not hasattr(self, '_combination_values'):
                 values = []
                 for attr in self.get_available_attributes():
                     vals = [AttributeValue(attribute=attr, choice=x) for x in attr.get_choices()]
                     if vals:
                         values.append(vals)
-                combinations = []
-                if values:
-                    for combo in itertools.product(*values):
-                        attrs = OrderedDict([(x.attribute.code, x.value) for x in combo])
-                        name = self.safe_translation_getter('name', any_language=True)
-                        name = '%s %s' % (name, ' '.join([x.label for x in combo if x.label != '-']))
-                        name = name.rstrip()
-                        slug = slugify(name)
-                        languages = []
-                        variant = self.get_variant(attrs)
-                        if variant:
-                            name = variant.safe_translation_getter('name', name)
-                            slug = variant.safe_translation_getter('slug', slug)
-                            languages = variant.get_available_languages()
-                        combinations.append({
-                            'pk': variant.pk if variant else None,
-                            'name': name,
-                            'slug': slug,
-                            'code': variant.code if variant else None,
-                            'price': variant.get_price() if variant else None,
-                            'quantity': variant.quantity if variant else None,
-                            'languages': languages,
-                            'attributes': OrderedDict([(x.attribute.code, x.as_dict) for x in combo])
-                        })
-                self.cache('_combinations', combinations)
-            return getattr(self, '_combinations')
+                self.cache('_combination_values', values)
+            return getattr(self, '_combination_values')
+
+    def get_combinations_count(self):
+        """
+        Returns number of available Variant combinations for a Group.
+        """
+        if self.is_group:
+            values = self.get_combination_values()
+            return reduce(operator.mul, [len(x) for x in values], 1) if values else 0
+
+    def iter_combinations(self, offset=0, limit=None):
+        """
+        Yields combinations in the same order and format as
+        `get_combinations`, starting at `offset` and stopping after `limit`
+        combinations. Each combination is decoded from it's index, so
+        skipping is free. Existing variants are looked up in the variant
+        index and loaded in bulk for every chunk of combinations.
+        """
+        if not self.is_group:
+            return
+        values = self.get_combination_values()
+        count = self.get_combinations_count()
+        stop = count if limit is None else min(count, offset + limit)
+        variant_index = self.get_variant_index()
+        for start in range(offset, stop, self.COMBINATIONS_CHUNK_SIZE):
+            combos = []
+            for index in range(start, min(stop, start + self.COMBINATIONS_CHUNK_SIZE)):
+                combo = []
+                for vals in reversed(values):
+                    index, i = divmod(index, len(vals))
+                    combo.insert(0, vals[i])
+                combos.append(combo)
+            ids = [variant_index.get(OrderedDict([(x.attribute.code, x.value) for x in c])) for c in combos]
+            variants = self.variants.prefetch_related('translations').in_bulk([x for x in ids if x])
+            for index, (combo, pk) in enumerate(zip(combos, ids), start):
+                yield self._get_combination(index, combo, variants.get(pk))
+
+    def get_combination(self, index):
+        """
+        Returns a single combination with the given index, raises
+        `IndexError` if it doesn't exist.
+        """
+        for combo in self.iter_combinations(index, 1):
+            return combo
+        raise IndexError(index)
+
+    def _get_combination(self, index, combo, variant=None):
+        name = self.safe_translation_getter('name', any_language=True)
+        name = '%s %s' % (name, ' '.join([x.label for x in combo if x.label != '-']))
+        name = name.rstrip()
+        slug = slugify(name)
+        languages = []
+        if variant:
+            variant._group_cache = self
+            name = variant.safe_translation_getter('name', name)
+            slug = variant.safe_translation_getter('slug', slug)
+            languages = variant.get_available_languages()
+        return {
+            'index': index,
+            'pk': variant.pk if variant else None,
+            'name': name,
+            'slug': slug,
+            'code': variant.code if variant else None,
+            'price': variant.get_price() if variant else None,
+            'quantity': variant.quantity if variant else None,
+            'languages': languages,
+            'attributes': OrderedDict([(x.attribute.code, x.as_dict) for x in combo])
+        }
+
+    def get_attachment_objects(self):
+        """
+        Returns a dictionary of attachment lists by kind, loaded in a single
+        query. If Product is a Variant and has no attachments of a kind
+        itself, group attachments are inherited.
+        """
+        if not hasattr(self, '_attachment_objects'):
+            load_attachments([self])
+        return getattr(self, '_attachment_objects')
 
     def get_attachments(self):
         """
@@ -802,15 +1100,9 @@ class Product(BaseProduct, TranslatableModel):
         If Product is a Variant and has not attachments itself,
         group attachemts are inherited.
         """
-        attachments = getattr(self, '_attachments', None)
-        if attachments is None:
-            attachments = {
-                'images': [x.as_dict for x in self.images] or None,
-                'videos': [x.as_dict for x in self.videos] or None,
-                'files': [x.as_dict for x in self.files] or None,
-            }
-            self.cache('_attachments', attachments)
-        return attachments
+        if not hasattr(self, '_attachments'):
+            load_attachments([self])
+        return getattr(self, '_attachments')
 
     def get_relations(self):
         """
@@ -830,7 +1122,7 @@ class Product(BaseProduct, TranslatableModel):
             return self.group.get_related_products(kind)
         relations = self.get_relations()
         if kind is not None:
-            relations = relations.filter(kind=kind)
+            relations = [x for x in relations if x.kind == kind]
         return [x.product for x in relations]
 
     def get_reviews(self, language=None, include_inactive=False):
@@ -845,6 +1137,9 @@ class Product(BaseProduct, TranslatableModel):
                 reviews = self.reviews.active()
                 self.cache('_reviews', reviews)
             if language is not None:
+                if reviews._result_cache is not None:
+                    # Filter loaded reviews without hitting the database.
+                    return cached_queryset(reviews, [x for x in reviews if x.language == language])
                 return reviews.filter(language=language)
             return reviews
 
@@ -854,10 +1149,10 @@ class Product(BaseProduct, TranslatableModel):
         eg. attrs = {'code': 'value', 'code2': 'value2'}
         """
         if self.is_group:
-            for variant in self.get_variants():
-                current = [(x['code'], x['value']) for x in variant.get_attributes().values()]
-                if (sorted(attrs.items()) == sorted(current)):
-                    return variant
+            # Index only holds ids of valid variants.
+            pk = self.get_variant_index().get(attrs)
+            if pk is not None:
+                return self.variants.filter(pk=pk).first()
 
     def filter_variants(self, attrs):
         """
@@ -867,17 +1162,8 @@ class Product(BaseProduct, TranslatableModel):
         eg. attrs = {'code': 'value', 'code2': 'value2'}
         """
         if self.is_group:
-            variants = []
-            for variant in self.get_variants():
-                valid = True
-                current = [(x['code'], x['value']) for x in variant.get_attributes().values()]
-                for attr in attrs.items():
-                    if attr not in current:
-                        valid = False
-                        break
-                if valid:
-                    variants.append(variant)
-            return variants
+            ids = self.get_variant_index().filter(attrs)
+            return list(self.variants.filter(pk__in=ids)) if ids else []
 
     def create_variant(self, combo, language=None):
         """
@@ -913,22 +1199,114 @@ class Product(BaseProduct, TranslatableModel):
     @method_decorator(transaction.atomic)
     def create_all_variants(self, language=None):
         """
-        Creates all missing variants for the group.
+        Creates all missing variants for the group, and translations of the
+        existing ones that are missing in the given language. Variants are
+        created in bulk, in batches of `CREATE_VARIANTS_BATCH_SIZE`.
         """
         if self.is_group:
-            variants = []
+            variants, batch = [], []
             if not language:
                 language = get_current_language()
-            for combo in self.get_combinations():
+            for combo in self.iter_combinations():
                 if not combo['pk'] or language not in combo['languages']:
-                    variants.append(self.create_variant(combo, language=language))
+                    batch.append(combo)
+                if len(batch) == self.CREATE_VARIANTS_BATCH_SIZE:
+                    variants.extend(self.create_variants(batch, language))
+                    batch = []
+            if batch:
+                variants.extend(self.create_variants(batch, language))
+
+            ids = [x.pk for x in variants]
+            AttributeSignature.objects.update_variants(ids)
+            EffectiveModifier.objects.update_products(ids)
+            EffectiveFlag.objects.update_products(ids)
+            index_products([self.pk])
+            invalidate_variant_index([self.pk])
+            update_facet_index([self.pk] + ids)
+            bump_catalog_version()
+            self.clear(
+                '_variants', '_invalid_variants', '_invalid_variant_ids', '_variations', '_attribute_choices',
+                '_combinations')
             return variants
 
+    def create_variants(self, combos, language):
+        """
+        Creates variants for the given list of `combo` objects from the
+        `get_combinations` method using `bulk_create`. Combos of existing
+        variants only get a translation. Slugs and codes are reserved with
+        a query per batch. Signals are not sent, use `create_all_variants`
+        which updates denormalized data for all created variants.
+        """
+        translation_model = Product._parler_meta.root_model
+        slugs = self._reserve_slugs([x['slug'] for x in combos], language)
+        new = [x for x in combos if not x['pk']]
+        variants = []
+        for code in self._reserve_codes(len(new)):
+            variant = Product(code=code, kind=Product.VARIANT, group=self, order=self.order)
+            variant.effective_price = variant.get_effective_price()
+            variant.pre_save_polymorphic()
+            variants.append(variant)
+        Product.objects.bulk_create(variants)
+        ids = dict(Product.objects.filter(code__in=[x.code for x in variants]).values_list('code', 'id'))
+        for variant in variants:
+            variant.pk = ids[variant.code]
+
+        attributes = dict((x.code, x) for x in self.get_available_attributes())
+        values = []
+        for combo, variant in zip(new, variants):
+            for attr_value in combo['attributes'].values():
+                attr = attributes[attr_value['code']]
+                choice_id = None if attr_value['value'] == '' and attr.nullable else attr_value['choice']
+                values.append(AttributeValue(attribute=attr, product_id=variant.pk, choice_id=choice_id))
+        AttributeValue.objects.bulk_create(values)
+
+        created = iter(variants)
+        pks = [x['pk'] or next(created).pk for x in combos]
+        translation_model.objects.bulk_create([
+            translation_model(master_id=pk, language_code=language, name=combo['name'], slug=slug)
+            for pk, combo, slug in zip(pks, combos, slugs)])
+        return list(Product.objects.filter(pk__in=pks))
+
+    def _reserve_slugs(self, slugs, language):
+        """
+        Returns a list of slugs unique in the given language, adding a
+        number suffix to the taken ones.
+        """
+        query = reduce(operator.or_, [Q(slug=x) | Q(slug__startswith='%s-' % x) for x in set(slugs)])
+        taken = Product._parler_meta.root_model.objects.filter(query, language_code=language)
+        taken = set(taken.values_list('slug', flat=True))
+        reserved = []
+        for slug in slugs:
+            candidate, num = slug, 0
+            while candidate in taken:
+                num = num + 1
+                candidate = '%s-%d' % (slug, num)
+            taken.add(candidate)
+            reserved.append(candidate)
+        return reserved
+
+    def _reserve_codes(self, count):
+        """
+        Returns a list of unused numeric codes, starting after the latest
+        product id.
+        """
+        codes = []
+        start = (Product.objects.aggregate(pk=Max('pk'))['pk'] or 0) + 1
+        while len(codes) < count:
+            candidates = [str(x) for x in range(start, start + count - len(codes))]
+            taken = set(Product.objects.filter(code__in=candidates).values_list('code', flat=True))
+            codes.extend(x for x in candidates if x not in taken)
+            start = start + len(candidates)
+        return codes
+
     def get_attr(self, name, case=None, translated=False):
         """
         Returns groups attribute for variants if case is True.
         Caches the attribute.
         """
+        snapshot = self.get_attached_snapshot()
+        if snapshot is not None and name.lstrip('_') in SNAPSHOT_ATTRS:
+            return getattr(snapshot, name.lstrip('_'))
         if not hasattr(self, '_%s' % name):
             attr = self.safe_translation_getter(name) or case if translated else getattr(self, name, case)
             if self.is_variant and attr == case:
@@ -939,6 +1317,24 @@ class Product(BaseProduct, TranslatableModel):
             self.cache('_%s' % name, attr)
         return getattr(self, '_%s' % name)
 
+    def get_snapshot(self, language=None):
+        """
+        Returns an immutable snapshot of resolved product values in the
+        given language, see `shopit.snapshots`.
+        """
+        language = language or self.get_current_language()
+        snapshot = self.get_attached_snapshot(language)
+        return snapshot if snapshot is not None else get_snapshots([self], language)[0]
+
+    def get_attached_snapshot(self, language=None):
+        """
+        Returns a snapshot attached to this instance if it's in the given
+        language, defaults to the current language of the instance.
+        """
+        snapshot = getattr(self, '_snapshot', None)
+        if snapshot is not None and snapshot.language == (language or self.get_current_language()):
+            return snapshot
+
     def cache(self, key, value):
         """
         Used in place of `setattr` to cache an attribute.
@@ -989,6 +1385,21 @@ class Product(BaseProduct, TranslatableModel):
             raise ValidationError(em('not_group_has_variants'))
 
 
+class ProductOrderLock(models.Model):
+    """
+    A single row locked while allocating product `order` values, so that
+    concurrent saves can't allocate the same value. The row with `PK` is
+    created by a migration and holds no data. `ProductManager.allocate_order`
+    locks it with `select_for_update` before reading taken values, so the
+    lock is held until the saving transaction ends. Locking a row that
+    always exists works even when no product is in the timestamp range.
+    """
+    PK = 1
+
+    class Meta:
+        db_table = 'shopit_product_order_lock'
+
+
 class AttributeQuerySet(TranslatableQuerySet):
     def active(self):
         return self.filter(active=True)
@@ -1213,6 +1624,389 @@ class AttributeValue(models.Model):
         return data
 
 
+class AttributeSignatureQuerySet(QuerySet):
+    def filter_attributes(self, attributes):
+        """
+        Returns signatures grouped by variant, matching all of the given
+        attributes. A list of tuples containing attribute code, value should
+        be passed in as `attributes`.
+        """
+        attributes = set((code.lower(), (value or '').lower()) for code, value in attributes)
+        query = reduce(operator.or_, [Q(code=code, value=value) for code, value in attributes])
+        return self.filter(query).values('variant_id', 'group_id').\
+            annotate(num_attrs=Count('code')).filter(num_attrs=len(attributes))
+
+    def update_variants(self, ids):
+        """
+        Re-creates signatures for the given product ids from their
+        attribute values.
+        """
+        self.filter(variant_id__in=ids).delete()
+        values = AttributeValue.objects.filter(product_id__in=ids, product__kind=Product.VARIANT).\
+            values_list('product_id', 'product__group_id', 'attribute__code', 'choice__value')
+        self.bulk_create([
+            AttributeSignature(variant_id=pk, group_id=group_id, code=code.lower(), value=(value or '').lower())
+            for pk, group_id, code, value in values if group_id])
+
+
+class AttributeSignature(models.Model):
+    """
+    Denormalized variant attributes used for filtering. Codes and values
+    are stored lowercase and kept in sync with `AttributeValue`.
+    """
+    group = models.ForeignKey(
+        Product,
+        models.CASCADE,
+        related_name='+',
+        editable=False,
+    )
+
+    variant = models.ForeignKey(
+        Product,
+        models.CASCADE,
+        related_name='attribute_signatures',
+        editable=False,
+    )
+
+    code = models.CharField(
+        max_length=128,
+        editable=False,
+    )
+
+    value = models.CharField(
+        max_length=255,
+        blank=True,
+        editable=False,
+    )
+
+    objects = AttributeSignatureQuerySet.as_manager()
+
+    class Meta:
+        db_table = 'shopit_attribute_signatures'
+        unique_together = [('variant', 'code')]
+        index_together = [('code', 'value', 'variant')]
+
+
+class SearchTermQuerySet(QuerySet):
+    def matching(self, terms):
+        """
+        Returns terms in active languages that start with any of the given
+        terms.
+        """
+        queryset = self.filter(language__in=get_active_language_choices())
+        return queryset.filter(reduce(operator.or_, [Q(term__startswith=x) for x in terms]))
+
+    def search(self, query):
+        """
+        Returns `product_id` and `rank` values of products matching all terms
+        in the given query. Terms are matched by prefix in active languages
+        and ranked by the sum of their weights.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return self.none().values('product_id').annotate(rank=Value(0, output_field=models.IntegerField()))
+
+        matched = {}
+        for i, term in enumerate(terms):
+            when = When(term__startswith=term, then=Value(1))
+            matched['match_%d' % i] = Max(Case(when, default=Value(0), output_field=models.IntegerField()))
+
+        queryset = self.matching(terms).values('product_id').annotate(rank=Sum('weight'), **matched).order_by()
+        return queryset.filter(**dict((x, 1) for x in matched))
+
+
+class SearchTerm(models.Model):
+    """
+    Inverted index of terms found in product fields, per language. Built
+    with `rebuild_search_index` command and kept in sync on save.
+    """
+    product = models.ForeignKey(
+        Product,
+        models.CASCADE,
+        related_name='search_terms',
+        editable=False,
+    )
+
+    language = models.CharField(
+        max_length=15,
+        editable=False,
+    )
+
+    term = models.CharField(
+        max_length=64,
+        editable=False,
+    )
+
+    weight = models.PositiveIntegerField(
+        default=1,
+        editable=False,
+    )
+
+    objects = SearchTermQuerySet.as_manager()
+
+    class Meta:
+        db_table = 'shopit_search_terms'
+        unique_together = [('product', 'language', 'term')]
+        index_together = [('language', 'term', 'product')]
+
+
+def get_effective_relations(ids, name):
+    """
+    Returns a dictionary of product ids with a set of related ids from the
+    given many to many relation (`modifiers` or `flags`), collected from the
+    product, it's group and categorization ancestors. Variants of the given
+    groups are included.
+    """
+    rows = list(Product.objects.filter(Q(id__in=ids) | Q(group_id__in=ids)).values_list(
+        'id', 'kind', 'group_id', '_category_id', '_brand_id', '_manufacturer_id',
+        'group___category_id', 'group___brand_id', 'group___manufacturer_id'))
+    related = defaultdict(set)
+    through = getattr(Product, name).through
+    column = '%s_id' % through._meta.get_field(name[:-1]).name
+    product_ids = set(x[0] for x in rows) | set(x[2] for x in rows if x[2])
+    for pk, related_id in through.objects.filter(product_id__in=product_ids).values_list('product_id', column):
+        related[(Product, pk)].add(related_id)
+
+    def get_node(row, index):
+        return row[index + 3] if row[1] == Product.VARIANT else row[index]
+
+    categorizations = [(Category, 3), (Brand, 4), (Manufacturer, 5)]
+    parents = {}
+    for model, index in categorizations:
+        nodes = model.objects.filter(id__in=set(get_node(x, index) for x in rows) - set([None]))
+        parents[model] = dict(model.objects.get_queryset_ancestors(nodes, True).values_list('id', 'parent_id'))
+        through = getattr(model, name).through
+        fk = '%s_id' % model._meta.model_name
+        for pk, related_id in through.objects.filter(**{'%s__in' % fk: parents[model].keys()}).values_list(fk, column):
+            related[(model, pk)].add(related_id)
+
+    effective = {}
+    for row in rows:
+        effective[row[0]] = related[(Product, row[0])] | related[(Product, row[2])]
+        for model, index in categorizations:
+            node = get_node(row, index)
+            while node is not None:
+                effective[row[0]] |= related[(model, node)]
+                node = parents[model].get(node)
+    return effective
+
+
+class EffectiveModifierQuerySet(QuerySet):
+    def update_products(self, ids):
+        """
+        Recomputes effective modifiers for the given products and variants
+        of the groups among them.
+        """
+        effective = get_effective_relations(ids, 'modifiers')
+        with transaction.atomic():
+            self.filter(product_id__in=effective.keys()).delete()
+            self.bulk_create([
+                EffectiveModifier(product_id=pk, modifier_id=x) for pk, mods in effective.items() for x in mods])
+
+    def get_modifiers(self, ids):
+        """
+        Returns a dictionary of product ids with a list of their active
+        modifiers, loaded in a single query.
+        """
+        modifiers = defaultdict(list)
+        queryset = self.filter(product_id__in=ids, modifier__active=True).select_related('modifier').\
+            prefetch_related('modifier__translations').order_by('modifier__order', 'modifier_id')
+        for item in queryset:
+            modifiers[item.product_id].append(item.modifier)
+        return modifiers
+
+
+class EffectiveModifier(models.Model):
+    """
+    Closure of modifiers that apply to a product, collected from the
+    product, it's group and categorization ancestors. Kept in sync with
+    signals, inactive modifiers are filtered out when reading.
+    """
+    product = models.ForeignKey(
+        Product,
+        models.CASCADE,
+        related_name='effective_modifiers',
+        editable=False,
+    )
+
+    modifier = models.ForeignKey(
+        Modifier,
+        models.CASCADE,
+        related_name='+',
+        editable=False,
+    )
+
+    objects = EffectiveModifierQuerySet.as_manager()
+
+    class Meta:
+        db_table = 'shopit_effective_modifiers'
+        unique_together = [('product', 'modifier')]
+
+
+class EffectiveFlagQuerySet(QuerySet):
+    def update_products(self, ids):
+        """
+        Recomputes effective flags for the given products and variants of
+        the groups among them. Ancestors of the flags are added as well,
+        marked with `is_ancestor`.
+        """
+        effective = get_effective_relations(ids, 'flags')
+        nodes = Flag.objects.filter(id__in=set(y for x in effective.values() for y in x))
+        parents = dict(Flag.objects.get_queryset_ancestors(nodes, True).values_list('id', 'parent_id'))
+        items = []
+        for pk, flags in effective.items():
+            ancestors = set()
+            for flag in flags:
+                parent = parents.get(flag)
+                while parent is not None:
+                    ancestors.add(parent)
+                    parent = parents.get(parent)
+            items.extend(EffectiveFlag(product_id=pk, flag_id=x) for x in flags)
+            items.extend(EffectiveFlag(product_id=pk, flag_id=x, is_ancestor=True) for x in ancestors - flags)
+        with transaction.atomic():
+            self.filter(product_id__in=effective.keys()).delete()
+            self.bulk_create(items)
+
+    def get_flags(self, ids):
+        """
+        Returns a dictionary of product ids with a list of their active
+        flags, loaded in a single query. Ancestors are left out, but are
+        used to set flag paths so that serializing them runs no queries.
+        """
+        nodes, direct = defaultdict(dict), defaultdict(list)
+        queryset = self.filter(product_id__in=ids).select_related('flag').\
+            prefetch_related('flag__translations').order_by('flag__tree_id', 'flag__lft')
+        for item in queryset:
+            nodes[item.product_id][item.flag_id] = item.flag
+            if not item.is_ancestor:
+                direct[item.product_id].append(item.flag)
+
+        flags = defaultdict(list)
+        for pk, items in direct.items():
+            for flag in items:
+                parent = nodes[pk].get(flag.parent_id)
+                if not flag.active or (flag.parent_id and not (parent and parent.active)):
+                    continue
+                codes, node = [], flag
+                while node is not None:
+                    codes.insert(0, node.code)
+                    node = nodes[pk].get(node.parent_id)
+                flag._path = '/'.join(codes)
+                flags[pk].append(flag)
+        return flags
+
+
+class EffectiveFlag(models.Model):
+    """
+    Closure of flags that apply to a product, collected from the product,
+    it's group and categorization ancestors, including ancestors of those
+    flags. Kept in sync with signals.
+    """
+    product = models.ForeignKey(
+        Product,
+        models.CASCADE,
+        related_name='effective_flags',
+        editable=False,
+    )
+
+    flag = models.ForeignKey(
+        Flag,
+        models.CASCADE,
+        related_name='+',
+        editable=False,
+    )
+
+    is_ancestor = models.BooleanField(
+        default=False,
+        editable=False,
+    )
+
+    objects = EffectiveFlagQuerySet.as_manager()
+
+    class Meta:
+        db_table = 'shopit_effective_flags'
+        unique_together = [('product', 'flag')]
+        index_together = [('flag', 'product')]
+
+
+class StockReservationQuerySet(QuerySet):
+    def active(self):
+        return self.filter(expires_at__gt=timezone.now())
+
+    def expired(self):
+        return self.filter(expires_at__lte=timezone.now())
+
+    def get_reserved(self, ids, cart=None):
+        """
+        Returns a dictionary of product ids with quantity held by active
+        reservations, excluding the ones for the given cart.
+        """
+        reservations = self.active().filter(product_id__in=ids)
+        if cart is not None:
+            reservations = reservations.exclude(cart=cart)
+        reservations = reservations.values('product_id').annotate(total=Sum('quantity')).order_by()
+        return dict((x['product_id'], x['total']) for x in reservations)
+
+    def hold(self, product, cart, quantity):
+        """
+        Holds the given quantity of a product for a cart, replacing the
+        previous hold and extending it's expiry.
+        """
+        timeout = app_settings.STOCK_RESERVATION_TIMEOUT
+        if quantity <= 0 or not timeout:
+            return self.release(cart, product)
+        self.update_or_create(product=product, cart=cart, defaults={
+            'quantity': quantity,
+            'expires_at': timezone.now() + timedelta(seconds=timeout),
+        })
+
+    def release(self, cart, product=None):
+        """
+        Releases holds for the given cart, optionally only for a product.
+        """
+        reservations = self.filter(cart=cart)
+        if product is not None:
+            reservations = reservations.filter(product=product)
+        reservations.delete()
+
+
+class StockReservation(models.Model):
+    """
+    Quantity of a product held for a cart until it expires. Active holds
+    are not available to other carts, expired ones are ignored and
+    removed with `release_stock_reservations` command.
+    """
+    product = models.ForeignKey(
+        Product,
+        models.CASCADE,
+        related_name='stock_reservations',
+        editable=False,
+    )
+
+    cart = models.ForeignKey(
+        Cart,
+        models.CASCADE,
+        related_name='stock_reservations',
+        editable=False,
+    )
+
+    quantity = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+    )
+
+    expires_at = models.DateTimeField(
+        editable=False,
+    )
+
+    objects = StockReservationQuerySet.as_manager()
+
+    class Meta:
+        db_table = 'shopit_stock_reservations'
+        unique_together = [('cart', 'product')]
+        index_together = [('product', 'expires_at')]
+
+
 @python_2_unicode_compatible
 class Attachment(models.Model):
     """
@@ -1263,6 +2057,14 @@ class Attachment(models.Model):
         default=0,
     )
 
+    thumbnails = JSONField(
+        verbose_name=_('Thumbnails'),
+        blank=True,
+        null=True,
+        editable=False,
+        help_text=_('Urls of generated thumbnails by alias, empty until generated.'),
+    )
+
     class Meta:
         db_table = 'shopit_attachments'
         verbose_name = _('Attachment')
@@ -1272,14 +2074,28 @@ class Attachment(models.Model):
     def __str__(self):
         return self.label
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Attachment, cls).from_db(db, field_names, values)
+        if 'file_id' in field_names:
+            instance._original_file_id = instance.file_id
+        return instance
+
     def save(self, *args, **kwargs):
         self.clean()
+        if self.file_id != getattr(self, '_original_file_id', None):
+            self.thumbnails = None
         super(Attachment, self).save(*args, **kwargs)
+        self._original_file_id = self.file_id
 
     @property
     def label(self):
         return self.file.label if self.file else basename(self.value)
 
+    @property
+    def needs_thumbnails(self):
+        return EASY_THUMBNAILS and self.kind == self.IMAGE and self.file_id is not None and self.thumbnails is None
+
     @property
     def value(self):
         return self.file.url if self.file else self.url
@@ -1291,15 +2107,30 @@ class Attachment(models.Model):
             'url': self.value,
             'order': self.order,
         }
+        for alias, url in (self.thumbnails or {}).items():
+            attachment['url_%s' % alias] = url
+        return attachment
+
+    def generate_thumbnails(self):
+        """
+        Generates thumbnails of an image for all easy-thumbnails aliases and
+        stores their urls. Called outside of the request by a worker, see
+        `shopit.thumbnails`. Files that can't be thumbnailed get none.
+        """
+        thumbnails = {}
         if EASY_THUMBNAILS and self.kind == self.IMAGE and self.file is not None:
+            # Related file is loaded as a base filer `File`, thumbnails need the real image.
+            image = self.file.get_real_instance()
             try:
-                thumbnailer = get_thumbnailer(self.file)
+                thumbnailer = get_thumbnailer(image)
                 for alias, options in aliases.all(target='shopit.Attachment').items():
-                    options.update({'subject_location': self.file.subject_location})
-                    attachment['url_%s' % alias] = thumbnailer.get_thumbnail(options).url
-            except InvalidImageFormatError:
-                pass
-        return attachment
+                    options.update({'subject_location': getattr(image, 'subject_location', None)})
+                    thumbnails[alias] = thumbnailer.get_thumbnail(options).url
+            except (InvalidImageFormatError, IOError, ValueError):
+                thumbnails = {}
+        self.thumbnails = thumbnails
+        Attachment.objects.filter(pk=self.pk).update(thumbnails=thumbnails)
+        return thumbnails
 
     def clean(self):
         if self.file:
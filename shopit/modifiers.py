@@ -6,6 +6,7 @@ from shop.modifiers.defaults import PayInAdvanceModifier as PayInAdvanceModifier
 from shop.money import Money
 
 from shopit.models.modifier import Modifier
+from shopit.models.product import EffectiveModifier
 from shopit.payment import ForwardFundPayment
 from shopit.serializers import ExtraCartRow
 
@@ -15,12 +16,19 @@ class ShopitCartModifier(BaseCartModifier):
     Applies all cart and product modifiers.
     """
     cart_discount_codes = []
+    product_modifiers = {}
 
     def pre_process_cart(self, cart, request):
         self.cart_discount_codes = cart.get_discount_codes().order_by('-id').values_list('code', flat=True)
+        ids = list(cart.items.values_list('product_id', flat=True))
+        modifiers = EffectiveModifier.objects.get_modifiers(ids)
+        self.product_modifiers = dict((x, modifiers[x]) for x in ids)
 
     def add_extra_cart_item_row(self, cart_item, request):
-        for modifier in cart_item.product.get_modifiers():
+        modifiers = self.product_modifiers.get(cart_item.product_id, None)
+        if modifiers is None:
+            modifiers = cart_item.product.get_modifiers()
+        for modifier in modifiers:
             if modifier.can_be_applied(request, cart_item=cart_item):
                 amount = modifier.get_added_amount(cart_item.line_total, cart_item.quantity)
                 instance = {'label': modifier.label, 'amount': amount, 'code': self.get_applied_code(modifier)}
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from collections import defaultdict
+
+TAX_RELATED = ['_tax', '_category__effective_tax', 'group___tax', 'group___category__effective_tax']
+
+# Related objects selected for a serializer field.
+SELECT_RELATED = {
+    'category': ['_category', 'group___category'],
+    'brand': ['_brand', 'group___brand'],
+    'manufacturer': ['_manufacturer', 'group___manufacturer'],
+    'tax': TAX_RELATED,
+    'price': TAX_RELATED,
+    'is_taxed': TAX_RELATED,
+    'tax_percent': TAX_RELATED,
+    'tax_amount': TAX_RELATED,
+}
+
+# Related objects prefetched for a serializer field.
+PREFETCH_RELATED = {
+    'category': ['_category__translations'],
+    'brand': ['_brand__translations'],
+    'manufacturer': ['_manufacturer__translations'],
+    'tax': ['_tax__translations'],
+}
+
+
+def plan_products(queryset, fields):
+    """
+    Returns a products queryset with related objects needed for the given
+    serializer fields selected and prefetched.
+    """
+    select, prefetch = set(['group']), set(['translations'])
+    for name in fields:
+        select.update(SELECT_RELATED.get(name, []))
+        prefetch.update(PREFETCH_RELATED.get(name, []))
+    return queryset.select_related(*sorted(select)).prefetch_related(*sorted(prefetch))
+
+
+def seed_products(products, fields):
+    """
+    Loads modifiers, flags, attachments, relations and reviews for all of
+    the given products in bulk, if requested in fields, and seeds their
+    caches so that serializing them runs a constant number of queries.
+    """
+    products = list(products)
+    if not products:
+        return products
+
+    fields = set(fields)
+    _seed_groups(products)
+    if 'modifiers' in fields:
+        _seed_modifiers(products)
+    if 'flags' in fields:
+        _seed_flags(products)
+    if 'attachments' in fields:
+        load_attachments(products)
+    if 'relations' in fields:
+        _seed_relations(products)
+    if 'reviews' in fields:
+        _seed_reviews(products)
+    return products
+
+
+def cached_queryset(queryset, items):
+    """
+    Returns a queryset with the given items set as it's result cache. It
+    iterates without a query, while chaining it still queries the database.
+    """
+    queryset = queryset.filter(id__in=[x.pk for x in items]).distinct()
+    queryset._result_cache = list(items)
+    queryset._prefetch_done = True
+    return queryset
+
+
+def load_attachments(products):
+    """
+    Loads attachments for all of the given products and their groups in
+    one query and splits them by kind. Variants without attachments of a
+    kind inherit the ones from their group.
+    """
+    from shopit.models.product import Attachment
+
+    products = list(products)
+    ids = set(x.pk for x in products) | set(x.group_id for x in products if x.is_variant)
+    attachments = defaultdict(list)
+    for attachment in Attachment.objects.filter(product_id__in=ids).select_related('file'):
+        attachments[(attachment.product_id, attachment.kind)].append(attachment)
+
+    for product in products:
+        objects = {}
+        for kind, label in Attachment.KINDS:
+            objects[kind] = attachments[(product.pk, kind)]
+            if not objects[kind] and product.is_variant:
+                objects[kind] = attachments[(product.group_id, kind)]
+        product.cache('_attachment_objects', objects)
+        product.cache('_attachments', {
+            'images': [x.as_dict for x in objects[Attachment.IMAGE]] or None,
+            'videos': [x.as_dict for x in objects[Attachment.VIDEO]] or None,
+            'files': [x.as_dict for x in objects[Attachment.FILE]] or None,
+        })
+    return products
+
+
+def _get_owner(product):
+    return product.group if product.is_variant else product
+
+
+def _seed_groups(products):
+    from shopit.models.product import Product
+
+    missing = [x for x in products if x.is_variant and not hasattr(x, '_group_cache')]
+    groups = Product.objects.in_bulk(set(x.group_id for x in missing))
+    for product in [x for x in missing if x.group_id in groups]:
+        product._group_cache = groups[product.group_id]
+
+
+def _seed_flags(products):
+    from shopit.models.flag import Flag
+    from shopit.models.product import EffectiveFlag
+
+    flags = EffectiveFlag.objects.get_flags([x.pk for x in products])
+    for product in products:
+        product.cache('_flags', cached_queryset(Flag.objects.active(), flags[product.pk]))
+
+
+def _seed_modifiers(products):
+    from shopit.models.modifier import Modifier
+    from shopit.models.product import EffectiveModifier
+
+    modifiers = EffectiveModifier.objects.get_modifiers([x.pk for x in products])
+    for product in products:
+        product.cache('_mods', cached_queryset(Modifier.objects.active(), modifiers[product.pk]))
+
+
+def _seed_relations(products):
+    from shopit.models.product import Relation
+
+    relations = defaultdict(list)
+    queryset = Relation.objects.filter(base__in=[x for x in products if not x.is_variant]).select_related('product')
+    for relation in queryset:
+        relations[relation.base_id].append(relation)
+    for product in [x for x in products if not x.is_variant]:
+        product.cache('_relations', cached_queryset(product.relations.all(), relations[product.pk]))
+
+
+def _seed_reviews(products):
+    from shopit.models.product import Review
+
+    reviews = defaultdict(list)
+    for review in Review.objects.active().filter(product__in=[x for x in products if not x.is_variant]):
+        reviews[review.product_id].append(review)
+    for product in [x for x in products if not x.is_variant]:
+        product.cache('_reviews', cached_queryset(product.reviews.active(), reviews[product.pk]))
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db.models.query import QuerySet
+
+# Percentages are stored with 2 decimal places, dividing them by 100 adds
+# another 2. Multiplying by a percentage so adds 4 decimal places.
+PERCENT_PLACES = 4
+
+Prices = namedtuple('Prices', [
+    'unit_price', 'discount_percent', 'discount_amount', 'tax_percent', 'tax_amount', 'price'])
+
+
+def get_prices(products):
+    """
+    Returns a dictionary of product ids with `Prices` for the given
+    products queryset or list of ids. Unit price, discount and tax percent
+    are loaded as columns with group and category inheritance applied the
+    same as on `Product`, amounts are computed in fixed-point integer arithmetic so
+    that they're exact.
+    """
+    from shopit.models.product import Product
+
+    if not isinstance(products, QuerySet):
+        products = Product.objects.filter(id__in=list(products))
+    rows = products.order_by().values_list(
+        'id', 'kind', '_unit_price', '_discount', '_tax__percent', '_category_id', '_category__effective_tax__percent',
+        'group___unit_price', 'group___discount', 'group___tax__percent', 'group___category__effective_tax__percent')
+
+    places = Product._meta.get_field('_unit_price').decimal_places
+    prices = {}
+    for row in rows:
+        pk, kind, unit, discount, tax, category_id, category_tax = row[:7]
+        if kind == Product.VARIANT:
+            group_unit, group_discount, group_tax, group_category_tax = row[7:]
+            unit = unit if unit else group_unit
+            discount = discount if discount is not None else group_discount
+            tax = tax if tax is not None else group_tax
+            category_tax = category_tax if category_id else group_category_tax
+        if tax is None:
+            tax = category_tax
+
+        unit = _to_int(unit or 0, places)
+        discount_percent = _to_int(discount or 0, 2)
+        tax_percent = _to_int(tax or 0, 2)
+        discount_amount = unit * discount_percent
+        net = unit * 10 ** PERCENT_PLACES - discount_amount
+        tax_amount = net * tax_percent
+        prices[pk] = Prices(
+            unit_price=_to_money(unit, places),
+            discount_percent=_to_decimal(discount_percent, 2),
+            discount_amount=_to_money(discount_amount, places + PERCENT_PLACES),
+            tax_percent=_to_decimal(tax_percent, 2),
+            tax_amount=_to_money(tax_amount, places + PERCENT_PLACES * 2),
+            price=_to_money(net * 10 ** PERCENT_PLACES + tax_amount, places + PERCENT_PLACES * 2),
+        )
+    return prices
+
+
+def _to_int(value, places):
+    return int(Decimal(value).scaleb(places))
+
+
+def _to_decimal(value, places):
+    return Decimal(value).scaleb(-places)
+
+
+def _to_money(value, places):
+    from shop.money import Money
+
+    return Money(_to_decimal(value, places))
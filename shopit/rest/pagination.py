@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from decimal import Decimal
+
+from django.db.models import OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from parler.utils.i18n import get_active_language_choices
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class ProductCursorPagination(CursorPagination):
+    """
+    Keyset pagination for products. Products are ordered by a sort field
+    and `pk` as a tiebreaker, and every page is a range query starting
+    after the last product of the previous page. Sort is read from the
+    view's `get_sort` method, supports the 'name|-name|price|-price' sorts
+    and defaults to `-order`.
+    """
+    sort_fields = {
+        None: ('order', True),
+        'name': ('sort_name', False),
+        '-name': ('sort_name', True),
+        'price': ('effective_price', False),
+        '-price': ('effective_price', True),
+    }
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.sort = view.get_sort() if hasattr(view, 'get_sort') else None
+        if self.sort not in self.sort_fields:
+            self.sort = None
+        self.field, descending = self.sort_fields[self.sort]
+        if self.field == 'sort_name':
+            queryset = self.annotate_sort_name(queryset)
+
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor[2]
+        if self.cursor is not None:
+            lookup = 'lt' if descending != reverse else 'gt'
+            value, pk = self.cursor[:2]
+            position = {'%s__%s' % (self.field, lookup): value}
+            tiebreaker = {self.field: value, 'pk__%s' % lookup: pk}
+            queryset = queryset.filter(Q(**position) | Q(**tiebreaker))
+
+        prefix = '-' if descending != reverse else ''
+        results = list(queryset.order_by(prefix + self.field, prefix + 'pk')[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        self.has_next = has_more if not reverse else True
+        self.has_previous = has_more if reverse else self.cursor is not None
+        return self.page
+
+    def annotate_sort_name(self, queryset):
+        """
+        Annotates translated name in the first available language, used to
+        keep a single row per product when sorting by name.
+        """
+        translations = queryset.model._parler_meta.root_model.objects.filter(master_id=OuterRef('pk'))
+        names = [Subquery(translations.filter(language_code=x).values('name')[:1])
+                 for x in get_active_language_choices()]
+        return queryset.annotate(sort_name=Coalesce(*(names + [Value('')])))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], True)
+
+    def encode_cursor(self, product, reverse):
+        value = getattr(product, self.field)
+        if isinstance(value, Decimal):
+            value = str(Decimal(value))
+        data = json.dumps([self.sort, value, product.pk, reverse]).encode('utf-8')
+        encoded = urlsafe_b64encode(data).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        """
+        Returns a `(value, pk, reverse)` tuple from the request cursor.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            sort, value, pk, reverse = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if sort != self.sort:
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk, bool(reverse)
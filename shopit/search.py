@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import re
+
+from django.db import transaction
+from django.utils.html import strip_tags
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+TERM_MAX_LENGTH = 64
+
+# Weight of a term by the field it's found in.
+NAME_WEIGHT = 10
+CODE_WEIGHT = 8
+CAPTION_WEIGHT = 4
+CATEGORIZATION_WEIGHT = 3
+ATTRIBUTE_WEIGHT = 2
+DESCRIPTION_WEIGHT = 1
+
+
+def tokenize(text):
+    """
+    Returns a list of unique lowercase terms from the given text.
+    """
+    terms = TERM_RE.findall(strip_tags(text or '').lower())
+    return list(set(x[:TERM_MAX_LENGTH] for x in terms))
+
+
+def get_product_terms(ids):
+    """
+    Returns a dictionary of `(product_id, language, term)` keys with term
+    weights for the given top-level product ids. Variant codes and
+    attribute labels are indexed on their group.
+    """
+    from shopit.models.product import Product
+
+    terms = {}
+
+    def add(pk, language, text, weight):
+        for term in tokenize(text):
+            terms[(pk, language, term)] = terms.get((pk, language, term), 0) + weight
+
+    languages = {}
+    translations = Product._parler_meta.root_model.objects.filter(master_id__in=ids)
+    for pk, language, name, caption, description in translations.values_list(
+            'master_id', 'language_code', 'name', '_caption', '_description'):
+        languages.setdefault(pk, []).append(language)
+        add(pk, language, name, NAME_WEIGHT)
+        add(pk, language, caption, CAPTION_WEIGHT)
+        add(pk, language, description, DESCRIPTION_WEIGHT)
+
+    products = Product.objects.filter(id__in=ids)
+    variants = Product.objects.filter(group_id__in=ids, kind=Product.VARIANT)
+    codes = list(products.values_list('id', 'code')) + list(variants.values_list('group_id', 'code'))
+    for pk, code in codes:
+        for language in languages.get(pk, []):
+            add(pk, language, code, CODE_WEIGHT)
+            add(pk, language, code.replace('-', ''), CODE_WEIGHT)
+
+    _add_categorization_terms(add, products, languages)
+    _add_attribute_terms(add, variants, languages)
+
+    return terms
+
+
+def _add_categorization_terms(add, products, languages):
+    from shopit.models.categorization import Brand, Category, Manufacturer
+
+    for field, model in [('_category_id', Category), ('_brand_id', Brand), ('_manufacturer_id', Manufacturer)]:
+        related = dict(products.exclude(**{field: None}).values_list('id', field))
+        names = model._parler_meta.root_model.objects.filter(master_id__in=set(related.values()))
+        names = dict(((x[0], x[1]), x[2]) for x in names.values_list('master_id', 'language_code', 'name'))
+        for pk, related_id in related.items():
+            for language in languages.get(pk, []):
+                add(pk, language, names.get((related_id, language)), CATEGORIZATION_WEIGHT)
+
+
+def _add_attribute_terms(add, variants, languages):
+    from shopit.models.product import AttributeChoice, AttributeValue
+
+    values = AttributeValue.objects.filter(product__in=variants, choice__isnull=False)
+    values = list(values.values_list('product__group_id', 'choice_id', 'choice__value'))
+    labels = AttributeChoice._parler_meta.root_model.objects.filter(master_id__in=set(x[1] for x in values))
+    labels = dict(((x[0], x[1]), x[2]) for x in labels.values_list('master_id', 'language_code', 'name'))
+    for pk, choice_id, value in values:
+        for language in languages.get(pk, []):
+            add(pk, language, labels.get((choice_id, language)) or value, ATTRIBUTE_WEIGHT)
+
+
+def index_products(ids):
+    """
+    Re-indexes the given products. Variants are indexed on their group.
+    """
+    from shopit.models.product import Product, SearchTerm
+
+    ids = set(ids)
+    rows = Product.objects.filter(id__in=ids).values_list('id', 'kind', 'group_id')
+    ids.update(group_id for pk, kind, group_id in rows if kind == Product.VARIANT and group_id)
+    top_level = Product.objects.filter(id__in=ids).top_level().values_list('id', flat=True)
+
+    with transaction.atomic():
+        SearchTerm.objects.filter(product_id__in=ids).delete()
+        SearchTerm.objects.bulk_create([
+            SearchTerm(product_id=pk, language=language, term=term, weight=weight)
+            for (pk, language, term), weight in get_product_terms(list(top_level)).items()])
+
+
+def rebuild_search_index(batch_size=500):
+    """
+    Rebuilds the entire search index, returns number of indexed products.
+    """
+    from shopit.models.product import Product, SearchTerm
+
+    ids = list(Product.objects.top_level().values_list('id', flat=True))
+    SearchTerm.objects.all().delete()
+    for i in range(0, len(ids), batch_size):
+        index_products(ids[i:i + batch_size])
+    return len(ids)
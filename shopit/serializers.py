@@ -2,8 +2,10 @@
 from __future__ import absolute_import, unicode_literals
 
 from django.core.urlresolvers import NoReverseMatch, reverse
+from django.db import models
 from django.template.loader import select_template
 from django.utils import six
+from django.utils.translation import get_language
 from measurement.base import MeasureBase
 from measurement.measures import Distance, Mass
 from rest_auth.serializers import PasswordResetConfirmSerializer, PasswordResetSerializer
@@ -17,6 +19,7 @@ from shop.serializers.defaults import AddToCartSerializer as BaseAddToCartSerial
 from shop.serializers.defaults import CustomerSerializer
 from shop.serializers.order import OrderListSerializer as BaseOrderListSerializer
 
+from shopit.availability import get_products_availability
 from shopit.conf import app_settings
 from shopit.models.address import BillingAddress, ShippingAddress
 from shopit.models.categorization import Brand, Category, Manufacturer
@@ -25,6 +28,8 @@ from shopit.models.flag import Flag
 from shopit.models.modifier import Modifier
 from shopit.models.product import Product, Relation, Review
 from shopit.models.tax import Tax
+from shopit.planner import seed_products
+from shopit.snapshots import attach_snapshots
 
 
 class AccountSerializer(CustomerSerializer):
@@ -108,10 +113,12 @@ class FlagSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Flag
-        fields = ['id', 'name', 'code', 'template', 'path']
+        fields = ['id', 'name', 'code', 'template', 'path', 'product_count', 'total_product_count']
 
     def get_path(self, obj):
-        return '/'.join(obj.get_ancestors(include_self=True).values_list('code', flat=True))
+        if getattr(obj, '_path', None) is None:
+            obj._path = '/'.join(obj.get_ancestors(include_self=True).values_list('code', flat=True))
+        return obj._path
 
 
 class ModifierSerializer(serializers.ModelSerializer):
@@ -132,7 +139,7 @@ class CategorizationSerializerBase(serializers.ModelSerializer):
     flags = FlagSerializer(source='get_flags', many=True)
 
     class Meta:
-        fields = ['id', 'name', 'slug', 'url', 'parent', 'modifiers', 'flags']
+        fields = ['id', 'name', 'slug', 'url', 'parent', 'modifiers', 'flags', 'product_count', 'total_product_count']
 
     def get_url(self, obj):
         url = obj.get_absolute_url()
@@ -195,6 +202,20 @@ class ReviewSerializer(serializers.ModelSerializer):
         return self.context['request'].build_absolute_uri(url) if url else None
 
 
+class ProductListSerializer(serializers.ListSerializer):
+    """
+    Loads related objects, snapshots and availability for all products in
+    bulk before serializing.
+    """
+    def to_representation(self, data):
+        data = data.all() if isinstance(data, models.Manager) else data
+        products = attach_snapshots(seed_products(data, self.child.fields.keys()), get_language())
+        if 'is_available' in self.child.fields and self.context.get('deferred_availability', None) is None:
+            availability = get_products_availability(products, request=self.context.get('request', None))
+            self.context.setdefault('availability', {}).update(availability)
+        return super(ProductListSerializer, self).to_representation(products)
+
+
 class ProductSerializer(BaseProductSerializer):
     """
     Base product serializer.
@@ -227,6 +248,7 @@ class ProductSerializer(BaseProductSerializer):
 
     class Meta:
         model = Product
+        list_serializer_class = ProductListSerializer
         fields = [
             'id', 'name', 'slug', 'caption', 'code', 'kind', 'url', 'add_to_cart_url', 'price', 'is_available',
             'description', 'unit_price', 'discount', 'tax', 'availability', 'category', 'brand', 'manufacturer',
@@ -261,6 +283,17 @@ class ProductSerializer(BaseProductSerializer):
             return None
 
     def get_is_available(self, obj):
+        """
+        Availability is deferred when `deferred_availability` list is passed
+        in context, used when data is cached and availability is merged in
+        for every request. When serialized as a list, availability is
+        computed in bulk and read from `availability` in context.
+        """
+        if self.context.get('deferred_availability', None) is not None:
+            self.context['deferred_availability'].append(obj.pk)
+            return None
+        if obj.pk in self.context.get('availability', {}):
+            return self.context['availability'][obj.pk]
         return obj.is_available(request=self.context['request'])
 
     def get_variants(self, obj):
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from filer.models import File
+from mptt.signals import node_moved
+
+from shopit.cache import bump_catalog_version, bump_categorization_version
+from shopit.counts import (get_counted_flag_ids, get_counted_state, get_moved_node_ids, get_original_counted_state,
+                           get_product_contributions, update_product_contributions, update_product_counts)
+from shopit.facets import rebuild_facet_index, update_facet_index, update_facet_index_slugs
+from shopit.models.cart import CartItem
+from shopit.models.categorization import Brand, Category, Manufacturer
+from shopit.models.flag import Flag
+from shopit.models.modifier import Modifier
+from shopit.models.product import (Attachment, Attribute, AttributeChoice, AttributeSignature, AttributeValue,
+                                   EffectiveFlag, EffectiveModifier, Product, Relation, Review, StockReservation)
+from shopit.models.tax import Tax
+from shopit.search import index_products
+from shopit.thumbnails import schedule_thumbnails
+from shopit.variants import invalidate_variant_index
+
+CATEGORIZATION_MODELS = [Category, Brand, Manufacturer]
+CATEGORIZATION_TRANSLATIONS = [x._parler_meta.root_model for x in CATEGORIZATION_MODELS]
+CATEGORIZATION_MASTERS = dict((x._parler_meta.root_model, x) for x in CATEGORIZATION_MODELS)
+
+CATEGORIZATION_FIELDS = dict(zip(CATEGORIZATION_MODELS, ['_category', '_brand', '_manufacturer']))
+CATEGORIZATION_FIELDS.update((x._parler_meta.root_model, y) for x, y in list(CATEGORIZATION_FIELDS.items()))
+
+EFFECTIVE_MODELS = [EffectiveModifier, EffectiveFlag]
+
+# Image model used by filer image fields, `filer.Image` unless swapped.
+FILER_IMAGE_MODEL = Category._meta.get_field('_featured_image').remote_field.model
+
+CATALOG_MODELS = [Product, Attribute, AttributeChoice, AttributeValue, Attachment, Relation, Review, Category, Brand,
+                  Manufacturer, Flag, Modifier, Tax]
+TREE_MODELS = CATEGORIZATION_MODELS + [Tax]
+CATALOG_RELATIONS = [Product.flags, Product.modifiers, Product.available_attributes, Category.flags,
+                     Category.modifiers, Brand.flags, Brand.modifiers, Manufacturer.flags, Manufacturer.modifiers]
+
+
+def get_m2m_product_ids(instance, reverse, pk_set):
+    """
+    Returns affected product ids from a `m2m_changed` signal on a product
+    relation. Returns `None` when all products could be affected.
+    """
+    if not reverse:
+        return [instance.pk]
+    return list(pk_set) if pk_set is not None else None
+
+
+def get_categorization_product_ids(model, ids=None):
+    """
+    Returns ids of products in the given categorizations and their
+    descendants, or in any categorization when `ids` is `None`.
+    """
+    field = CATEGORIZATION_FIELDS[model]
+    if ids is None:
+        return Product.objects.exclude(**{field: None}).values_list('id', flat=True)
+    nodes = model.objects.get_queryset_descendants(model.objects.filter(id__in=ids), True)
+    return Product.objects.filter(**{'%s__in' % field: nodes}).values_list('id', flat=True)
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_delete, sender=Product)
+def product_changing(sender, instance, raw=False, **kwargs):
+    if not raw:
+        # Only products with a changed counted state update counts, by the
+        # difference in nodes they're counted in.
+        original = get_original_counted_state(instance)
+        changed = kwargs.get('signal') is pre_delete or original != get_counted_state(instance)
+        instance._counted_before = get_product_contributions(instance.pk, original) if changed else None
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        if kwargs.get('signal') is post_save:
+            AttributeSignature.objects.update_variants([instance.pk])
+            EffectiveModifier.objects.update_products([instance.pk])
+            EffectiveFlag.objects.update_products([instance.pk])
+            if instance.is_group:
+                instance.variants.all().update_effective_prices()
+            index_products([instance.pk])
+        invalidate_variant_index([instance.pk, instance.group_id])
+        update_facet_index([instance.pk])
+        before = getattr(instance, '_counted_before', None)
+        if before is not None:
+            deleted = kwargs.get('signal') is post_delete
+            update_product_contributions(before, {} if deleted else get_product_contributions(
+                instance.pk, get_counted_state(instance)))
+        instance._original_counted_state = get_counted_state(instance)
+        instance._counted_before = None
+
+
+@receiver(post_save, sender=Product._parler_meta.root_model)
+@receiver(post_delete, sender=Product._parler_meta.root_model)
+def product_translation_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_products([instance.master_id])
+
+
+@receiver(m2m_changed, sender=Product.flags.through)
+@receiver(m2m_changed, sender=Product.modifiers.through)
+def product_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    ids = get_m2m_product_ids(instance, reverse, pk_set)
+    if action in ['pre_add', 'pre_remove', 'pre_clear'] and sender is Product.flags.through and ids is not None:
+        instance._counted_flag_ids = get_counted_flag_ids(ids)
+    if action in ['post_add', 'post_remove', 'post_clear']:
+        effective_model = EffectiveFlag if sender is Product.flags.through else EffectiveModifier
+        effective_model.objects.update_products(Product.objects.values_list('id', flat=True) if ids is None else ids)
+        if ids is None:
+            rebuild_facet_index()
+        else:
+            update_facet_index(ids)
+        if sender is Product.flags.through:
+            if ids is None:
+                # All products were removed from the flag, only it's tree is affected.
+                update_product_counts(Flag, [instance.pk])
+            else:
+                update_product_counts(Flag, getattr(instance, '_counted_flag_ids', set()) | get_counted_flag_ids(ids))
+
+
+def categorization_relations_changed(sender, instance, action, reverse, pk_set, model, **kwargs):
+    if reverse:
+        categorization_model, ids = model, list(pk_set) if pk_set is not None else None
+    else:
+        categorization_model, ids = instance.__class__, [instance.pk]
+    is_flags = sender is categorization_model.flags.through
+    if action in ['pre_add', 'pre_remove', 'pre_clear'] and is_flags:
+        instance._counted_flag_ids = get_counted_flag_ids(get_categorization_product_ids(categorization_model, ids))
+    if action in ['post_add', 'post_remove', 'post_clear']:
+        ids = list(get_categorization_product_ids(categorization_model, ids))
+        if is_flags:
+            EffectiveFlag.objects.update_products(ids)
+            update_facet_index(ids)
+            update_product_counts(Flag, getattr(instance, '_counted_flag_ids', set()) | get_counted_flag_ids(ids))
+        else:
+            EffectiveModifier.objects.update_products(ids)
+
+
+def categorization_moved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance.update_paths()
+        instance.update_effective_fields()
+        moved = get_moved_node_ids(instance, **kwargs)
+        ids = list(get_categorization_product_ids(sender, [instance.pk]))
+        flag_ids = get_counted_flag_ids(ids) if moved else set()
+        for effective_model in EFFECTIVE_MODELS:
+            effective_model.objects.update_products(ids)
+        update_facet_index(ids)
+        if moved:
+            # Totals of both the previous and the new ancestors change, as do flags inherited from them.
+            update_product_counts(sender, moved)
+            update_product_counts(Flag, flag_ids | get_counted_flag_ids(ids))
+
+
+def categorization_deleted(sender, instance, **kwargs):
+    if instance.parent_id:
+        update_product_counts(sender, [instance.parent_id])
+
+
+for model in CATEGORIZATION_MODELS:
+    m2m_changed.connect(categorization_relations_changed, sender=model.modifiers.through)
+    m2m_changed.connect(categorization_relations_changed, sender=model.flags.through)
+    post_save.connect(categorization_moved, sender=model)
+    node_moved.connect(categorization_moved, sender=model)
+    post_delete.connect(categorization_deleted, sender=model)
+
+
+@receiver(post_save, sender=Flag)
+@receiver(node_moved, sender=Flag)
+def flag_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ids = EffectiveFlag.objects.filter(flag=instance).values_list('product_id', flat=True)
+        EffectiveFlag.objects.update_products(list(ids))
+        rebuild_facet_index()
+        moved = get_moved_node_ids(instance, **kwargs)
+        if moved:
+            update_product_counts(Flag, moved)
+
+
+@receiver(pre_delete, sender=Flag)
+def flag_deleting(sender, instance, **kwargs):
+    ids = EffectiveFlag.objects.filter(flag=instance).values_list('product_id', flat=True)
+    instance._effective_product_ids = list(ids)
+
+
+@receiver(post_delete, sender=Flag)
+def flag_deleted(sender, instance, **kwargs):
+    EffectiveFlag.objects.update_products(getattr(instance, '_effective_product_ids', []))
+    rebuild_facet_index()
+    if instance.parent_id:
+        update_product_counts(Flag, [instance.parent_id])
+
+
+@receiver(post_save, sender=Modifier)
+@receiver(post_delete, sender=Modifier)
+def modifier_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        # Modifiers are indexed by their code.
+        rebuild_facet_index()
+
+
+@receiver(post_delete, sender=CartItem)
+def cart_item_deleted(sender, instance, **kwargs):
+    StockReservation.objects.release(instance.cart_id, instance.product_id)
+
+
+@receiver(post_save, sender=Attachment)
+def attachment_changed(sender, instance, raw=False, **kwargs):
+    if not raw and instance.needs_thumbnails:
+        schedule_thumbnails([instance.pk])
+
+
+@receiver(post_save, sender=File)
+@receiver(post_save, sender=FILER_IMAGE_MODEL)
+def filer_file_changed(sender, instance, raw=False, **kwargs):
+    """
+    Regenerate thumbnails of attachments when their image is changed,
+    eg. a new subject location is set.
+    """
+    if not raw:
+        ids = list(Attachment.objects.filter(file_id=instance.pk, kind=Attachment.IMAGE).values_list('id', flat=True))
+        if ids:
+            Attachment.objects.filter(id__in=ids).update(thumbnails=None)
+            schedule_thumbnails(ids)
+
+
+@receiver(post_save, sender=AttributeValue)
+@receiver(post_delete, sender=AttributeValue)
+def attribute_value_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        AttributeSignature.objects.update_variants([instance.product_id])
+        invalidate_variant_index(Product.objects.filter(pk=instance.product_id).values_list('group_id', flat=True))
+        index_products([instance.product_id])
+        update_facet_index([instance.product_id])
+
+
+@receiver(post_save, sender=Attribute)
+@receiver(post_save, sender=AttributeChoice)
+def attribute_codes_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        lookup = 'attribute' if sender is Attribute else 'choice'
+        values = AttributeValue.objects.filter(**{lookup: instance})
+        AttributeSignature.objects.update_variants(list(values.values_list('product_id', flat=True)))
+        invalidate_variant_index(values.values_list('product__group_id', flat=True))
+        rebuild_facet_index()
+
+
+@receiver(post_save, sender=Tax)
+@receiver(post_delete, sender=Tax)
+def tax_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        if kwargs.get('signal') is post_save:
+            products = Product.objects.filter(Q(_tax=instance) | Q(_category__effective_tax=instance))
+        else:
+            # Tax is already set to null on related objects, categories inherit a tax from ancestors again.
+            for category in Category.objects.root_nodes():
+                category.update_effective_fields()
+            products = Product.objects.all()
+        products.update_effective_prices()
+        rebuild_facet_index()
+
+
+@receiver(pre_delete, sender=FILER_IMAGE_MODEL)
+def featured_image_deleting(sender, instance, **kwargs):
+    instance._featured_tree_ids = dict(
+        (x, set(x.objects.filter(effective_featured_image=instance).values_list('tree_id', flat=True)))
+        for x in CATEGORIZATION_MODELS)
+
+
+@receiver(post_delete, sender=FILER_IMAGE_MODEL)
+def featured_image_deleted(sender, instance, **kwargs):
+    # Image is already set to null on related objects, nodes inherit an image from ancestors again.
+    for model, tree_ids in getattr(instance, '_featured_tree_ids', {}).items():
+        for node in model.objects.root_nodes().filter(tree_id__in=tree_ids):
+            node.update_effective_fields()
+
+
+@receiver(pre_save, sender=Category)
+def category_changing(sender, instance, raw=False, **kwargs):
+    if not raw:
+        # Prices depend on the tax inherited through ancestors, unknown originals count as a change.
+        fields = [
+            ('_tax_id', '_original_tax_id'), ('active', '_original_active'), ('parent_id', '_original_parent_id')]
+        instance._prices_changed = any(getattr(instance, x) != getattr(instance, y, object()) for x, y in fields)
+
+
+@receiver(post_save, sender=Category)
+def category_changed(sender, instance, raw=False, created=False, **kwargs):
+    if not raw:
+        changed = getattr(instance, '_prices_changed', True)
+        instance._original_tax_id, instance._original_active = instance._tax_id, instance.active
+        if created or not changed:
+            return
+        products = Product.objects.filter(_category__in=instance.get_descendants(include_self=True))
+        products.update_effective_prices()
+        update_facet_index(products.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=AttributeChoice._parler_meta.root_model)
+def attribute_choice_name_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        values = AttributeValue.objects.filter(choice_id=instance.master_id)
+        index_products(values.values_list('product_id', flat=True))
+
+
+def categorization_translation_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        if kwargs.get('signal') is post_save:
+            instance.path = instance.master.update_paths().get(instance.pk, instance.path)
+        else:
+            # Paths of descendants in this language fall back to other languages.
+            master = CATEGORIZATION_MASTERS[sender].objects.filter(pk=instance.master_id).first()
+            if master is not None:
+                master.update_paths()
+        update_facet_index_slugs()
+        products = Product.objects.filter(**{CATEGORIZATION_FIELDS[sender]: instance.master_id})
+        index_products(products.values_list('id', flat=True))
+
+
+for model in CATEGORIZATION_TRANSLATIONS:
+    post_save.connect(categorization_translation_changed, sender=model)
+    post_delete.connect(categorization_translation_changed, sender=model)
+
+
+def catalog_changed(sender, raw=False, **kwargs):
+    if not raw:
+        bump_catalog_version()
+
+
+for model in CATALOG_MODELS:
+    for sender in [model] + (model._parler_meta.get_all_models() if hasattr(model, '_parler_meta') else []):
+        post_save.connect(catalog_changed, sender=sender)
+        post_delete.connect(catalog_changed, sender=sender)
+
+for relation in CATALOG_RELATIONS:
+    m2m_changed.connect(catalog_changed, sender=relation.through)
+
+for model in CATEGORIZATION_MODELS:
+    node_moved.connect(catalog_changed, sender=model)
+
+
+def categorization_tree_changed(sender, raw=False, **kwargs):
+    if not raw:
+        bump_categorization_version()
+
+
+for model in TREE_MODELS:
+    for sender in [model] + model._parler_meta.get_all_models():
+        post_save.connect(categorization_tree_changed, sender=sender)
+        post_delete.connect(categorization_tree_changed, sender=sender)
+
+for model in CATEGORIZATION_MODELS:
+    node_moved.connect(categorization_tree_changed, sender=model)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from django.core.cache import cache
+
+from shopit.cache import LRUCache, get_catalog_version
+from shopit.conf import app_settings
+from shopit.pricing import get_prices
+
+SNAPSHOT_KEY = 'shopit_snapshot_%s_%s'
+SNAPSHOT_TIMEOUT = 60 * 60 * 24
+
+
+class ProductSnapshot(object):
+    """
+    Immutable resolved values of a product in a language, with group
+    inheritance, discount and tax already applied. Related objects are
+    referenced by their ids.
+    """
+    __slots__ = [
+        'id', 'language', 'version', 'kind', 'group_id', 'name', 'slug', 'code', 'caption', 'description',
+        'category_id', 'brand_id', 'manufacturer_id', 'tax_id', 'unit_price', 'discount', 'discount_percent',
+        'discount_amount', 'tax_percent', 'tax_amount', 'price', 'width', 'height', 'depth', 'weight',
+    ]
+
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            object.__setattr__(self, name, kwargs.get(name, None))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("'%s' object is immutable" % self.__class__.__name__)
+
+    def __getstate__(self):
+        return dict((x, getattr(self, x)) for x in self.__slots__)
+
+    def __setstate__(self, state):
+        for name in self.__slots__:
+            object.__setattr__(self, name, state.get(name, None))
+
+    @classmethod
+    def from_product(cls, product, language, version, prices=None):
+        """
+        Builds a snapshot of the given product, pass in `prices` from
+        `shopit.pricing.get_prices` when building snapshots in bulk.
+        """
+        product.clear('_snapshot')
+        if prices is None:
+            prices = get_prices([product.pk])[product.pk]
+        owner = product.group if product.is_variant else product
+
+        def translated(name, default=''):
+            value = product.safe_translation_getter(name, language_code=language)
+            return value or owner.safe_translation_getter(name, default, language_code=language)
+
+        tax = product.tax
+        return cls(
+            id=product.pk,
+            language=language,
+            version=version,
+            kind=product.kind,
+            group_id=product.group_id,
+            name=product.safe_translation_getter('name', language_code=language, any_language=True),
+            slug=product.safe_translation_getter('slug', language_code=language, any_language=True),
+            code=product.code,
+            caption=translated('_caption'),
+            description=translated('_description'),
+            category_id=getattr(product.category, 'pk', None),
+            brand_id=getattr(product.brand, 'pk', None),
+            manufacturer_id=getattr(product.manufacturer, 'pk', None),
+            tax_id=getattr(tax, 'pk', None),
+            unit_price=prices.unit_price,
+            discount=product.discount,
+            discount_percent=prices.discount_percent,
+            discount_amount=prices.discount_amount,
+            tax_percent=prices.tax_percent,
+            tax_amount=prices.tax_amount,
+            price=prices.price,
+            width=product.width,
+            height=product.height,
+            depth=product.depth,
+            weight=product.weight,
+        )
+
+
+local_cache = LRUCache(app_settings.SNAPSHOT_CACHE_SIZE)
+
+
+def get_snapshot_version(product, catalog_version=None):
+    """
+    Returns a version of the product snapshot. Changes to the group,
+    categorizations or taxes are covered by the catalog version.
+    """
+    if catalog_version is None:
+        catalog_version = get_catalog_version()
+    return catalog_version, product.updated_at
+
+
+def get_snapshots(products, language):
+    """
+    Returns a list of snapshots for the given products in a language.
+    Snapshots are read from the local cache, then from the shared cache,
+    missing or outdated ones are built and stored in both.
+    """
+    catalog_version = get_catalog_version()
+    snapshots, missing, built = {}, {}, {}
+    for product in products:
+        key = SNAPSHOT_KEY % (product.pk, language)
+        snapshot = local_cache.get(key)
+        if snapshot is not None and snapshot.version == get_snapshot_version(product, catalog_version):
+            snapshots[product.pk] = snapshot
+        else:
+            missing[key] = product
+
+    if missing:
+        for key, snapshot in cache.get_many(list(missing.keys())).items():
+            if snapshot.version == get_snapshot_version(missing[key], catalog_version):
+                snapshots[snapshot.id] = snapshot
+                local_cache.set(key, snapshot)
+                del missing[key]
+        prices = get_prices([x.pk for x in missing.values()]) if missing else {}
+        for key, product in missing.items():
+            version = get_snapshot_version(product, catalog_version)
+            snapshot = ProductSnapshot.from_product(product, language, version, prices[product.pk])
+            snapshots[product.pk] = built[key] = snapshot
+            local_cache.set(key, built[key])
+        cache.set_many(built, SNAPSHOT_TIMEOUT)
+
+    return [snapshots[x.pk] for x in products]
+
+
+def attach_snapshots(products, language):
+    """
+    Attaches snapshots to the given products, their resolved values are
+    then read by product properties instead of being computed.
+    """
+    products = list(products)
+    for product, snapshot in zip(products, get_snapshots(products, language)):
+        product.cache('_snapshot', snapshot)
+    return products
@@ -5,7 +5,7 @@ import itertools
 import math
 
 from django import template
-from django.db.models import Q
+from django.db.models import Max, Min, Q
 from django.db.models.query import QuerySet
 from django.utils import six
 from shop.money import Money
@@ -17,7 +17,8 @@ from shopit.models.cart import Cart
 from shopit.models.flag import Flag
 from shopit.models.modifier import Modifier
 from shopit.models.order import Order
-from shopit.models.product import Attribute, Product
+from shopit.models.product import Attribute, EffectiveFlag, Product
+from shopit.trees import get_tree
 
 register = template.Library()
 
@@ -102,6 +103,7 @@ def get_categorization(categorization, products=None, limit=None, level=None, de
     """
     Returns a categorization list. First argument must be categorization type.
     If `products` is passed in only return categorization appearing in the given list of products.
+    Nodes are read from a cached tree, see `shopit.trees.CategorizationNode`.
 
     {% get_categorization 'brand' products=product_list limit=3 level=1 depth=2 as brands %}
     """
@@ -109,22 +111,12 @@ def get_categorization(categorization, products=None, limit=None, level=None, de
         raise template.TemplateSyntaxError(
             "Tag `get_categorization` requires first argument to be either 'category', 'brand' or 'manufacturer'.")
 
-    filters = {}
-
+    ids = None
     if products is not None:
-        filters['id__in'] = list(set([getattr(x, '_%s_id' % categorization) for x in products]))
+        ids = set([getattr(x, '_%s_id' % categorization) for x in products])
 
-    if level is not None:
-        if depth is not None:
-            filters['level__gte'] = level
-            filters['level__lt'] = level + depth
-        else:
-            filters['level'] = level
-
-    if parent is not None:
-        filters['parent'] = parent
-
-    return getattr(categorization_models, categorization.capitalize()).objects.active().filter(**filters)[:limit]
+    tree = get_tree(getattr(categorization_models, categorization.capitalize()))
+    return tree.filter(ids=ids, level=level, depth=depth, parent=parent)[:limit]
 
 
 @register.simple_tag
@@ -143,8 +135,8 @@ def get_flags(code=None, products=None, limit=None, level=None, depth=None, pare
     flags = Flag.objects.active()
 
     if products is not None:
-        flags = flags.filter(Q(product__in=products) | Q(product__group__isnull=False, product__group__in=products))
-        flags = flags.distinct()
+        effective = EffectiveFlag.objects.filter(Q(product__in=products) | Q(product__group__in=products))
+        flags = flags.filter(id__in=effective.values('flag_id'))
 
     filters = {}
 
@@ -217,11 +209,12 @@ def get_price_steps(steps=5, products=None):
 
     if products is not None:
         queryset = queryset.filter(id__in=[x.id for x in products])
-    if not queryset:
+
+    prices = queryset.aggregate(min_price=Min('effective_price'), max_price=Max('effective_price'))
+    if prices['min_price'] is None:
         return []
 
-    queryset = queryset.order_by('_unit_price')
-    min_price, max_price = math.floor(queryset.first().unit_price), math.ceil(queryset.last().unit_price)
+    min_price, max_price = math.floor(prices['min_price']), math.ceil(prices['max_price'])
     if max_price == min_price:
         return [Money(min_price)]
 
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import threading
+
+from django.db import connection, transaction
+from django.utils.six.moves import queue
+
+from shopit.cache import bump_catalog_version
+from shopit.conf import app_settings
+
+logger = logging.getLogger(__name__)
+
+_queue = queue.Queue()
+_lock = threading.Lock()
+_worker = None
+
+
+def generate_thumbnails(ids):
+    """
+    Generates thumbnails for the given attachment ids, returns number of
+    processed attachments.
+    """
+    from filer.models import File
+    from shopit.models.product import Attachment
+
+    count = 0
+    attachments = list(Attachment.objects.filter(id__in=ids))
+    # Files are loaded polymorphic, as their real image instances.
+    files = File.objects.in_bulk(set(x.file_id for x in attachments if x.file_id))
+    for attachment in attachments:
+        if attachment.file_id in files:
+            attachment.file = files[attachment.file_id]
+        attachment.generate_thumbnails()
+        count += 1
+    if count:
+        bump_catalog_version()
+    return count
+
+
+def schedule_thumbnails(ids):
+    """
+    Generates thumbnails for the given attachment ids once the current
+    transaction is committed. When `SHOPIT_ASYNC_THUMBNAILS` is enabled
+    they're generated by a background thread, outside of the request.
+    """
+    ids = list(ids)
+    if ids:
+        transaction.on_commit(lambda: _enqueue(ids) if app_settings.ASYNC_THUMBNAILS else generate_thumbnails(ids))
+
+
+def _enqueue(ids):
+    global _worker
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_work, name='shopit-thumbnails')
+            _worker.daemon = True
+            _worker.start()
+    _queue.put(ids)
+
+
+def _work():
+    while True:
+        ids = _queue.get()
+        try:
+            generate_thumbnails(ids)
+        except Exception:
+            logger.exception('Failed generating thumbnails for attachments %s.', ids)
+        finally:
+            connection.close()
+            _queue.task_done()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.core.urlresolvers import NoReverseMatch, reverse
+from django.utils.translation import get_language
+
+from shopit.cache import LRUCache, get_categorization_version
+
+TREE_KEY = 'shopit_tree_%s_%s'
+TREE_TIMEOUT = 60 * 60 * 24
+
+local_cache = LRUCache(16)
+
+
+class CategorizationNode(object):
+    """
+    A categorization node in a cached tree. Holds translated names and
+    paths, the active flag inherited from ancestors, stored counts of
+    active products in it and it's subtree and for categories the
+    effective tax.
+    """
+    __slots__ = [
+        'id', 'parent_id', 'level', 'active', 'names', 'paths', 'product_count', 'total_product_count', 'tax_id',
+        'tax_percent', 'url_name']
+
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            setattr(self, name, kwargs.get(name, None))
+
+    def __getstate__(self):
+        return dict((x, getattr(self, x)) for x in self.__slots__)
+
+    def __setstate__(self, state):
+        for name in self.__slots__:
+            setattr(self, name, state.get(name, None))
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def name(self):
+        return self.get_translated(self.names)
+
+    def get_path(self, language=None):
+        return self.get_translated(self.paths, language)
+
+    def get_absolute_url(self, language=None):
+        try:
+            return reverse(self.url_name, args=[self.get_path(language)])
+        except NoReverseMatch:  # pragma: no cover
+            pass
+
+    def get_translated(self, values, language=None):
+        value = values.get(language or get_language(), None)
+        return value if value is not None else next(iter(values.values()), '')
+
+
+class CategorizationTree(object):
+    """
+    All nodes of a categorization model in tree order.
+    """
+
+    def __init__(self, nodes):
+        self.nodes = OrderedDict((x.id, x) for x in nodes)
+
+    @classmethod
+    def build(cls, model):
+        """
+        Builds a tree for the given categorization model in 2 queries.
+        """
+        name = model._meta.model_name
+        is_taxed = any(x.name == 'effective_tax' for x in model._meta.fields)
+        fields = ['id', 'parent_id', 'level', 'active', 'product_count', 'total_product_count']
+        if is_taxed:
+            fields += ['effective_tax', 'effective_tax__percent']
+        rows = model.objects.order_by('tree_id', 'lft').values_list(*fields)
+
+        names, paths = {}, {}
+        for master_id, language, label, path in model._parler_meta.root_model.objects.values_list(
+                'master_id', 'language_code', 'name', 'path'):
+            names.setdefault(master_id, {})[language] = label
+            paths.setdefault(master_id, {})[language] = path
+
+        nodes = OrderedDict()
+        for row in rows:
+            pk, parent_id, level, active, product_count, total_product_count = row[:6]
+            parent = nodes.get(parent_id, None)
+            tax_id, tax_percent = row[6:] if is_taxed else (None, None)
+            nodes[pk] = CategorizationNode(
+                id=pk,
+                parent_id=parent_id,
+                level=level,
+                active=active and (parent is None or parent.active),
+                names=names.get(pk, {}),
+                paths=paths.get(pk, {}),
+                product_count=product_count,
+                total_product_count=total_product_count,
+                tax_id=tax_id,
+                tax_percent=tax_percent,
+                url_name='shopit-%s-detail' % name,
+            )
+        return cls(nodes.values())
+
+    def get(self, pk):
+        return self.nodes.get(pk, None)
+
+    def get_active_ids(self):
+        return [x.id for x in self.nodes.values() if x.active]
+
+    def get_children(self, pk):
+        return [x for x in self.nodes.values() if x.parent_id == pk]
+
+    def filter(self, ids=None, level=None, depth=None, parent=None, active=True):
+        """
+        Returns a list of nodes filtered by the given arguments, in tree
+        order. `level` with `depth` returns nodes in a range of levels.
+        """
+        nodes = list(self.nodes.values())
+        if active:
+            nodes = [x for x in nodes if x.active]
+        if ids is not None:
+            ids = set(ids)
+            nodes = [x for x in nodes if x.id in ids]
+        if level is not None:
+            levels = range(level, level + depth) if depth is not None else [level]
+            nodes = [x for x in nodes if x.level in levels]
+        if parent is not None:
+            nodes = [x for x in nodes if x.parent_id == getattr(parent, 'pk', parent)]
+        return nodes
+
+
+def get_tree(model):
+    """
+    Returns a tree for the given categorization model. Trees are read from
+    a process local cache, then from the shared cache, and built when
+    missing. They're versioned by the categorization version which is
+    bumped on changes to categorizations, taxes and stored product counts.
+    """
+    key = TREE_KEY % (model._meta.model_name, get_categorization_version())
+    tree = local_cache.get(key)
+    if tree is None:
+        tree = cache.get(key)
+        if tree is None:
+            tree = CategorizationTree.build(model)
+            cache.set(key, tree, TREE_TIMEOUT)
+        local_cache.set(key, tree)
+    return tree
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import threading
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import transaction
+
+VARIANT_INDEX_KEY = 'shopit_variant_index_%s'
+
+_local = threading.local()
+
+
+def get_signature(attrs):
+    """
+    Returns a hashable signature for the given `(code, value)` pairs.
+    """
+    return tuple(sorted(attrs))
+
+
+class VariantIndex(object):
+    """
+    Lookup structure for variants of a group product. Maps signatures of
+    valid variants to their ids and keeps a set of valid variant ids for
+    every `(code, value)` pair. Invalid variant ids are kept in a list.
+    """
+
+    def __init__(self, codes):
+        self.codes = sorted(codes)
+        self.signatures = {}
+        self.postings = {}
+        self.valid = set()
+        self.invalid = []
+
+    @classmethod
+    def build(cls, group_id, codes):
+        """
+        Builds an index for the given group id in a single query. Available
+        attribute codes of the group should be passed in as `codes`.
+        """
+        from shopit.models.product import Product
+
+        index = cls(codes)
+        variants = Product.objects.filter(group_id=group_id, kind=Product.VARIANT).values_list(
+            'id', 'attribute_values__attribute__code', 'attribute_values__attribute__nullable',
+            'attribute_values__choice__value')
+        attrs = OrderedDict()
+        for pk, code, nullable, value in variants:
+            attrs.setdefault(pk, [])
+            if code is not None:
+                attrs[pk].append((code, value or '', nullable))
+        for pk in attrs:
+            index.add(pk, attrs[pk])
+        return index
+
+    def add(self, pk, attrs):
+        """
+        Adds a variant with the given list of `(code, value, nullable)`
+        tuples. Variants with codes not matching the available attributes,
+        an empty value on a required attribute or a duplicate signature are
+        marked as invalid.
+        """
+        signature = get_signature((code, value) for code, value, nullable in attrs)
+        if (signature in self.signatures or sorted(x[0] for x in attrs) != self.codes or
+                True in [not nullable and value == '' for code, value, nullable in attrs]):
+            self.invalid.append(pk)
+            return
+        self.signatures[signature] = pk
+        self.valid.add(pk)
+        for key in signature:
+            self.postings.setdefault(key, set()).add(pk)
+
+    def get(self, attrs):
+        """
+        Returns id of a valid variant with exactly the given attributes.
+        """
+        return self.signatures.get(get_signature(attrs.items()))
+
+    def filter(self, attrs):
+        """
+        Returns a set of valid variant ids containing the given attributes.
+        """
+        ids = set(self.valid)
+        for key in attrs.items():
+            ids &= self.postings.get(key, set())
+            if not ids:
+                break
+        return ids
+
+
+def get_variant_index(group):
+    """
+    Returns a variant index for the given group product, loaded from cache
+    or built and cached.
+    """
+    codes = sorted(group.get_available_attributes().values_list('code', flat=True))
+    if group.pk in get_pending_group_ids():
+        return VariantIndex.build(group.pk, codes)
+    key = VARIANT_INDEX_KEY % group.pk
+    index = cache.get(key)
+    if index is None or index.codes != codes:
+        index = VariantIndex.build(group.pk, codes)
+        cache.set(key, index, None)
+    return index
+
+
+def get_variant_indexes(group_ids):
+    """
+    Returns a dictionary of variant indexes for the given group ids. Codes
+    of available attributes are loaded for all groups in one query and
+    indexes are fetched from cache at once, missing ones are built.
+    """
+    from shopit.models.product import Product
+
+    group_ids = set(x for x in group_ids if x)
+    codes = dict((x, []) for x in group_ids)
+    through = Product.available_attributes.through.objects.filter(product_id__in=group_ids, attribute__active=True)
+    for pk, code in through.values_list('product_id', 'attribute__code'):
+        codes[pk].append(code)
+
+    pending = get_pending_group_ids()
+    cached = cache.get_many([VARIANT_INDEX_KEY % x for x in group_ids - pending])
+    indexes, missing = {}, {}
+    for pk in group_ids:
+        index = cached.get(VARIANT_INDEX_KEY % pk)
+        if index is None or index.codes != sorted(codes[pk]):
+            index = VariantIndex.build(pk, codes[pk])
+            if pk not in pending:
+                missing[VARIANT_INDEX_KEY % pk] = index
+        indexes[pk] = index
+    if missing:
+        cache.set_many(missing, None)
+    return indexes
+
+
+def invalidate_variant_index(group_ids):
+    """
+    Removes cached variant indexes for the given group ids once the current
+    transaction is committed. Removing them earlier would let a concurrent
+    request cache an index built from rows that are about to change.
+    """
+    group_ids = set(x for x in group_ids if x)
+    if group_ids:
+        pending = get_pending_group_ids()
+        pending.update(group_ids)
+
+        def commit():
+            pending.difference_update(group_ids)
+            cache.delete_many([VARIANT_INDEX_KEY % x for x in group_ids])
+
+        transaction.on_commit(commit)
+
+
+def get_pending_group_ids():
+    """
+    Returns a set of group ids invalidated in the current transaction, their
+    indexes are built without the cache until it's committed. Set is reset
+    outside of a transaction, ids left by a rolled back one are dropped.
+    """
+    if getattr(_local, 'pending', None) is None or not transaction.get_connection().in_atomic_block:
+        _local.pending = set()
+    return _local.pending
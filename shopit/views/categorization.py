@@ -3,7 +3,6 @@ from __future__ import absolute_import, unicode_literals
 
 from django.core.exceptions import ImproperlyConfigured
 from django.core.urlresolvers import reverse
-from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.utils.translation import ugettext_lazy as _
 from parler.views import ViewUrlMixin
@@ -13,7 +12,7 @@ from rest_framework.settings import api_settings
 from shopit.models.categorization import Brand, Category, Manufacturer
 from shopit.rest.renderers import ModifiedCMSPageRenderer
 from shopit.serializers import BrandSerializer, CategorySerializer, ManufacturerSerializer
-from shopit.views.product import ProductListView
+from shopit.views.product import ProductListView, ResponseCacheMixin
 
 
 class CategorizationViewMixin(object):
@@ -33,7 +32,7 @@ class CategorizationViewMixin(object):
             self.categorization_model_name = self.categorization_model._meta.model.__name__.lower()
 
 
-class CategorizationListViewBase(CategorizationViewMixin, ListAPIView):
+class CategorizationListViewBase(CategorizationViewMixin, ResponseCacheMixin, ListAPIView):
     """
     Base categorization list view.
     """
@@ -44,6 +43,9 @@ class CategorizationListViewBase(CategorizationViewMixin, ListAPIView):
     def get_queryset(self):
         return self.categorization_model.objects.active()
 
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(request, super(CategorizationListViewBase, self).list, *args, **kwargs)
+
     def get_template_names(self):
         return ['shopit/catalog/%s_list.html' % self.categorization_model_name, self.template_name]
 
@@ -94,9 +96,7 @@ class CategorizationDetailViewBase(CategorizationViewMixin, ViewUrlMixin, Produc
 
     def get_queryset(self):
         queryset = super(CategorizationDetailViewBase, self).get_queryset()
-        categorization = self.get_categorization_object()
-        ids = categorization.get_descendants(include_self=True).values_list('pk', flat=True)
-        return queryset.filter(**{'_%s_id__in' % self.categorization_model_name: ids})
+        return queryset.in_subtree(self.get_categorization_object())
 
     def get_template_names(self):
         return ['shopit/catalog/%s_detail.html' % self.categorization_model_name, self.template_name]
@@ -108,12 +108,8 @@ class CategorizationDetailViewBase(CategorizationViewMixin, ViewUrlMixin, Produc
 
     def get_categorization_object(self):
         if not hasattr(self, '_categorization_object'):
-            path = self.kwargs['path']
-            slug = path.split('/').pop()
-            queryset = self.categorization_model.objects.translated(slug=slug)
+            queryset = self.categorization_model.objects.translated(path=self.kwargs['path'])
             categorization = get_object_or_404(queryset)
-            if categorization.get_path() != path:
-                raise Http404
             setattr(self, '_categorization_object', categorization)
         return getattr(self, '_categorization_object')
 
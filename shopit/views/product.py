@@ -15,9 +15,13 @@ from shop.views.catalog import AddToCartView as AddToCartViewBase
 from shop.views.catalog import ProductListView as BaseProductListView
 from shop.views.catalog import ProductRetrieveView
 
+from shopit.availability import get_products_availability
+from shopit.cache import get_cached_response, get_response_cache_key, merge_deferred_values, set_cached_response
 from shopit.conf import app_settings
 from shopit.models.cart import Cart, CartItem
 from shopit.models.product import Attribute, Product
+from shopit.planner import plan_products
+from shopit.rest.pagination import ProductCursorPagination
 from shopit.rest.renderers import ModifiedCMSPageRenderer
 from shopit.serializers import (AddToCartSerializer, CartItemSerializer, ProductDetailSerializer,
                                 ProductSummarySerializer, ReviewSerializer, WatchItemSerializer)
@@ -30,11 +34,48 @@ MODIFIERS_VAR = 'd'
 PRICE_FROM_VAR = 'pf'
 PRICE_TO_VAR = 'pt'
 SORT_VAR = 's'
+SEARCH_VAR = 'q'
+CURSOR_VAR = 'cursor'
 
 
-class ProductListView(BaseProductListView):
+class ResponseCacheMixin(object):
+    """
+    Mixin that caches response data when `RESPONSE_CACHE` is enabled. Data
+    is cached per catalog version, availability is deferred when serializing
+    and calculated for every request.
+    """
+    cache_list_params = []
+
+    def get_serializer_context(self):
+        context = super(ResponseCacheMixin, self).get_serializer_context()
+        if getattr(self, '_deferred_availability', None) is not None:
+            context['deferred_availability'] = self._deferred_availability
+        return context
+
+    def get_cached_response(self, request, func, *args, **kwargs):
+        if not app_settings.RESPONSE_CACHE or request.accepted_renderer.format == 'html':
+            return func(request, *args, **kwargs)
+
+        key = get_response_cache_key(request, self.cache_list_params)
+        cached = get_cached_response(key)
+        if cached is None:
+            self._deferred_availability = []
+            response = func(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            cached = response.data, self._deferred_availability
+            set_cached_response(key, *cached)
+
+        data, ids = cached
+        availability = get_products_availability(Product.objects.filter(id__in=set(ids)), request)
+        available = [availability.get(x, None) for x in ids]
+        return Response(merge_deferred_values(data, available))
+
+
+class ProductListView(ResponseCacheMixin, BaseProductListView):
     serializer_class = ProductSummarySerializer
     renderer_classes = [ModifiedCMSPageRenderer] + api_settings.DEFAULT_RENDERER_CLASSES
+    cache_list_params = [CATEGORIES_VAR, BRANDS_VAR, MANUFACTURERS_VAR, FLAGS_VAR, MODIFIERS_VAR, 'fields', 'include']
 
     def get(self, request, *args, **kwargs):
         """
@@ -46,17 +87,27 @@ class ProductListView(BaseProductListView):
         return super(ProductListView, self).get(request, *args, **kwargs)
 
     def list(self, request, *args, **kwargs):
+        return self.get_cached_response(request, self.get_list_response, *args, **kwargs)
+
+    def get_list_response(self, request, *args, **kwargs):
         """
-        Return all products count when `count` exists in GET, applicable
+        Return all products count when `get_count` exists in GET, or counts
+        for every filter option when `get_facets` exists in GET. Applicable
         only when format is not html.
         """
         if request.GET.get('get_count', None) and request.accepted_renderer.format != 'html':
             count = self.filter_queryset(self.get_queryset()).count()
             return Response({'count': count})
+        if request.GET.get('get_facets', None) and request.accepted_renderer.format != 'html':
+            return Response(self.filter_queryset(self.get_queryset()).get_facet_counts())
         return super(ProductListView, self).list(request, *args, **kwargs)
 
     def get_queryset(self):
-        return Product.objects.translated().active().top_level()
+        """
+        Select related objects needed for the requested serializer fields.
+        """
+        queryset = Product.objects.translated().active().top_level()
+        return plan_products(queryset, self.get_serializer().fields.keys())
 
     def filter_queryset(self, queryset):
         queryset = super(ProductListView, self).filter_queryset(queryset)
@@ -64,13 +115,8 @@ class ProductListView(BaseProductListView):
         categories = list(filter(None, self.request.GET.get(CATEGORIES_VAR, '').split(','))) or None
         brands = list(filter(None, self.request.GET.get(BRANDS_VAR, '').split(','))) or None
         manufacturers = list(filter(None, self.request.GET.get(MANUFACTURERS_VAR, '').split(','))) or None
-        queryset = queryset.filter_categorization(categories, brands, manufacturers)
-
         flags = list(filter(None, self.request.GET.get(FLAGS_VAR, '').split(','))) or None
-        queryset = queryset.filter_flags(flags)
-
         modifiers = list(filter(None, self.request.GET.get(MODIFIERS_VAR, '').split(','))) or None
-        queryset = queryset.filter_modifiers(modifiers)
 
         attrs = Attribute.objects.active()
         attr_codes = attrs.values_list('code', flat=True)
@@ -81,26 +127,45 @@ class ProductListView(BaseProductListView):
             if not attrs.get(code=f[0]).nullable:
                 attr_filters.remove(f)
 
-        queryset = queryset.filter_attributes(attr_filters)
-
         price_from = self.request.GET.get(PRICE_FROM_VAR, None)
         price_to = self.request.GET.get(PRICE_TO_VAR, None)
-        queryset = queryset.filter_price(price_from, price_to)
 
-        sort = self.request.GET.get(SORT_VAR, None)
-        if not sort and app_settings.DEFAULT_PRODUCT_ORDER:
-            sort = app_settings.DEFAULT_PRODUCT_ORDER
+        queryset = queryset.filter_facets(
+            categories, brands, manufacturers, flags, modifiers, attr_filters, price_from, price_to)
+
+        query = self.request.GET.get(SEARCH_VAR, '').strip()
+        if query:
+            queryset = queryset.search(query)
+            if not self.request.GET.get(SORT_VAR, None):
+                return queryset.order_by('-search_rank', '-order')
+
+        sort = self.get_sort()
         sort_map = {
             'name': 'translations__name',
             '-name': '-translations__name',
-            'price': '_unit_price',
-            '-price': '-_unit_price',
+            'price': 'effective_price',
+            '-price': '-effective_price',
         }
         if sort in sort_map:
             queryset = queryset.order_by(sort_map[sort])
 
         return queryset
 
+    def get_sort(self):
+        sort = self.request.GET.get(SORT_VAR, None)
+        if not sort and app_settings.DEFAULT_PRODUCT_ORDER:
+            sort = app_settings.DEFAULT_PRODUCT_ORDER
+        return sort
+
+    @property
+    def paginator(self):
+        """
+        Use keyset pagination when `cursor` exists in GET.
+        """
+        if not hasattr(self, '_paginator') and CURSOR_VAR in self.request.GET:
+            self._paginator = ProductCursorPagination()
+        return super(ProductListView, self).paginator
+
     def get_template_names(self):
         return ['shopit/catalog/product_list.html']
 
@@ -119,9 +184,10 @@ class ProductListView(BaseProductListView):
         return context
 
 
-class ProductDetailView(ViewUrlMixin, ProductRetrieveView):
+class ProductDetailView(ResponseCacheMixin, ViewUrlMixin, ProductRetrieveView):
     serializer_class = ProductDetailSerializer
     renderer_classes = [ModifiedCMSPageRenderer] + api_settings.DEFAULT_RENDERER_CLASSES
+    cache_list_params = ['fields', 'include']
 
     def get(self, request, *args, **kwargs):
         response = super(ProductDetailView, self).get(request, *args, **kwargs)
@@ -133,6 +199,9 @@ class ProductDetailView(ViewUrlMixin, ProductRetrieveView):
             menu.add_sideframe_item(_('Delete Product'), url=reverse('admin:shopit_product_delete', args=[product_id]))
         return response
 
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(request, super(ProductDetailView, self).retrieve, *args, **kwargs)
+
     def get_object(self):
         if not hasattr(self, '_product'):
             self._product = get_object_or_404(Product.objects.translated(slug=self.kwargs['slug']))
@@ -255,7 +324,7 @@ class AddToCartView(AddToCartViewBase):
             errors['variant'] = [_("You can't add a group product to the cart.")]
         else:
             total_quantity = getattr(product.is_in_cart(cart), 'quantity', 0) + quantity
-            available, diff = product.is_available(total_quantity)
+            available, diff = product.reserve(total_quantity, request)
             if available:
                 item, created = CartItem.objects.get_or_create(
                     cart=cart, product=product, quantity=quantity, product_code=product.product_code)
@@ -2,6 +2,8 @@
 from __future__ import absolute_import, unicode_literals
 
 from django.contrib import messages
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import transaction
 from django.http import HttpResponseBadRequest, JsonResponse
 from django.shortcuts import redirect
 from django.utils.decorators import method_decorator
@@ -102,11 +104,14 @@ class CartView(CartObjectMixin, FormView):
             item, quantity = int(item.split('-').pop()), int(quantity)
             item = CartItem.objects.get(pk=item)
             if quantity > 0:
-                available, diff = item.product.is_available(quantity)
-                if available:
-                    item.quantity = quantity
-                else:
-                    item.quantity = quantity + diff
+                available, diff = item.product.reserve(quantity, request)
+                if not available:
+                    # Lower the quantity to what's left, remove the item when nothing is.
+                    quantity = max(quantity + diff, 0)
+                    if quantity > 0:
+                        item.product.reserve(quantity, request)
+            if quantity > 0:
+                item.quantity = quantity
                 item.save()
             else:
                 item.delete()
@@ -145,10 +150,22 @@ class CheckoutView(CartObjectMixin, FormView):
             if modifier.is_active(self.cart):
                 payment_provider = getattr(modifier, 'payment_provider', None)
                 if payment_provider:
-                    expression = payment_provider.get_payment_request(self.cart, self.request)
-                    return JsonResponse({'expression': expression})
+                    return self.get_payment_response(payment_provider, forms['payment_form'])
         return HttpResponseBadRequest()
 
+    def get_payment_response(self, payment_provider, payment_form):
+        """
+        Creates the order through the payment provider in a transaction, so
+        that stock taken for items is given back when one of them is out of
+        stock. Errors are returned the same way as form errors.
+        """
+        try:
+            with transaction.atomic():
+                expression = payment_provider.get_payment_request(self.cart, self.request)
+        except ValidationError as e:
+            return JsonResponse({'%s-%s' % (payment_form.prefix, NON_FIELD_ERRORS): e.messages}, status=400)
+        return JsonResponse({'expression': expression})
+
     def forms_invalid(self, **forms):
         self.cart.save()
         errors = dict([('%s-%s' % (x.prefix, y[0]), y[1]) for x in forms.values() for y in x.errors.items()])